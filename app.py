@@ -3,10 +3,12 @@ from flask import render_template
 from app import create_app, socketio
 from app.extensions import db
 
-app = create_app()
+# 批量入库的解析子进程（spawn）会以 __mp_main__ 重新导入本文件，子进程中不创建应用
+if __name__ != '__mp_main__':
+    app = create_app()
 
-with app.app_context():
-    db.create_all()
+    with app.app_context():
+        db.create_all()
 
 if __name__ == '__main__':
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
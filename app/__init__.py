@@ -1,7 +1,7 @@
 # backend/__init__.py
 from flask import Flask
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 from .extensions import db, migrate
 from .config import Config
 
@@ -48,6 +48,15 @@ def create_app(config_class=Config):
     app.register_blueprint(ollama_model_bp)
     app.register_blueprint(permission_bp)
 
+    # 初始化文档入库后台任务
+    from .services.IngestionService import IngestionService
+    IngestionService.init_app(app, socketio)
+
+    # 开启重排序时提前在后台加载 cross-encoder，避免首个请求等待
+    if config_class.RERANK_ENABLED:
+        from .utils.Reranker import reranker
+        reranker.warmup()
+
     return app
 
 socketio = SocketIO(async_mode='threading', cors_allowed_origins="*")
@@ -60,6 +69,19 @@ def handle_connect():
 def handle_disconnect(data=None):  # 添加可选参数
     print(f'客户端断开连接，数据: {data}')
 
+@socketio.on('subscribe')
+def handle_subscribe(data=None):
+    """客户端携带 token 订阅自己的后台任务进度（加入 user_{id} 房间）"""
+    from .utils.JwtUtil import verify_jwt
+    token = (data or {}).get('token', '')
+    if token.startswith('Bearer '):
+        token = token.split(' ', 1)[1].strip()
+    payload = verify_jwt(token) if token else {'error': 'Missing token'}
+    if 'error' in payload:
+        return {'success': False, 'message': payload['error']}
+    join_room(f"user_{payload['id']}")
+    return {'success': True}
+
 # 添加错误处理
 @socketio.on_error_default
 def default_error_handler(e):
@@ -38,10 +38,66 @@ class Config:
     algorithm = os.getenv("ALGORITHM", "HS256")
     access_token_expire_minutes = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 1440))
 
+    # Redis 配置
+    REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+    REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+    REDIS_DB = int(os.getenv("REDIS_DB", 0))
+
+    # 路由授权索引的最长使用时间（秒）；权限变更通过 Redis 发布订阅即时通知，该值只在通知丢失时兜底
+    AUTH_INDEX_TTL = float(os.getenv("AUTH_INDEX_TTL", 300))
+    # 已验证令牌缓存：最多缓存的令牌数（0 表示关闭）与单个条目的最长保留时间（秒，不超过令牌 exp）
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000))
+    AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", 300))
+
+    # 密码哈希：bcrypt cost（调整后旧哈希在用户下次登录时重新计算）、专用线程数与排队上限
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16))
+    # 登录准入：时间窗口（秒）内每个账号、每个 IP 的最大登录尝试次数（<=0 表示不限制）
+    LOGIN_RATE_WINDOW = int(os.getenv("LOGIN_RATE_WINDOW", 60))
+    LOGIN_MAX_PER_ACCOUNT = int(os.getenv("LOGIN_MAX_PER_ACCOUNT", 10))
+    LOGIN_MAX_PER_IP = int(os.getenv("LOGIN_MAX_PER_IP", 30))
+
+    # 模型目录缓存（公开模型配置、Ollama 模型列表）：Redis 中的过期时间（秒），写操作后按版本号失效
+    CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() == "true"
+    CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", 600))
+
     # 嵌入模型配置
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-v3")
     EMBEDDING_BASE_URL = os.getenv("EMBEDDING_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
     EMBEDDING_API_KEY = os.getenv("EMBEDDING_API_KEY", "sk-1d8575bdb4ab4b64abde2da910ef578b")
+    # 单次 embeddings 请求的最大条数与估算 token 上限（DashScope text-embedding-v3 单批最多 10 条）
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 10))
+    EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 8192))
+    # 异步嵌入的并发批次数与 429/5xx 重试次数
+    EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 3))
+    # 嵌入缓存：内存 LRU 层按字节上限淘汰，Redis 层按 TTL 过期（Redis 侧配合 maxmemory-policy 做容量淘汰）
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_MEMORY_BYTES = int(os.getenv("EMBEDDING_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+    EMBEDDING_CACHE_REDIS_ENABLED = os.getenv("EMBEDDING_CACHE_REDIS_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_REDIS_TTL = int(os.getenv("EMBEDDING_CACHE_REDIS_TTL", 7 * 24 * 3600))
+
+    # 对话历史缓存：Redis 中每个对话保留的最近消息条数与过期时间（秒）
+    CHAT_HISTORY_CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE", 100))
+    CHAT_HISTORY_CACHE_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL", 24 * 3600))
+
+    # 对话上下文 token 预算：context_window 减去为回答预留的 num_output，检索片段最多占剩余预算的比例
+    CHAT_CONTEXT_WINDOW = int(os.getenv("CHAT_CONTEXT_WINDOW", 8192))
+    CHAT_NUM_OUTPUT = int(os.getenv("CHAT_NUM_OUTPUT", 1024))
+    CHAT_CONTEXT_RATIO = float(os.getenv("CHAT_CONTEXT_RATIO", 0.5))
+    CHAT_TOKEN_COUNTER = os.getenv("CHAT_TOKEN_COUNTER", "tiktoken")  # tiktoken 或 estimate
+
+    # 模型实例缓存配置（TransUtil.ModelRegistry）
+    MODEL_REGISTRY_MAX_SIZE = int(os.getenv("MODEL_REGISTRY_MAX_SIZE", 64))
+    MODEL_REGISTRY_TTL = float(os.getenv("MODEL_REGISTRY_TTL", 60))  # 超过该秒数后校验一次 update_at
+
+    # 本地 HuggingFace 模型常驻内存预算（MB），超出后按 LRU 淘汰空闲模型
+    LOCAL_MODEL_MEMORY_BUDGET_MB = int(os.getenv("LOCAL_MODEL_MEMORY_BUDGET_MB", 16 * 1024))
+    # 本地模型批量生成：收集窗口（毫秒）、单批最大请求数、每个模型的排队上限
+    LOCAL_GEN_BATCH_WINDOW_MS = float(os.getenv("LOCAL_GEN_BATCH_WINDOW_MS", 20))
+    LOCAL_GEN_MAX_BATCH = int(os.getenv("LOCAL_GEN_MAX_BATCH", 8))
+    LOCAL_GEN_MAX_QUEUE = int(os.getenv("LOCAL_GEN_MAX_QUEUE", 64))
 
     # ChromaDB 配置
     CHROMA_SERVER_HOST = "localhost"  # 如果使用 Docker 改为 "host.docker.internal"
@@ -49,6 +105,48 @@ class Config:
 
     # 添加 API 路径配置
     CHROMA_API_PATH = "/api/v1"  # 新版本 ChromaDB 使用 /api/v1
+    # 客户端健康检查间隔（秒），<=0 表示关闭后台检查
+    CHROMA_HEALTH_CHECK_INTERVAL = float(os.getenv("CHROMA_HEALTH_CHECK_INTERVAL", 30))
+
+    # 检索后端：chroma 直接查询 ChromaDB；local 使用本地 NumPy 索引（首次检索时从 ChromaDB 构建，失败时回退 ChromaDB）
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+    LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", os.path.join("data", "vector_index"))
+    LOCAL_VECTOR_MAX_ITEMS = int(os.getenv("LOCAL_VECTOR_MAX_ITEMS", 100000))  # 超过该条数的集合不建本地索引
+    LOCAL_VECTOR_ANN_THRESHOLD = int(os.getenv("LOCAL_VECTOR_ANN_THRESHOLD", 20000))  # 达到该条数改用 HNSW，<=0 关闭
+
+    # 检索模式：dense 仅向量检索；lexical 仅 BM25；hybrid 两路结果按倒数排名融合（RRF）
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+    RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", 60))
+    LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join("data", "lexical_index"))
+
+    # 对话检索重排序：先多取 RERANK_CANDIDATES 条，用本地 cross-encoder 重排后保留 RERANK_TOP_N 条
+    # 打分超过 RERANK_TIME_BUDGET_MS 时回退向量检索顺序
+    RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "BAAI/bge-reranker-base")
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 50))
+    RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", 5))
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))
+    RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 512))
+    RERANK_TIME_BUDGET_MS = int(os.getenv("RERANK_TIME_BUDGET_MS", 300))
+
+    # 上传文件大小上限（MB）；PDF、docx、纯文本按页/按块流式解析入库，内存占用与文件大小无关
+    MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", 512))
+
+    # 入库去重：内容相同的文件不重复入库；同一向量库中同名文件重新上传时只嵌入变化的分块
+    INGEST_DEDUP_ENABLED = os.getenv("INGEST_DEDUP_ENABLED", "true").lower() == "true"
+
+    # 文档入库后台任务线程数
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+    # 启动时恢复未完成的任务：重新入队 pending 任务和租约已过期的 running 任务（默认关闭）
+    INGESTION_RECOVER_ON_STARTUP = os.getenv("INGESTION_RECOVER_ON_STARTUP", "false").lower() == "true"
+    # 入库租约（秒）：执行中的任务和入库中的文档定期续约，超过该时间未续约视为所在进程已退出
+    INGESTION_LEASE_SECONDS = int(os.getenv("INGESTION_LEASE_SECONDS", 300))
+    # 批量入库：解析进程数、单次提交的最大文件数、压缩包解压后的总大小上限（MB）
+    INGESTION_PARSE_PROCESSES = int(os.getenv("INGESTION_PARSE_PROCESSES", max(1, min(4, (os.cpu_count() or 2) - 1))))
+    BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", 5000))
+    BULK_MAX_TOTAL_MB = int(os.getenv("BULK_MAX_TOTAL_MB", 2048))
+    # 批量入库：超过该大小（MB）的文件不进解析进程池（整文件节点需在进程间传递），改走流式逐个入库
+    BULK_PARSE_MAX_FILE_MB = int(os.getenv("BULK_PARSE_MAX_FILE_MB", 16))
 
     # 获取项目根目录 (Flask应用的上层目录)
     PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
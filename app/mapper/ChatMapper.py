@@ -1,12 +1,50 @@
+import json
+import logging
+from datetime import datetime
+
+import redis
+
+from app.config import Config
 from app.utils.Redis import ConversationStore
-from typing import Dict
+from typing import Dict, List, Optional
 from app.models.conversation import Conversation
 from app.models.message import Message
 from app.extensions import db
+from sqlalchemy import and_, func, or_
+
+logger = logging.getLogger("ChatMapper")
+
+# 原地改写缓存的对话信息中的 update_at（保留剩余过期时间），缓存不存在时不创建
+TOUCH_INFO_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local info = cjson.decode(raw)
+info['update_at'] = ARGV[1]
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    redis.call('SET', KEYS[1], cjson.encode(info), 'PX', ttl)
+else
+    redis.call('SET', KEYS[1], cjson.encode(info))
+end
+return 1
+"""
+
 
 class ChatMapper:
+    """
+    对话与消息的读写
+    Redis 列表 chat:{id} 是消息表的写穿缓存：按时间正序保存最近 CHAT_HISTORY_CACHE_SIZE 条 JSON 消息。
+    列表只在从 MySQL 预热时创建，之后 save_message 用 RPUSHX 追加，因此列表存在时一定是最近消息的完整后缀。
+    版本号 chat:{id}:version 在每次追加时递增：预热先 WATCH 版本号再查库，查库期间有新消息提交则放弃写入，
+    避免新消息的 RPUSHX 落在预热之前（列表尚不存在）而从重建的列表中丢失。
+    """
     redis_client = ConversationStore().get_redis_client()
     prefix = "chat:"  # 键前缀，用于区分不同类型的数据
+    info_suffix = ":info"
+    version_suffix = ":version"
+    touch_info_script = redis_client.register_script(TOUCH_INFO_SCRIPT)
 
     @staticmethod
     def create_conversation(user_id: int, name: str, model_config_id: int, chat_history: int = 10, type: int = 0) -> int:
@@ -34,6 +72,81 @@ class ChatMapper:
     def _format_key(conversation_id: int) -> str:
         """格式化对话键"""
         return f"{ChatMapper.prefix}{conversation_id}"
+
+    @staticmethod
+    def _format_version_key(conversation_id: int) -> str:
+        """格式化对话缓存版本号键"""
+        return f"{ChatMapper.prefix}{conversation_id}{ChatMapper.version_suffix}"
+
+    @staticmethod
+    def _format_info_key(conversation_id: int) -> str:
+        """格式化对话信息缓存键"""
+        return f"{ChatMapper.prefix}{conversation_id}{ChatMapper.info_suffix}"
+
+    @staticmethod
+    def _message_to_dict(message: Message) -> dict:
+        return {
+            "role": message.role,
+            "content": message.content,
+            "create_at": message.create_at.isoformat() if message.create_at else None
+        }
+
+    @staticmethod
+    def _cached_history(conversation_id: int, length: int) -> Optional[List[dict]]:
+        """
+        从 Redis 读取最近 length 条消息（时间正序），未命中返回 None
+        """
+        if length > Config.CHAT_HISTORY_CACHE_SIZE:
+            return None
+        key = ChatMapper._format_key(conversation_id)
+        try:
+            items = ChatMapper.redis_client.lrange(key, -length, -1)
+        except redis.RedisError as e:
+            logger.warning(f"读取对话 {conversation_id} 的缓存失败: {str(e)}")
+            return None
+        if not items:
+            return None
+        try:
+            return [json.loads(item) for item in items]
+        except ValueError:
+            # 旧版本写入的是 Python repr，视为未命中并重新预热
+            return None
+
+    @staticmethod
+    def _warm_history(conversation_id: int) -> List[dict]:
+        """从 MySQL 读取最近的消息写入 Redis，返回这些消息（时间正序）"""
+        key = ChatMapper._format_key(conversation_id)
+        recent = None
+        try:
+            with ChatMapper.redis_client.pipeline() as pipe:
+                # 查库前 WATCH 版本号：查库到写入之间有消息保存（版本号递增）时 EXEC 失败，本次不写缓存
+                pipe.watch(ChatMapper._format_version_key(conversation_id))
+                # 结束当前读事务（REPEATABLE READ 快照可能早于 WATCH），保证查到 WATCH 之前提交的消息
+                db.session.commit()
+                recent = ChatMapper._recent_messages(conversation_id)
+                pipe.multi()
+                pipe.delete(key)
+                if recent:
+                    pipe.rpush(key, *[json.dumps(ChatMapper._message_to_dict(m), ensure_ascii=False)
+                                      for m in reversed(recent)])
+                    pipe.expire(key, Config.CHAT_HISTORY_CACHE_TTL)
+                pipe.execute()
+        except redis.WatchError:
+            logger.info(f"预热对话 {conversation_id} 期间有新消息写入，跳过本次缓存")
+        except redis.RedisError as e:
+            logger.warning(f"预热对话 {conversation_id} 的缓存失败: {str(e)}")
+        if recent is None:
+            recent = ChatMapper._recent_messages(conversation_id)
+        return [ChatMapper._message_to_dict(m) for m in reversed(recent)]
+
+    @staticmethod
+    def _recent_messages(conversation_id: int) -> List[Message]:
+        # create_at 只精确到秒，同一秒内的消息按 id 排序，与分页列表的 (create_at, id) 顺序一致
+        return Message.query.filter_by(conversation_id=conversation_id) \
+            .order_by(Message.create_at.desc(), Message.id.desc()) \
+            .limit(Config.CHAT_HISTORY_CACHE_SIZE) \
+            .all()
+
     @staticmethod
     def save_message(conversation_id: int, role: str, content: str) -> dict:
         """
@@ -50,10 +163,32 @@ class ChatMapper:
             # 保存到数据库中
             message_db = Message(conversation_id=conversation_id, role=role, content=content)
             db.session.add(message_db)
+            # 同一事务中刷新对话的 update_at，对话列表按最近消息排序
+            Conversation.query.filter_by(id=conversation_id).update(
+                {Conversation.update_at: func.now()}, synchronize_session=False)
             db.session.commit()
             db.session.refresh(message_db)
-            # 保存到redis中
-            ChatMapper.redis_client.rpush(key, str(message))
+            # 追加到 redis 缓存：列表不存在时不创建，等下次读取时从数据库预热
+            message["create_at"] = message_db.create_at.isoformat() if message_db.create_at else None
+            info_key = ChatMapper._format_info_key(conversation_id)
+            try:
+                # 版本号与追加在同一事务中：正在预热的请求会因版本号变化放弃写入
+                pipe = ChatMapper.redis_client.pipeline()
+                version_key = ChatMapper._format_version_key(conversation_id)
+                pipe.incr(version_key)
+                pipe.expire(version_key, Config.CHAT_HISTORY_CACHE_TTL)
+                pipe.rpushx(key, json.dumps(message, ensure_ascii=False))
+                pipe.ltrim(key, -Config.CHAT_HISTORY_CACHE_SIZE, -1)
+                pipe.expire(key, Config.CHAT_HISTORY_CACHE_TTL)
+                # 对话信息缓存原地更新 update_at（取消息的创建时间），不删除，随后的读取仍可命中
+                if message["create_at"]:
+                    ChatMapper.touch_info_script(keys=[info_key], args=[message["create_at"]], client=pipe)
+                else:
+                    pipe.delete(info_key)
+                pipe.execute()
+            except redis.RedisError as e:
+                logger.warning(f"写入对话 {conversation_id} 的缓存失败，删除缓存: {str(e)}")
+                ChatMapper._drop_cache(key, info_key)
             return {
                 "role": message_db.role,
                 "content": message_db.content
@@ -63,6 +198,13 @@ class ChatMapper:
             print(f"消息添加失败: {e}")
             raise Exception({"code": 500, "msg": "保存消息失败" + str(e)})
     @staticmethod
+    def _drop_cache(*keys) -> None:
+        try:
+            ChatMapper.redis_client.delete(*keys)
+        except redis.RedisError as e:
+            logger.warning(f"删除缓存 {keys} 失败: {str(e)}")
+
+    @staticmethod
     def get_conversation_id(user_id: int) -> list:
         """
         根据用户 id 查询对话
@@ -81,6 +223,100 @@ class ChatMapper:
         except Exception as e:
             raise Exception({"code":500, "msg":"查询错误！获取用户对话失败"+str(e)})
     @staticmethod
+    def _conversation_to_dict(info: Conversation) -> dict:
+        return {
+            "id": info.id,
+            "name": info.name,
+            "model_config_id": info.model_config_id,
+            "chat_history": info.chat_history,
+            "update_at": info.update_at.isoformat() if info.update_at else None,
+            "type": info.type,
+        }
+
+    @staticmethod
+    def _history_to_dict(messages: List[dict]) -> dict:
+        if not messages:
+            return {
+                "messages": [],
+                "message": "该对话暂无历史消息"
+            }
+        return {
+            "messages": messages,
+            "count": len(messages)
+        }
+
+    @staticmethod
+    def encode_cursor(conversation: dict) -> str:
+        """游标：最后一条对话的 (update_at, id)"""
+        return f"{conversation['update_at']}_{conversation['id']}"
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        update_at, _, conversation_id = cursor.rpartition("_")
+        return datetime.fromisoformat(update_at), int(conversation_id)
+
+    @staticmethod
+    def get_conversation_page(user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None,
+                              message_count: int = 10) -> dict:
+        """
+        分页获取用户的对话及每个对话最新的 message_count 条消息
+        按 (update_at, id) 倒序做游标分页，共两次查询：对话一页 + 窗口函数取各对话的最新消息
+        :param limit: 每页数量，None 表示不分页
+        :param cursor: 上一页返回的 next_cursor
+        :return: {"items": [...], "next_cursor": str | None, "has_more": bool}
+        """
+        try:
+            query = Conversation.query.filter(Conversation.user_id == user_id)
+            if cursor:
+                update_at, last_id = ChatMapper.decode_cursor(cursor)
+                query = query.filter(or_(
+                    Conversation.update_at < update_at,
+                    and_(Conversation.update_at == update_at, Conversation.id < last_id)
+                ))
+            query = query.order_by(Conversation.update_at.desc(), Conversation.id.desc())
+            if limit:
+                query = query.limit(limit + 1)
+            conversations = query.all()
+            has_more = bool(limit) and len(conversations) > limit
+            conversations = conversations[:limit] if limit else conversations
+
+            histories = {conversation.id: [] for conversation in conversations}
+            if histories and message_count > 0:
+                row_number = func.row_number().over(
+                    partition_by=Message.conversation_id,
+                    order_by=(Message.create_at.desc(), Message.id.desc())
+                ).label("rn")
+                ranked = db.session.query(Message.conversation_id, Message.role, Message.content,
+                                          Message.create_at, row_number) \
+                    .filter(Message.conversation_id.in_(list(histories))) \
+                    .subquery()
+                rows = db.session.query(ranked) \
+                    .filter(ranked.c.rn <= message_count) \
+                    .order_by(ranked.c.conversation_id, ranked.c.rn) \
+                    .all()
+                for row in rows:
+                    histories[row.conversation_id].append({
+                        "role": row.role,
+                        "content": row.content,
+                        "create_at": row.create_at.isoformat() if row.create_at else None
+                    })
+
+            items = [{
+                "conversation_info": ChatMapper._conversation_to_dict(conversation),
+                "history": ChatMapper._history_to_dict(histories[conversation.id])
+            } for conversation in conversations]
+            next_cursor = ChatMapper.encode_cursor(items[-1]["conversation_info"]) if has_more else None
+            return {
+                "items": items,
+                "next_cursor": next_cursor,
+                "has_more": has_more
+            }
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception({"code": 500, "msg": "查询错误！获取用户对话失败" + str(e)})
+
+    @staticmethod
     def get_conversation(conversation_id: int, length: int | None = None) -> dict:
         """
         获取对话历史
@@ -106,18 +342,24 @@ class ChatMapper:
         :param conversation_id: 对话 id
         :return: 返回该对话的信息
         """
+        info_key = ChatMapper._format_info_key(conversation_id)
+        try:
+            cached = ChatMapper.redis_client.get(info_key)
+            if cached:
+                return json.loads(cached)
+        except (redis.RedisError, ValueError) as e:
+            logger.warning(f"读取对话 {conversation_id} 的信息缓存失败: {str(e)}")
         try:
             info = Conversation.query.get(conversation_id)
-            return {
-                "id":info.id,
-                "name": info.name,
-                "model_config_id": info.model_config_id,
-                "chat_history": info.chat_history,
-                "update_at": info.update_at.isoformat() if info.update_at else None,
-                "type": info.type,
-            }
+            conversation_info = ChatMapper._conversation_to_dict(info)
         except Exception as e:
             raise Exception({"code":500, "msg":"获取对话信息失败！"+str(e)})
+        try:
+            ChatMapper.redis_client.set(info_key, json.dumps(conversation_info, ensure_ascii=False),
+                                        ex=Config.CHAT_HISTORY_CACHE_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"写入对话 {conversation_id} 的信息缓存失败: {str(e)}")
+        return conversation_info
 
     @staticmethod
     def get_all_history(conversation_id: int):
@@ -161,33 +403,20 @@ class ChatMapper:
         :return: 返回历史记录的列表
         """
         try:
-            # 获取最新的前10条消息
-            history = Message.query.filter_by(conversation_id=conversation_id)\
-                .order_by(Message.create_at.desc())\
-                .limit(length)\
-                .all()
-
-            # 处理空结果
-            if not history:
-                return {
-                    "messages": [],
-                    "message": "该对话暂无历史消息"
-                }
+            # 优先读 Redis 缓存，未命中时从数据库预热；超出缓存容量的长度直接查数据库
+            messages = ChatMapper._cached_history(conversation_id, length)
+            if messages is None and length <= Config.CHAT_HISTORY_CACHE_SIZE:
+                messages = ChatMapper._warm_history(conversation_id)[-length:]
+            if messages is None:
+                history = Message.query.filter_by(conversation_id=conversation_id)\
+                    .order_by(Message.create_at.desc())\
+                    .limit(length)\
+                    .all()
+                messages = [ChatMapper._message_to_dict(m) for m in reversed(history)]
 
-            # 转换为字典列表（使用列表推导式更简洁）
-            messages = [{
-                "role": m.role,
-                "content": m.content,
-                "create_at": m.create_at.isoformat() if m.create_at else None
-            } for m in history]
-
-            # 如果需要时间正序（最旧在前），取消下面这行的注释
-            # messages.reverse()
-
-            return {
-                "messages": messages,
-                "count": len(messages)
-            }
+            # 与数据库查询保持一致：最新的消息在前
+            messages.reverse()
+            return ChatMapper._history_to_dict(messages)
         except Exception as e:
             # 更详细的错误信息
             error_msg = f"查询对话 {conversation_id} 的历史记录失败: {str(e)}"
@@ -202,18 +431,7 @@ class ChatMapper:
     @staticmethod
     def get_conversation_length(conversation_id: int) -> int:
         """获取对话长度（消息数量）"""
-        key = ChatMapper._format_key(conversation_id)
-        return ChatMapper.redis_client.llen(key)
-
-    @staticmethod
-    def trim_conversation(conversation_id: int, max_length: int) -> None:
-        """
-        修剪对话历史，保留最近的max_length条消息
-        :param conversation_id: 对话ID
-        :param max_length: 保留的最大消息数
-        """
-        key = ChatMapper._format_key(conversation_id)
-        ChatMapper.redis_client.ltrim(key, -max_length, -1)
+        return Message.query.filter_by(conversation_id=conversation_id).count()
 
     @staticmethod
     def delete_conversation(conversation_id: int) -> int:
@@ -231,6 +449,8 @@ class ChatMapper:
                 Message.query.filter_by(conversation_id=conversation_id).delete()
                 db.session.delete(conversation)
                 db.session.commit()
+            ChatMapper._drop_cache(ChatMapper._format_info_key(conversation_id),
+                                   ChatMapper._format_version_key(conversation_id))
             return ChatMapper.redis_client.delete(key)
         except Exception as e:
             db.session.rollback()
@@ -251,6 +471,7 @@ class ChatMapper:
             conv.chat_history=chat_history
             db.session.commit()
             db.session.refresh(conv)
+            ChatMapper._drop_cache(ChatMapper._format_info_key(conversation_id))
             return {
                 "conversation_id": conversation_id,
                 "old_chat_history": old_chat_history,
@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from sqlalchemy import or_
+
+from app.config import Config
+from app.models.ingestion_job import IngestionJob
+from app.extensions import db
+
+
+class IngestionJobMapper:
+    @staticmethod
+    def create_job(user_id, vector_db_id, file_name, save_name, save_path, describe=None):
+        try:
+            job = IngestionJob(
+                user_id=user_id,
+                vector_db_id=vector_db_id,
+                file_name=file_name,
+                save_name=save_name,
+                save_path=save_path,
+                describe=describe,
+                status='pending',
+                progress=0,
+            )
+            db.session.add(job)
+            db.session.commit()
+            db.session.refresh(job)
+            return job
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"创建入库任务失败: {str(e)}")
+
+    @staticmethod
+    def create_jobs(user_id, vector_db_id, files, describe=None, batch_id=None):
+        """
+        批量创建入库任务（一次提交）
+        :param files: [(原始文件名, 唯一文件名, 保存路径)]
+        """
+        try:
+            jobs = [
+                IngestionJob(
+                    user_id=user_id,
+                    vector_db_id=vector_db_id,
+                    batch_id=batch_id,
+                    file_name=file_name,
+                    save_name=save_name,
+                    save_path=save_path,
+                    describe=describe,
+                    status='pending',
+                    progress=0,
+                )
+                for file_name, save_name, save_path in files
+            ]
+            db.session.add_all(jobs)
+            db.session.commit()
+            return jobs
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"创建入库任务失败: {str(e)}")
+
+    @staticmethod
+    def get_job(job_id):
+        return IngestionJob.query.get(job_id)
+
+    @staticmethod
+    def get_jobs(user_id, vector_db_id=None, status=None, limit=50, batch_id=None):
+        query = IngestionJob.query.filter_by(user_id=user_id)
+        if vector_db_id is not None:
+            query = query.filter_by(vector_db_id=vector_db_id)
+        if status:
+            query = query.filter_by(status=status)
+        if batch_id:
+            # 按批次查询时返回该批次的全部任务
+            return query.filter_by(batch_id=batch_id).order_by(IngestionJob.id).all()
+        return query.order_by(IngestionJob.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def update_job(job_id, **kwargs):
+        try:
+            job = IngestionJob.query.get(job_id)
+            if not job:
+                return None
+            for key, value in kwargs.items():
+                if hasattr(job, key):
+                    setattr(job, key, value)
+            db.session.commit()
+            db.session.refresh(job)
+            return job
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"更新入库任务失败: {str(e)}")
+
+    @staticmethod
+    def claim_job(job_id, owner):
+        """把 pending 任务原子地置为 running 并记录执行进程（条件更新），返回是否由本次调用领取"""
+        try:
+            claimed = IngestionJob.query.filter_by(id=job_id, status='pending').update(
+                {IngestionJob.status: 'running', IngestionJob.stage: 'preparing',
+                 IngestionJob.attempts: IngestionJob.attempts + 1,
+                 IngestionJob.owner: owner, IngestionJob.heartbeat_at: db.func.now()},
+                synchronize_session=False
+            )
+            db.session.commit()
+            return claimed == 1
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"领取入库任务失败: {str(e)}")
+
+    @staticmethod
+    def heartbeat_jobs(job_ids, owner):
+        """续约本进程执行中的任务"""
+        try:
+            IngestionJob.query.filter(
+                IngestionJob.id.in_(list(job_ids)),
+                IngestionJob.owner == owner,
+                IngestionJob.status == 'running'
+            ).update({IngestionJob.heartbeat_at: db.func.now()}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"任务续约失败: {str(e)}")
+
+    @staticmethod
+    def lease_cutoff():
+        """租约过期的时间点（使用数据库时钟，与 heartbeat_at 一致）"""
+        return db.session.query(db.func.now()).scalar() - timedelta(seconds=Config.INGESTION_LEASE_SECONDS)
+
+    @staticmethod
+    def release_stale_jobs(job_id=None):
+        """
+        把租约已过期（执行进程已退出）的 running 任务放回 pending（条件更新），返回放回的任务数
+        :param job_id: 只处理指定任务，为空时处理全部
+        """
+        try:
+            query = IngestionJob.query.filter(
+                IngestionJob.status == 'running',
+                or_(IngestionJob.heartbeat_at.is_(None), IngestionJob.heartbeat_at < IngestionJobMapper.lease_cutoff())
+            )
+            if job_id is not None:
+                query = query.filter(IngestionJob.id == job_id)
+            released = query.update({IngestionJob.status: 'pending', IngestionJob.owner: None},
+                                    synchronize_session=False)
+            db.session.commit()
+            return released
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"释放过期入库任务失败: {str(e)}")
+
+    @staticmethod
+    def get_pending_jobs():
+        return IngestionJob.query.filter_by(status='pending').order_by(IngestionJob.id).all()
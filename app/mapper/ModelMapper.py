@@ -1,8 +1,12 @@
 from app.mapper import UserMapper
 from app.models.model_config import ModelConfig
 from app.models.model_info import ModelInfo
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app.extensions import db
+from app.models.user import User
+from app.utils.CatalogCache import catalog_cache, MODEL_CONFIG_NAMESPACE
+from app.utils.TransUtil import invalidate_chatllm
 
 
 class ModelMapper:
@@ -39,6 +43,37 @@ class ModelMapper:
     def get_all_public_model_config():
         return ModelConfig.query.filter_by(is_private=False).all()
 
+    # 公开的model_config，关联作者和基础模型（分页与计数共用，作者或基础模型不存在的配置两者都不计入）
+    @staticmethod
+    def _public_model_config_query(*columns):
+        return db.session.query(*columns)\
+            .select_from(ModelConfig)\
+            .join(User, ModelConfig.user_id == User.id)\
+            .join(ModelInfo, ModelConfig.base_model_id == ModelInfo.id)\
+            .filter(ModelConfig.is_private == False)
+
+    # 公开的model_config连同作者名、基础模型名一次查询（按 id 排序，offset/limit 为空时返回全部）
+    @staticmethod
+    def get_public_model_config_page(offset: int | None = None, limit: int | None = None):
+        query = ModelMapper._public_model_config_query(
+            ModelConfig.id,
+            ModelConfig.name,
+            ModelConfig.share_id,
+            ModelConfig.describe,
+            ModelConfig.update_at,
+            User.name.label("author"),
+            ModelInfo.model_name.label("base_model_name")
+        ).order_by(ModelConfig.id)
+        if offset:
+            query = query.offset(offset)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @staticmethod
+    def count_public_model_config():
+        return ModelMapper._public_model_config_query(func.count(ModelConfig.id)).scalar()
+
     # 创建一个新的model_config
     @staticmethod
     def create_model_config(
@@ -76,6 +111,7 @@ class ModelMapper:
             db.session.add(model_config)
             db.session.commit()
             db.session.refresh(model_config)
+            catalog_cache.invalidate(MODEL_CONFIG_NAMESPACE)
             return model_config
 
         except ValueError as ve:
@@ -124,6 +160,8 @@ class ModelMapper:
                 model_config.describe = describe
             db.session.commit()
             db.session.refresh(model_config)
+            invalidate_chatllm(model_config_id)
+            catalog_cache.invalidate(MODEL_CONFIG_NAMESPACE)
             return model_config
         except Exception as e:
             db.session.rollback()
@@ -139,6 +177,8 @@ class ModelMapper:
 
             db.session.delete(model_config)
             db.session.commit()
+            invalidate_chatllm(config_id)
+            catalog_cache.invalidate(MODEL_CONFIG_NAMESPACE)
             return model_config
 
         except ValueError as ve:
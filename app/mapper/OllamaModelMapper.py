@@ -6,6 +6,7 @@ from app.models.ollama_base_model_info import OllamaBaseModelInfo
 from app.models.ollama_model_config import OllamaModelConfig
 from sqlalchemy.orm import Session
 from app.extensions import db
+from app.utils.CatalogCache import catalog_cache, OLLAMA_MODEL_NAMESPACE
 
 
 class OllamaModelMapper:
@@ -19,6 +20,34 @@ class OllamaModelMapper:
     def get_all_model_info():
         return OllamaBaseModelInfo.query.all()
 
+    # 分页获取model_info（按 id 排序，offset/limit 为空时返回全部）
+    @staticmethod
+    def get_model_info_page(offset: int | None = None, limit: int | None = None):
+        query = OllamaBaseModelInfo.query.order_by(OllamaBaseModelInfo.id)
+        if offset:
+            query = query.offset(offset)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @staticmethod
+    def count_model_info():
+        return OllamaBaseModelInfo.query.count()
+
+    # 一次查询用户在多个基础模型下的model_config，返回 {base_model_id: [config]}
+    @staticmethod
+    def get_user_configs_by_base_models(user_id: int, base_model_ids):
+        configs_by_base_model = {base_model_id: [] for base_model_id in base_model_ids}
+        if not configs_by_base_model:
+            return configs_by_base_model
+        configs = OllamaModelConfig.query.filter(
+            OllamaModelConfig.user_id == user_id,
+            OllamaModelConfig.base_model_id.in_(list(configs_by_base_model))
+        ).order_by(OllamaModelConfig.id).all()
+        for config in configs:
+            configs_by_base_model[config.base_model_id].append(config)
+        return configs_by_base_model
+
     # 使用id 查询 model_config
     @staticmethod
     def get_model_config_by_id(model_config_id: int):
@@ -72,6 +101,7 @@ class OllamaModelMapper:
             )
             db.session.add(model_config)
             db.session.commit()
+            catalog_cache.invalidate(OLLAMA_MODEL_NAMESPACE)
             db.session.refresh(model_config)
             return model_config
 
@@ -117,6 +147,7 @@ class OllamaModelMapper:
             if describe:
                 model_config.describe = describe
             db.session.commit()
+            catalog_cache.invalidate(OLLAMA_MODEL_NAMESPACE)
             db.session.refresh(model_config)
             return model_config
         except Exception as e:
@@ -133,6 +164,7 @@ class OllamaModelMapper:
 
             db.session.delete(model_config)
             db.session.commit()
+            catalog_cache.invalidate(OLLAMA_MODEL_NAMESPACE)
             return model_config
 
         except ValueError as ve:
@@ -179,6 +211,7 @@ class OllamaModelMapper:
             )
             db.session.add(model_info)
             db.session.commit()
+            catalog_cache.invalidate(OLLAMA_MODEL_NAMESPACE)
             db.session.refresh(model_info)
             return model_info
         except Exception as e:
@@ -48,6 +48,16 @@ class UserMapper:
             db.rollback()
             raise Exception("更新用户失败")
 
+    @staticmethod
+    def update_password_hash(id: int, password_hash: str):
+        """只更新密码哈希（登录时按新的 cost 重新计算）"""
+        try:
+            User.query.filter_by(id=id).update({User.password: password_hash})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(f"更新密码哈希失败: {str(e)}")
+
     @staticmethod
     def get_user_by_email(email):
         user = User.query.filter_by(email=email).first()
@@ -3,3 +3,4 @@ from .ModelMapper import ModelMapper
 from .OllamaModelMapper import OllamaModelMapper
 from .VectorMapper import VectorMapper  # 新增导入
 from .ChatMapper import ChatMapper
+from .IngestionJobMapper import IngestionJobMapper
@@ -9,4 +9,5 @@ from .conversation import Conversation
 from .finetuning_document import FinetuningDocument  # 新增导入
 from .pre_finetuning_model import PreFinetuningModel
 from .finetuning_records import FinetuningRecords  # 新增导入
-from .finetuning_model import FinetuningModel  # 新增导入
\ No newline at end of file
+from .finetuning_model import FinetuningModel  # 新增导入
+from .ingestion_job import IngestionJob
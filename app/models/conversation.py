@@ -21,4 +21,5 @@ class Conversation(db.Model):
     __table_args__ = (
         db.Index('idx_conversation_model_config_id', model_config_id),
         db.Index('idx_conversation_user_id', user_id),
+        db.Index('idx_conversation_user_update', user_id, update_at, id),
     )
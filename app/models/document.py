@@ -10,8 +10,12 @@ class Document(db.Model):
     type = db.Column(db.String(64), nullable=False)
     size = db.Column(db.Integer, nullable=False)
     save_path = db.Column(db.Text, nullable=True)  # 临时存储模式下，文件处理完成后会被删除，所以允许为空
+    content_hash = db.Column(db.String(64), nullable=True)  # 文件内容 SHA-256，用于重复检测
+    status = db.Column(db.String(16), default='ready', server_default='ready', nullable=False)  # ingesting, ready
     describe = db.Column(db.String(255), nullable=True)
     upload_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+    # 入库期间定期续约；ingesting 记录超过 INGESTION_LEASE_SECONDS 未更新视为写入进程已退出
+    update_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
     user = db.relationship('User', backref=db.backref('documents', lazy=True))
     vector_db = db.relationship('VectorDb', back_populates='stored_documents')
     __table_args__ = (
@@ -19,6 +23,8 @@ class Document(db.Model):
         db.Index('idx_document_upload_at', upload_at),
         db.Index('idx_document_user_id', user_id),
         db.Index('idx_document_vector_db_id', vector_db_id),
+        db.Index('idx_document_vector_db_hash', vector_db_id, content_hash),
+        db.Index('idx_document_status', status),
     )
 
     def to_dict(self):
@@ -29,6 +35,7 @@ class Document(db.Model):
             'type': self.type,
             'size': self.size,
             'save_path': self.save_path,
+            'status': self.status,
             'describe': self.describe,
             'upload_at': upload_at_str
         }
\ No newline at end of file
@@ -0,0 +1,52 @@
+from app.extensions import db
+
+
+class IngestionJob(db.Model):
+    __tablename__ = 'ingestion_job'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    vector_db_id = db.Column(db.Integer, db.ForeignKey('vector_db.id'), nullable=False)
+    batch_id = db.Column(db.String(32), nullable=True)  # 批量上传的批次ID，单文件上传为空
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id', ondelete='SET NULL'), nullable=True)
+    file_name = db.Column(db.String(255), nullable=False)  # 原始文件名
+    save_name = db.Column(db.String(255), nullable=False)  # 唯一文件名（写入向量元数据的 file_name）
+    save_path = db.Column(db.Text, nullable=True)  # 待处理文件路径，完成后清空
+    describe = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, completed, failed, cancelled
+    progress = db.Column(db.Float, default=0, nullable=False)  # 0-100
+    stage = db.Column(db.String(32), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    owner = db.Column(db.String(64), nullable=True)  # 执行该任务的进程（主机名:pid:随机串）
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # 执行进程最近一次续约时间
+    create_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+    update_at = db.Column(
+        db.DateTime,
+        server_default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp(),
+        nullable=False
+    )
+    __table_args__ = (
+        db.Index('idx_ingestion_job_user_id', user_id),
+        db.Index('idx_ingestion_job_vector_db_id', vector_db_id),
+        db.Index('idx_ingestion_job_status', status),
+        db.Index('idx_ingestion_job_batch_id', batch_id),
+    )
+
+    def to_dict(self):
+        create_at_str = self.create_at.strftime('%Y-%m-%d %H:%M:%S') if self.create_at else None
+        update_at_str = self.update_at.strftime('%Y-%m-%d %H:%M:%S') if self.update_at else None
+        return {
+            'id': self.id,
+            'vector_db_id': self.vector_db_id,
+            'batch_id': self.batch_id,
+            'document_id': self.document_id,
+            'file_name': self.file_name,
+            'status': self.status,
+            'progress': round(self.progress or 0, 2),
+            'stage': self.stage,
+            'error': self.error,
+            'attempts': self.attempts,
+            'create_at': create_at_str,
+            'update_at': update_at_str,
+        }
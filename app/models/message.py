@@ -12,4 +12,5 @@ class Message(db.Model):
     __table_args__ = (
         db.Index('idx_message_conversation_id', conversation_id),
         db.Index('idx_message_role', role),
+        db.Index('idx_message_conversation_create', conversation_id, create_at),
     )
@@ -36,8 +36,8 @@ class VectorDb(db.Model):
         created_at_str = self.create_at.strftime('%Y-%m-%d %H:%M:%S') if self.create_at else None
         updated_at_str = self.update_at.strftime('%Y-%m-%d %H:%M:%S') if self.update_at else None
         model_configs = [config.to_dict() for config in self.model_configs]
-        # 确保返回所有文档，包括 save_path 为 None 的文档
-        documents = [doc.to_dict() for doc in self.stored_documents]
+        # 返回所有已入库完成的文档（包括 save_path 为 None 的文档），入库中的文档不返回
+        documents = [doc.to_dict() for doc in self.stored_documents if doc.status == 'ready']
         # 解析collection_metadata JSON
         metadata_dict = None
         if self.collection_metadata:
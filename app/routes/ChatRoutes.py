@@ -1,4 +1,6 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 
 from app.forms.base import ErrorResponse, SuccessResponse
 from app.services.ChatService import ChatService
@@ -28,6 +30,42 @@ def chat() -> str:
     except Exception as e:
         return ErrorResponse(500, str(e)).to_json()
 
+@chat_bp.route("/stream", methods=['POST'])
+@login_required
+def stream_chat():
+    """
+    流式对话（Server-Sent Events）
+    参数与 /chat/ 相同，每个事件为 data: {json}，event 字段为 start / delta / done / error
+    """
+    conversation_id_str = request.form.get("conversation_id")
+    model_config_id = request.form.get("model_config_id")
+    conversation_id = int(conversation_id_str) if conversation_id_str else None
+    message = request.form.get("message")
+    user_id = request.user.id
+    if not message:
+        return ErrorResponse(400, "用户消息为空").to_json()
+
+    def generate():
+        events = ChatService.stream_chat(user_id, conversation_id, model_config_id, message)
+        try:
+            for event in events:
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            error = {"event": "error", "message": str(e)}
+            yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+        finally:
+            # 客户端断开时显式关闭，确保在请求上下文内保存已生成的回答
+            events.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭 Nginx 缓冲，逐个转发 token
+        }
+    )
+
 @chat_bp.route("/history", methods=['POST'])
 @login_required
 def get_history() -> str:
@@ -60,6 +98,25 @@ def get_conversation() -> str:
     except Exception as e:
         return ErrorResponse(500, str(e)).to_json()
 
+@chat_bp.route("/conversations", methods=['GET'])
+@login_required
+def get_conversation_page() -> str:
+    """
+    分页获取对话列表，按更新时间倒序
+    参数：limit 每页数量，cursor 上一页返回的 next_cursor，messages 每个对话附带的最新消息数
+    :return: 返回json格式的字符串
+    """
+    try:
+        limit = request.args.get("limit", 20, type=int)
+        message_count = request.args.get("messages", 10, type=int)
+        cursor = request.args.get("cursor") or None
+        page = ChatService.get_conversation_page(request.user.id, limit, cursor, message_count)
+        return SuccessResponse("对话列表获取成功！", page).to_json()
+    except ValueError as e:
+        return ErrorResponse(400, f"参数错误: {str(e)}").to_json()
+    except Exception as e:
+        return ErrorResponse(500, str(e)).to_json()
+
 @chat_bp.route("/delete", methods=['POST', 'DELETE'])
 @login_required
 def delete_conversation() -> str:
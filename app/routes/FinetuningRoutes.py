@@ -2,6 +2,7 @@
 from flask import Blueprint, request, send_file
 from app.forms.base import ErrorResponse, SuccessResponse
 from app.services.FinetuningService import FinetuningService
+from app.utils.PEFT.ModelServer import QueueFullError
 from app.utils.JwtUtil import login_required
 import os
 
@@ -150,6 +151,8 @@ def chat() -> str:
     try:
         response = FinetuningService.chat(user_id, conversation_id, model_config_id, message)  # 回答
         return SuccessResponse("对话成功！", response).to_json()
+    except QueueFullError as e:
+        return ErrorResponse(503, str(e)).to_json()
     except Exception as e:
         return ErrorResponse(500, str(e)).to_json()
 
@@ -167,7 +170,10 @@ def base_chat() -> str:
     message = data.get('message')
     model_config_id = data.get('model_config_id')
     conversation_id = data.get('conversation_id')
-    response = FinetuningService.base_chat(user_id, conversation_id, model_config_id, message)
+    try:
+        response = FinetuningService.base_chat(user_id, conversation_id, model_config_id, message)
+    except QueueFullError as e:
+        return ErrorResponse(503, str(e)).to_json()
     return SuccessResponse("success", response).to_json()
 
 @finetuning_bp.route('/base/create', methods=['POST'])
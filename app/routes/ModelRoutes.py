@@ -27,8 +27,15 @@ def get_info(info_id):
 
 @model_bp.route('/modelconfig/getpublic', methods=['GET'])
 def get_public_config():
+    """公开模型配置；携带 page（可选 page_size，1-100）时分页返回"""
     try:
-        config_list = ModelService.get_public_config()
+        page = request.args.get('page', type=int)
+        page_size = request.args.get('page_size', 20, type=int)
+        if page is not None and page < 1:
+            page = 1
+        if page_size < 1 or page_size > 100:
+            page_size = 20
+        config_list = ModelService.get_public_config(page, page_size)
         return SuccessResponse("获取公共模型配置成功", config_list).to_json()
     except Exception as e:
         return error_500_print("Model error", e)
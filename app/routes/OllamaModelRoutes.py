@@ -10,9 +10,16 @@ ollama_model_bp = Blueprint('ollama_model', __name__, url_prefix='/ollama_model'
 @ollama_model_bp.route('/modelinfo/getlist', methods=['GET'])
 @login_required
 def get_all_info():
+    """基础模型及当前用户的配置；携带 page（可选 page_size，1-100）时分页返回"""
     try:
         user_id =  request.user.id
-        info_list = OllamaModelService.get_all_info(user_id)
+        page = request.args.get('page', type=int)
+        page_size = request.args.get('page_size', 20, type=int)
+        if page is not None and page < 1:
+            page = 1
+        if page_size < 1 or page_size > 100:
+            page_size = 20
+        info_list = OllamaModelService.get_all_info(user_id, page, page_size)
         return SuccessResponse("获取model_info列表成功", info_list).to_json()
     except Exception as e:
         return error_500_print("Model error", e)
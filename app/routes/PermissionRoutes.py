@@ -1,9 +1,13 @@
+import hashlib
+import threading
+
 from flask import Blueprint, jsonify, request, current_app
 from werkzeug.exceptions import BadRequest, NotFound
 
 from app.models.permission import Role, Permission, Route, RolePermission, RoleRoute
 from app.extensions import db
 from app.utils.JwtUtil import login_required
+from app.utils.RouteAuthorizer import route_authorizer
 
 permission_bp = Blueprint('permission', __name__, url_prefix='/permission')
 
@@ -66,8 +70,9 @@ def update_role_permissions(role_id):
             )
             db.session.add(role_permission)
 
-        # 7. 提交事务
+        # 7. 提交事务，并通知各进程重建授权索引
         db.session.commit()
+        route_authorizer.invalidate()
 
         # 8. 返回更新后的角色信息
         role_permissions = [p.code for p in role.permissions]
@@ -134,54 +139,12 @@ def get_routes():
         description: Internal server error
     """
     try:
-        # Get all routes from database
-        all_routes = Route.query.order_by(Route.path).all()
-
-        # Build hierarchical structure
-        def build_tree(routes, parent_id=None):
-            tree = []
-            for route in routes:
-                if route.parent_id == parent_id:
-                    route_data = {
-                        'id': route.id,
-                        'path': route.path,
-                        'name': route.name,
-                        'component': route.component,
-                        'method': route.method,
-                        'meta': route.meta or {},
-                        'children': build_tree(routes, route.id)
-                    }
-                    tree.append(route_data)
-            return tree
-
-        # Get flat list of route permissions
-        route_permissions = db.session.query(
-            RoleRoute.route_id,
-            Role.name
-        ).join(Role).all()
-
-        # Convert to dictionary {route_id: [role_names]}
-        permissions_dict = {}
-        for route_id, role_name in route_permissions:
-            if route_id not in permissions_dict:
-                permissions_dict[route_id] = []
-            permissions_dict[route_id].append(role_name)
-
-        # Build final response with permissions
-        def add_permissions(routes_tree):
-            for route in routes_tree:
-                route['roles'] = permissions_dict.get(route['id'], [])
-                if route['children']:
-                    add_permissions(route['children'])
-            return routes_tree
-
-        routes_tree = add_permissions(build_tree(all_routes))
-
-        return jsonify({
-            'code': 200,
-            'message': 'Success',
-            'data': routes_tree
-        })
+        body, etag = _get_route_tree()
+        response = current_app.response_class(body, mimetype='application/json')
+        # 管理端轮询时携带 If-None-Match，树未变化返回 304
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
 
     except Exception as e:
         current_app.logger.error(f"Failed to get routes: {str(e)}")
@@ -191,6 +154,53 @@ def get_routes():
             'error': str(e)
         }), 500
 
+
+# 路由树缓存：与授权索引同步失效（权限变更后 route_authorizer 重建索引，索引对象变化即重建路由树）
+# 缓存为不可变的 (index, body, etag) 元组，整体替换，读取方不会看到新旧混合的字段
+_route_tree_cache = (None, None, None)
+_route_tree_lock = threading.Lock()
+
+
+def _get_route_tree():
+    """返回 (序列化后的路由树, ETag)"""
+    global _route_tree_cache
+    index = route_authorizer.get_index()
+    cached_index, body, etag = _route_tree_cache
+    if cached_index is not index:
+        with _route_tree_lock:
+            cached_index, body, etag = _route_tree_cache
+            if cached_index is not index:
+                body = current_app.json.dumps({
+                    'code': 200,
+                    'message': 'Success',
+                    'data': _build_route_tree()
+                }).encode('utf-8')
+                etag = hashlib.sha1(body).hexdigest()
+                _route_tree_cache = (index, body, etag)
+    return body, etag
+
+
+def _build_route_tree():
+    """一次遍历建立 parent_id -> 子节点 索引，子节点按 path 排序；父节点不存在的路由不出现在树中"""
+    roles_by_route = {}
+    for route_id, role_name in db.session.query(RoleRoute.route_id, Role.name).join(Role).all():
+        roles_by_route.setdefault(route_id, []).append(role_name)
+
+    children = {}
+    for route in Route.query.order_by(Route.path).all():
+        node = {
+            'id': route.id,
+            'path': route.path,
+            'name': route.name,
+            'component': route.component,
+            'method': route.method,
+            'meta': route.meta or {},
+            'children': children.setdefault(route.id, []),
+            'roles': roles_by_route.get(route.id, [])
+        }
+        children.setdefault(route.parent_id, []).append(node)
+    return children.get(None, [])
+
 @permission_bp.route('/routes/<int:route_id>', methods=['PUT'])
 def update_route_permissions(route_id):
     """
@@ -239,8 +249,9 @@ def update_route_permissions(route_id):
             )
             db.session.add(role_route)
 
-        # 7. 提交事务
+        # 7. 提交事务，并通知各进程重建授权索引
         db.session.commit()
+        route_authorizer.invalidate()
 
         # 8. 返回更新后的路由信息
         route_roles = [r.name for r in route.roles]
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
 from app.forms.base import ErrorResponse, SuccessResponse
 from app.services.UserService import UserService
-from app.utils.JwtUtil import login_required
+from app.utils.JwtUtil import login_required, extract_token
 from app.utils.file_utils import save_uploaded_file
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
@@ -50,7 +50,7 @@ def login():
         return ErrorResponse(400, "缺少必要参数: email 或 password").to_json()
 
     try:
-        user = UserService.login(email, password)
+        user = UserService.login(email, password, request.remote_addr)
         return SuccessResponse("登录成功", user).to_json()
     except Exception as e:
         # 打印错误信息便于调试
@@ -64,6 +64,13 @@ def login():
         print(f"Error: {code} - {msg}")
         return ErrorResponse(code, msg).to_json()
 
+@user_bp.route('/logout', methods=['POST'])
+@login_required
+def logout():
+    """退出登录：注销当前令牌"""
+    UserService.logout(extract_token(request.headers.get('Authorization', '')))
+    return SuccessResponse("退出成功").to_json()
+
 @user_bp.route('/test', methods=['GET'])
 @login_required
 def test():
@@ -4,6 +4,7 @@ import os
 from flask import Blueprint, request, current_app, send_file, send_from_directory
 from app.forms.base import ErrorResponse, SuccessResponse
 from app.services.VectorService import VectorService
+from app.services.IngestionService import IngestionService
 from app.utils.JwtUtil import login_required
 from flask import jsonify  # 确保导入 jsonify
 from app.models import Document
@@ -217,6 +218,20 @@ def upload_file():
     if not vector_db_id:
         return ErrorResponse(400, "未提供向量数据库ID").to_json()
 
+    # 默认提交后台入库任务并立即返回任务ID；sync=true 时保持原来的同步处理
+    if request.form.get('sync', '').lower() not in ('1', 'true'):
+        try:
+            jobs = [
+                IngestionService.submit_upload(vector_db_id, file, request.user.id, describe)
+                for file in files if file.filename
+            ]
+            return SuccessResponse("文件已提交处理", data={
+                "job_ids": [job['id'] for job in jobs],
+                "jobs": jobs
+            }).to_json()
+        except Exception as e:
+            return handle_exception(e)
+
     document_ids = []
     try:
         # 串行处理文件，一个接一个
@@ -234,6 +249,75 @@ def upload_file():
     except Exception as e:
         return handle_exception(e)
 
+@vector_bp.route('/upload/bulk', methods=['POST'])
+@login_required
+def upload_bulk():
+    """
+    批量上传：多个文件和/或 zip、tar 压缩包，全部写入同一个向量库
+    返回批次ID和每个文件的任务，进度通过 /vector/jobs?batch_id= 或 ingestion_progress 事件获取
+    """
+    files = request.files.getlist('files') or request.files.getlist('file')
+    files = [file for file in files if file.filename]
+    if not files:
+        return ErrorResponse(400, "未提供文件或未选择文件").to_json()
+
+    vector_db_id = request.form.get('vector_db_id', type=int)
+    if not vector_db_id:
+        return ErrorResponse(400, "未提供向量数据库ID").to_json()
+    describe = request.form.get('describe', '').strip() or None
+
+    try:
+        result = IngestionService.submit_bulk(vector_db_id, files, request.user.id, describe)
+        return SuccessResponse("文件已提交批量处理", data=result).to_json()
+    except Exception as e:
+        return handle_exception(e)
+
+@vector_bp.route('/jobs', methods=['GET'])
+@login_required
+def get_ingestion_jobs():
+    """获取当前用户的入库任务列表，可按 vector_db_id、status、batch_id 过滤"""
+    try:
+        vector_db_id = request.args.get('vector_db_id', type=int)
+        status = request.args.get('status')
+        batch_id = request.args.get('batch_id')
+        jobs = IngestionService.get_jobs(request.user.id, vector_db_id, status, batch_id)
+        return SuccessResponse("查询成功", jobs).to_json()
+    except Exception as e:
+        return handle_exception(e)
+
+@vector_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_ingestion_job(job_id):
+    try:
+        job = IngestionService.get_job(job_id, request.user.id)
+        if job:
+            return SuccessResponse("查询成功", job).to_json()
+        return ErrorResponse(404, "未找到该任务").to_json()
+    except Exception as e:
+        return handle_exception(e)
+
+@vector_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_ingestion_job(job_id):
+    try:
+        job = IngestionService.cancel_job(job_id, request.user.id)
+        if job:
+            return SuccessResponse("已请求取消", job).to_json()
+        return ErrorResponse(404, "未找到该任务").to_json()
+    except Exception as e:
+        return handle_exception(e)
+
+@vector_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_ingestion_job(job_id):
+    try:
+        job = IngestionService.retry_job(job_id, request.user.id)
+        if job:
+            return SuccessResponse("已重新提交", job).to_json()
+        return ErrorResponse(404, "未找到该任务").to_json()
+    except Exception as e:
+        return handle_exception(e)
+
 @vector_bp.route('/delete_file/<int:document_id>', methods=['DELETE'])
 @login_required
 def delete_file(document_id):
@@ -307,8 +391,12 @@ def connect_vector(vector_id):
 @vector_bp.route('/query/<int:vector_id>', methods=['POST'])
 @login_required
 def query_vectors(vector_id):
-    result = VectorService.query_vectors(vector_id, request.json.get('query_text'), request.json.get('n_results', 10))
-    return SuccessResponse("查询成功", data=result).to_json()
+    try:
+        result = VectorService.query_vectors(vector_id, request.json.get('query_text'), request.json.get('n_results', 10),
+                                             mode=request.json.get('mode'))
+        return SuccessResponse("查询成功", data=result).to_json()
+    except Exception as e:
+        return handle_exception(e)
 
 
 from werkzeug.utils import safe_join
@@ -1,10 +1,13 @@
 import logging
 
+from app.config import Config
 from app.mapper.ChatMapper import ChatMapper
 from typing import List, Dict, Tuple
 
 from app.services import ModelService
 from app.services.VectorService import VectorService
+from app.utils.ContextBuilder import ContextBuilder
+from app.utils.Reranker import reranker
 from app.utils.TransUtil import get_chatllm
 from llama_index.core.llms import ChatMessage
 
@@ -64,6 +67,40 @@ class ChatService:
         # 其他未知格式
         return str(response)
 
+    @staticmethod
+    def _prepare_chat(user_id: int, conversation_id: int | None, model_config_id, message: str) -> dict:
+        """
+        保存用户消息并组装发送给模型的消息列表
+        :return: {"conversation_id", "conversation_info", "model_config_id", "model", "messages", "token_usage"}
+        """
+        if not conversation_id:
+            if not model_config_id:
+                raise Exception({'code': 401, 'msg': "模型配置不存在"})
+            conversation_id = ChatService.create_conversation(user_id, model_config_id, message, 0)
+        if not conversation_id:
+            raise Exception({'code': 500, 'msg': "对话创建失败"})
+        ChatMapper.save_message(conversation_id, "user", message)
+
+        conversation = ChatMapper.get_conversation(conversation_id)
+
+        conversation_info = conversation['conversation_info']
+        model_config_id = conversation_info['model_config_id']
+        history = conversation['history']["messages"]
+
+        # 按模型上下文窗口的 token 预算组装系统提示、历史消息和检索片段
+        model = get_chatllm(model_config_id)
+        contexts = ChatService.query_contexts(model_config_id, message)
+        chat_messages_list, token_usage = ContextBuilder.for_llm(model).build(model.system_prompt, history, contexts)
+        logger.info(f"对话 {conversation_id} 上下文 token 占用: {token_usage}")
+        return {
+            "conversation_id": conversation_id,
+            "conversation_info": conversation_info,
+            "model_config_id": model_config_id,
+            "model": model,
+            "messages": chat_messages_list,
+            "token_usage": token_usage
+        }
+
     @staticmethod
     def chat(user_id: int, conversation_id: int |  None, model_config_id, message: str) -> dict:
         """
@@ -74,30 +111,11 @@ class ChatService:
         :return:
         """
         try:
-            if not conversation_id:
-                if not model_config_id:
-                    raise Exception({'code': 401, 'msg': "模型配置不存在"})
-                conversation_id = ChatService.create_conversation(user_id, model_config_id, message, 0)
-            if not conversation_id:
-                raise Exception({'code': 500, 'msg': "对话创建失败"})
-            ChatMapper.save_message(conversation_id, "user", message)
-
-            conversation = ChatMapper.get_conversation(conversation_id)
-
-            conversation_info = conversation['conversation_info']
-            model_config_id = conversation_info['model_config_id']
-            history = conversation['history']["messages"]
-
-            chat_messages_list = []
-            for msg in reversed(history):
-                chat_messages_list.append(ChatMessage(role=msg['role'], content=msg['content']))
-            contexts = ChatService.query_contexts(model_config_id,message)
-            context_result = "通过检索知识库已知：" + str(contexts) + "\n请根据检索结果和上下文回答用户问题，如果没有检索到知识，和用户说明情况"
-            if contexts:
-                chat_messages_list.append(ChatMessage(role="system", content=context_result))
-                # logger.info(f"{msg['role']}:{msg['content']}")
-            model = get_chatllm(model_config_id)
-            response = model.chat(chat_messages_list)
+            prepared = ChatService._prepare_chat(user_id, conversation_id, model_config_id, message)
+            conversation_id = prepared['conversation_id']
+            conversation_info = prepared['conversation_info']
+            model = prepared['model']
+            response = model.chat(prepared['messages'])
             # 使用通用提取函数
             content = ChatService.extract_response_content(response)
             # 保存处理后的内容
@@ -105,10 +123,50 @@ class ChatService:
             return {
                 "response": res,
                 "conversation_id": conversation_id,
-                "conversation_name": conversation_info['name']
+                "conversation_name": conversation_info['name'],
+                "token_usage": prepared['token_usage']
             }
         except Exception as e:
             raise
+
+    @staticmethod
+    def stream_chat(user_id: int, conversation_id: int | None, model_config_id, message: str):
+        """
+        流式获取回答，逐个产出事件字典
+        - {"event": "start", "conversation_id", "conversation_name", "token_usage"}
+        - {"event": "delta", "delta": token}
+        - {"event": "done", "response": 保存后的消息}
+        生成器结束、出错或客户端断开（GeneratorExit）时都会保存已生成的回答
+        """
+        prepared = ChatService._prepare_chat(user_id, conversation_id, model_config_id, message)
+        conversation_id = prepared['conversation_id']
+        conversation_info = prepared['conversation_info']
+        yield {
+            "event": "start",
+            "conversation_id": conversation_id,
+            "conversation_name": conversation_info['name'],
+            "token_usage": prepared['token_usage']
+        }
+
+        content = ""
+        saved = False
+        try:
+            model = prepared['model']
+            for chunk in model.stream_chat(prepared['messages']):
+                if chunk.delta:
+                    content += chunk.delta
+                    yield {"event": "delta", "delta": chunk.delta}
+            res = ChatMapper.save_message(conversation_id, "assistant", content)
+            saved = True
+            yield {"event": "done", "response": res}
+        finally:
+            if not saved and content:
+                try:
+                    ChatMapper.save_message(conversation_id, "assistant", content)
+                    logger.info(f"流式对话 {conversation_id} 中断，已保存部分回答（{len(content)} 字符）")
+                except Exception as e:
+                    logger.error(f"保存中断的流式回答失败: {str(e)}")
+
     @staticmethod
     def rechat(conversation_id: int) -> dict:
         """
@@ -146,13 +204,23 @@ class ChatService:
         :param user_id: 用户 id
         :return: 返回历史信息的列表
         """
-        conversation_id_list = ChatMapper.get_conversation_id(user_id)
-        histories = []
-        for item in conversation_id_list:
-            conversation_id = item["conversation_id"]
-            history = ChatMapper.get_conversation(conversation_id, 10)
-            histories.append(history)
-        return histories
+        return ChatMapper.get_conversation_page(user_id, message_count=10)["items"]
+
+    @staticmethod
+    def get_conversation_page(user_id: int, limit: int = 20, cursor: str | None = None,
+                              message_count: int = 10) -> dict:
+        """
+        分页获取对话列表
+        :param limit: 每页对话数量（1-100）
+        :param cursor: 上一页返回的 next_cursor，为空表示第一页
+        :param message_count: 每个对话附带的最新消息数量（0-50）
+        :return: {"items": [...], "next_cursor": ..., "has_more": ...}
+        """
+        if not 1 <= limit <= 100:
+            raise ValueError("limit 取值范围为 1-100")
+        if not 0 <= message_count <= 50:
+            raise ValueError("messages 取值范围为 0-50")
+        return ChatMapper.get_conversation_page(user_id, limit, cursor, message_count)
 
     @staticmethod
     def get_history(conversation_id: int) -> dict:
@@ -191,4 +259,10 @@ class ChatService:
         return res
     @staticmethod
     def query_contexts(model_config_id, message):
-        return VectorService.query_vector_by_model(model_config_id, message)
+        """检索对话上下文；开启重排序时多取候选，重排后保留 RERANK_TOP_N 条"""
+        if not Config.RERANK_ENABLED or not reranker.available:
+            return VectorService.query_vector_by_model(model_config_id, message)
+        contexts = VectorService.query_vector_by_model(model_config_id, message, n_results=Config.RERANK_CANDIDATES)
+        if not contexts:
+            return contexts
+        return reranker.rerank(message, contexts, Config.RERANK_TOP_N, Config.RERANK_TIME_BUDGET_MS / 1000)
@@ -15,6 +15,7 @@ from app.services import ChatService
 from app.utils.PEFT.ChatWithBase import chat_with_base
 from app.utils.PEFT.ChatWithFintuned import chat_with_finetuned
 from app.utils.PEFT.DownloadModel import robust_download_model
+from app.utils.PEFT.ModelServer import local_model_registry, QueueFullError
 from app.utils.PEFT.ModelTrainer import finetune
 from app.utils.file_utils import save_uploaded_file
 
@@ -142,6 +143,7 @@ class FinetuningService:
         try:
             info = FinetuningService.get_model_info(model_id)
             return {
+                'base_model_id': info['base_model']['id'],
                 'model_path': info['base_model']['path'],
                 'name': info['fine_tuned_model']['name'],
                 'peft_model_path':  info['output_dir'],
@@ -180,8 +182,29 @@ class FinetuningService:
         }.get(model_name)
         if not model_class:
             raise ValueError("无效的模型名称")
+        FinetuningService._release_local_models(model_name, id)
         return FinetuningMapper.delete(model_class, id)
 
+    @staticmethod
+    def _release_local_models(model_name, id):
+        """删除模型前，从常驻注册表中释放基座或卸载对应的 LoRA 适配器"""
+        def same_path(other):
+            return isinstance(other, str) and os.path.abspath(os.path.normpath(other)) == path
+
+        if model_name == 'pre_finetuning_model':
+            instance = PreFinetuningModel.query.get(id)
+            path = instance.path if instance else None
+            if path:
+                path = os.path.abspath(os.path.normpath(path))
+                local_model_registry.evict_where(lambda key: same_path(key[0]))
+        elif model_name == 'finetuning_model':
+            instance = FinetuningModel.query.get(id)
+            record = FinetuningRecords.query.get(instance.record_id) if instance else None
+            path = record.output_dir if record else None
+            if path:
+                path = os.path.abspath(os.path.normpath(path))
+                local_model_registry.remove_adapters_where(lambda name, adapter_path: same_path(adapter_path))
+
     @staticmethod
     def get_list(model_name, user_id):
         model_class = {
@@ -228,13 +251,17 @@ class FinetuningService:
             if isinstance(message, str):
                 messages = [{"role": "user", "content": message}]
             print(message)
-            response = chat_with_finetuned(model['model_path'], model['peft_model_path'], model['load_in_4bit'], messages[-1]['content'])
+            response = chat_with_finetuned(model['model_path'], model['peft_model_path'], model['load_in_4bit'],
+                                           messages[-1]['content'], adapter_name=f"ft_{model_config_id}")
             res = ChatMapper.save_message(conversation_id, "assistant", response)
             return {
                 "response": res,
                 "conversation_id": conversation_id,
                 "conversation_name": conversation_info['name']
             }
+        except QueueFullError:
+            # 排队已满不是模型故障，不修改模型状态
+            raise
         except Exception as e:
             FinetuningMapper.update(FinetuningModel, model_config_id, status="failed")
             raise  e
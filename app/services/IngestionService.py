@@ -0,0 +1,315 @@
+# app/services/IngestionService.py
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import Config
+from app.mapper import IngestionJobMapper
+from app.services.VectorService import VectorService, IngestionCancelled, is_archive
+
+logger = logging.getLogger("IngestionService")
+
+RETRYABLE_STATUSES = ('failed', 'cancelled')
+PROGRESS_PERSIST_STEP = 5  # 进度变化超过该百分比才写库，Socket.IO 推送不受限制
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"  # 本进程的任务 owner
+
+
+class IngestionService:
+    """
+    文档入库任务
+    - /vector/upload 只保存文件并创建 ingestion_job 记录，立即返回任务ID
+    - 解析、分块、嵌入、写入 ChromaDB 在后台线程池中执行
+    - 进度写入任务表，并通过 Socket.IO 的 ingestion_progress 事件推送到 user_{id} 房间
+    """
+    _app = None
+    _socketio = None
+    _executor = None
+    _lock = threading.Lock()
+    _active = set()  # 本进程中排队或执行中的任务
+    _cancel_requested = set()
+
+    @staticmethod
+    def init_app(app, socketio):
+        IngestionService._app = app
+        IngestionService._socketio = socketio
+        IngestionService._executor = ThreadPoolExecutor(
+            max_workers=Config.INGESTION_WORKERS,
+            thread_name_prefix="ingestion"
+        )
+        with app.app_context():
+            try:
+                cleaned = VectorService.cleanup_stale_documents()
+                if cleaned:
+                    logger.info(f"已清理 {cleaned} 个未完成入库的文档记录")
+            except Exception as e:
+                logger.warning(f"清理未完成入库的文档记录失败: {str(e)}")
+            if Config.INGESTION_RECOVER_ON_STARTUP:
+                try:
+                    IngestionService._recover_jobs()
+                except Exception as e:
+                    logger.warning(f"恢复未完成的入库任务失败: {str(e)}")
+
+    @staticmethod
+    def _recover_jobs():
+        """
+        恢复未完成的任务：租约已过期的 running 任务（执行进程已退出）放回 pending，
+        待处理文件仍在的 pending 任务重新入队（批量任务按批次整体入队，由 claim_job 保证只执行一次），
+        文件已不存在的标记失败
+        """
+        released = IngestionJobMapper.release_stale_jobs()
+        if released:
+            logger.info(f"{released} 个执行中的入库任务租约已过期，重新排队")
+        singles, batches, recovered = [], {}, 0
+        for job in IngestionJobMapper.get_pending_jobs():
+            if not job.save_path or not os.path.exists(job.save_path):
+                IngestionJobMapper.update_job(job.id, status='failed', error="服务重启后待处理文件已不存在，请重新上传")
+                continue
+            recovered += 1
+            if job.batch_id:
+                batches.setdefault(job.batch_id, []).append(job.id)
+            else:
+                singles.append(job.id)
+        for job_id in singles:
+            IngestionService._enqueue(job_id)
+        for job_ids in batches.values():
+            IngestionService._enqueue_bulk(job_ids)
+        if recovered:
+            logger.info(f"已恢复 {recovered} 个未完成的入库任务")
+
+    @staticmethod
+    def submit_upload(vector_db_id, file, user_id, describe):
+        """保存文件并创建入库任务，返回任务信息"""
+        filename, unique_filename, save_path = VectorService.save_upload(vector_db_id, file)
+        try:
+            job = IngestionJobMapper.create_job(user_id, vector_db_id, filename, unique_filename, save_path, describe)
+        except Exception:
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            raise
+        IngestionService._enqueue(job.id)
+        return job.to_dict()
+
+    @staticmethod
+    def submit_bulk(vector_db_id, files, user_id, describe):
+        """
+        批量上传：保存多个文件并解压其中的 zip/tar 压缩包，每个文件一个入库任务（同一批次ID），
+        整批交给一个后台任务并行解析、共用嵌入和写入
+        :return: {"batch_id", "jobs", "skipped"}
+        """
+        saved, skipped = [], []
+        try:
+            for file in files:
+                if is_archive(file.filename):
+                    archive_saved, archive_skipped = VectorService.extract_archive(vector_db_id, file)
+                    saved.extend(archive_saved)
+                    skipped.extend(archive_skipped)
+                else:
+                    saved.append(VectorService.save_upload(vector_db_id, file))
+                if len(saved) > Config.BULK_MAX_FILES:
+                    raise ValueError(f"单次最多上传 {Config.BULK_MAX_FILES} 个文件")
+            if not saved:
+                raise ValueError("没有可入库的文件")
+            batch_id = uuid.uuid4().hex
+            jobs = IngestionJobMapper.create_jobs(user_id, vector_db_id, saved, describe, batch_id)
+        except Exception:
+            for _, _, save_path in saved:
+                if os.path.exists(save_path):
+                    os.remove(save_path)
+            raise
+        IngestionService._enqueue_bulk([job.id for job in jobs])
+        return {"batch_id": batch_id, "jobs": [job.to_dict() for job in jobs], "skipped": skipped}
+
+    @staticmethod
+    def get_job(job_id, user_id):
+        job = IngestionJobMapper.get_job(job_id)
+        if not job or job.user_id != user_id:
+            return None
+        return job.to_dict()
+
+    @staticmethod
+    def get_jobs(user_id, vector_db_id=None, status=None, batch_id=None):
+        jobs = IngestionJobMapper.get_jobs(user_id, vector_db_id, status, batch_id=batch_id)
+        return [job.to_dict() for job in jobs]
+
+    @staticmethod
+    def cancel_job(job_id, user_id):
+        job = IngestionJobMapper.get_job(job_id)
+        if not job or job.user_id != user_id:
+            return None
+        if job.status not in ('pending', 'running'):
+            raise ValueError(f"任务状态为 {job.status}，无法取消")
+        with IngestionService._lock:
+            IngestionService._cancel_requested.add(job_id)
+        # 排队中的任务直接标记取消，执行中的任务在下一个批次边界退出
+        if job.status == 'pending':
+            job = IngestionJobMapper.update_job(job_id, status='cancelled', stage='cancelled')
+            IngestionService._emit(job)
+        return job.to_dict()
+
+    @staticmethod
+    def retry_job(job_id, user_id):
+        job = IngestionJobMapper.get_job(job_id)
+        if not job or job.user_id != user_id:
+            return None
+        with IngestionService._lock:
+            active = job_id in IngestionService._active
+        if active or (job.status not in RETRYABLE_STATUSES and job.status not in ('pending', 'running')):
+            raise ValueError(f"任务状态为 {job.status}，无法重试")
+        # running 任务只有租约过期（执行进程已退出）时才允许接管
+        if job.status == 'running' and not IngestionJobMapper.release_stale_jobs(job_id):
+            raise ValueError("任务正在其他进程中执行，无法重试")
+        if not job.save_path or not os.path.exists(job.save_path):
+            raise ValueError("待处理文件已不存在，请重新上传")
+        job = IngestionJobMapper.update_job(job_id, status='pending', progress=0, stage=None, error=None)
+        IngestionService._enqueue(job_id)
+        return job.to_dict()
+
+    @staticmethod
+    def _enqueue(job_id):
+        if IngestionService._executor is None:
+            raise Exception("入库任务线程池未初始化")
+        with IngestionService._lock:
+            IngestionService._active.add(job_id)
+            IngestionService._cancel_requested.discard(job_id)
+        IngestionService._executor.submit(IngestionService._run_job, job_id)
+
+    @staticmethod
+    def _enqueue_bulk(job_ids):
+        if IngestionService._executor is None:
+            raise Exception("入库任务线程池未初始化")
+        with IngestionService._lock:
+            IngestionService._active.update(job_ids)
+            IngestionService._cancel_requested.difference_update(job_ids)
+        IngestionService._executor.submit(IngestionService._run_bulk, job_ids)
+
+    @staticmethod
+    def _emit(job):
+        if IngestionService._socketio is None or job is None:
+            return
+        try:
+            IngestionService._socketio.emit('ingestion_progress', job.to_dict(), to=f"user_{job.user_id}")
+        except Exception as e:
+            logger.warning(f"推送入库进度失败: {str(e)}")
+
+    @staticmethod
+    def _run_job(job_id):
+        with IngestionService._app.app_context():
+            try:
+                IngestionService._process(job_id)
+            except Exception as e:
+                logger.error(f"入库任务 {job_id} 异常: {str(e)}", exc_info=True)
+            finally:
+                with IngestionService._lock:
+                    IngestionService._active.discard(job_id)
+                    IngestionService._cancel_requested.discard(job_id)
+
+    @staticmethod
+    def _process(job_id):
+        # 条件更新领取任务，避免同一任务被重复执行（如重试与启动恢复同时入队）
+        if not IngestionJobMapper.claim_job(job_id, WORKER_ID):
+            return
+        job = IngestionJobMapper.get_job(job_id)
+        IngestionService._emit(job)
+        last_persisted = {"progress": 0, "stage": "preparing"}
+        heartbeat = IngestionService._heartbeat([job_id])
+
+        def on_progress(progress, stage):
+            heartbeat()
+            if progress - last_persisted["progress"] < PROGRESS_PERSIST_STEP and stage == last_persisted["stage"]:
+                return
+            last_persisted.update(progress=progress, stage=stage)
+            IngestionService._emit(IngestionJobMapper.update_job(job_id, progress=progress, stage=stage))
+
+        def is_cancelled():
+            with IngestionService._lock:
+                return job_id in IngestionService._cancel_requested
+
+        try:
+            document_id = VectorService.ingest_file(
+                job.vector_db_id, job.save_path, job.save_name, job.file_name, job.user_id, job.describe,
+                progress_callback=on_progress,
+                cancel_check=is_cancelled,
+                keep_file_on_error=True
+            )
+            job = IngestionJobMapper.update_job(job_id, status='completed', progress=100, stage='completed',
+                                                document_id=document_id, save_path=None)
+        except IngestionCancelled:
+            job = IngestionJobMapper.update_job(job_id, status='cancelled', stage='cancelled')
+        except Exception as e:
+            job = IngestionJobMapper.update_job(job_id, status='failed', error=str(e))
+        IngestionService._emit(job)
+
+    @staticmethod
+    def _heartbeat(job_ids):
+        """返回续约函数：在进度回调中调用，每 1/3 租约时长最多续约一次"""
+        interval = Config.INGESTION_LEASE_SECONDS / 3
+        last = {"at": time.monotonic()}
+
+        def beat():
+            now = time.monotonic()
+            if now - last["at"] < interval:
+                return
+            last["at"] = now
+            try:
+                IngestionJobMapper.heartbeat_jobs(job_ids, WORKER_ID)
+            except Exception as e:
+                logger.warning(f"入库任务续约失败: {str(e)}")
+        return beat
+
+    @staticmethod
+    def _run_bulk(job_ids):
+        with IngestionService._app.app_context():
+            try:
+                IngestionService._process_bulk(job_ids)
+            except Exception as e:
+                logger.error(f"批量入库任务 {job_ids[0]}.. 异常: {str(e)}", exc_info=True)
+                for job_id in job_ids:
+                    job = IngestionJobMapper.get_job(job_id)
+                    if job and job.status == 'running':
+                        IngestionService._emit(IngestionJobMapper.update_job(job_id, status='failed', error=str(e)))
+            finally:
+                with IngestionService._lock:
+                    IngestionService._active.difference_update(job_ids)
+                    IngestionService._cancel_requested.difference_update(job_ids)
+
+    @staticmethod
+    def _process_bulk(job_ids):
+        entries = []
+        first = None
+        for job_id in job_ids:
+            if not IngestionJobMapper.claim_job(job_id, WORKER_ID):
+                continue
+            job = IngestionJobMapper.get_job(job_id)
+            first = first or job
+            IngestionService._emit(job)
+            entries.append({"key": job.id, "save_path": job.save_path, "save_name": job.save_name,
+                            "file_name": job.file_name})
+        if not entries:
+            return
+        heartbeat = IngestionService._heartbeat([entry["key"] for entry in entries])
+
+        def on_progress(job_id, progress, stage):
+            heartbeat()
+            IngestionService._emit(IngestionJobMapper.update_job(job_id, progress=progress, stage=stage))
+
+        def on_result(job_id, document_id, error):
+            if error is None:
+                job = IngestionJobMapper.update_job(job_id, status='completed', progress=100, stage='completed',
+                                                    document_id=document_id, save_path=None)
+            elif isinstance(error, IngestionCancelled):
+                job = IngestionJobMapper.update_job(job_id, status='cancelled', stage='cancelled')
+            else:
+                job = IngestionJobMapper.update_job(job_id, status='failed', error=str(error))
+            IngestionService._emit(job)
+
+        def is_cancelled(job_id):
+            with IngestionService._lock:
+                return job_id in IngestionService._cancel_requested
+
+        # 同一批次的文件属于同一用户和向量库
+        VectorService.ingest_bulk(first.vector_db_id, entries, first.user_id, first.describe,
+                                  on_result, progress_callback=on_progress, cancel_check=is_cancelled)
@@ -1,6 +1,8 @@
 from app.mapper import ModelMapper
 from app.mapper import UserMapper
+from app.utils.CatalogCache import catalog_cache, MODEL_CONFIG_NAMESPACE
 from flask import request
+from werkzeug.http import http_date
 
 
 class ModelService:
@@ -42,29 +44,44 @@ class ModelService:
 
     # 获取所有公开模型配置
     @staticmethod
-    def get_public_config():
-        try:
-            config_list = ModelMapper.get_all_public_model_config()
-            model_config_list = []
-            for config in config_list:
-                user_id = config.user_id
-                user = UserMapper.get_user_by_id(user_id)
-
-                base_model_id = config.base_model_id
-                base_model = ModelMapper.get_model_info_by_id(base_model_id)
+    def get_public_config(page: int | None = None, page_size: int = 20):
+        """
+        公开模型配置列表（作者名、基础模型名在同一查询中关联），结果按版本缓存，模型配置变更后失效
+        :param page: 页码，为空时返回全部配置的列表
+        :return: page 为空时返回列表，否则返回 {"items": [...], "pagination": {...}}
+        """
+        def load():
+            offset = (page - 1) * page_size if page else None
+            rows = ModelMapper.get_public_model_config_page(offset, page_size if page else None)
+            model_config_list = [
+                {
+                    "id": row.id,
+                    "name": row.name,
+                    "author": row.author,
+                    "base_model_name": row.base_model_name,
+                    "share_id": row.share_id,
+                    "describe": row.describe,
+                    # 与 jsonify 序列化 datetime 的格式一致，缓存中直接保存字符串
+                    "update_at": http_date(row.update_at) if row.update_at else None
+                }
+                for row in rows
+            ]
+            if not page:
+                return model_config_list
+            total = ModelMapper.count_public_model_config()
+            return {
+                "items": model_config_list,
+                "pagination": {
+                    "page": page,
+                    "page_size": page_size,
+                    "total": total,
+                    "total_pages": (total + page_size - 1) // page_size
+                }
+            }
 
-                model_config_list.append(
-                    {
-                        "id": config.id,
-                        "name": config.name,
-                        "author": user.name,
-                        "base_model_name": base_model.model_name,
-                        "share_id": config.share_id,
-                        "describe": config.describe,
-                        "update_at": config.update_at
-                    }
-                )
-            return model_config_list
+        try:
+            key = f"page:{page}:{page_size}" if page else "all"
+            return catalog_cache.get_or_load(MODEL_CONFIG_NAMESPACE, key, load)
         except Exception as e:
             raise Exception({'code': 500, 'msg': "获取公共配置失败"+str(e)})
 
@@ -2,7 +2,7 @@ from app.mapper import OllamaModelMapper
 from app.mapper import UserMapper
 from flask import request
 
-from app.models.ollama_model_config import OllamaModelConfig
+from app.utils.CatalogCache import catalog_cache, OLLAMA_MODEL_NAMESPACE
 
 
 class OllamaModelService:
@@ -10,22 +10,42 @@ class OllamaModelService:
 
     # 获取info列表
     @staticmethod
-    def get_all_info(user_id):
+    def get_all_info(user_id, page: int | None = None, page_size: int = 20):
+        """
+        基础模型列表及当前用户在每个模型下的配置（配置一次查询后按模型分组），结果按版本缓存
+        :param page: 页码，为空时返回全部模型的列表
+        :return: page 为空时返回列表，否则返回 {"items": [...], "pagination": {...}}
+        """
+        def load():
+            offset = (page - 1) * page_size if page else None
+            info_list = OllamaModelMapper.get_model_info_page(offset, page_size if page else None)
+            configs_by_info = OllamaModelMapper.get_user_configs_by_base_models(user_id, [info.id for info in info_list])
+            model_info_list = [
+                {
+                    "id": info.id,
+                    "model_name": info.model_name,
+                    "supplier": info.model_supplier,
+                    "describe": info.describe,
+                    "model_configs": [modelConfig.to_dict() for modelConfig in configs_by_info[info.id]]
+                }
+                for info in info_list
+            ]
+            if not page:
+                return model_info_list
+            total = OllamaModelMapper.count_model_info()
+            return {
+                "items": model_info_list,
+                "pagination": {
+                    "page": page,
+                    "page_size": page_size,
+                    "total": total,
+                    "total_pages": (total + page_size - 1) // page_size
+                }
+            }
+
         try:
-            info_list = OllamaModelMapper.get_all_model_info()
-            model_info_list = []
-            for info in info_list:
-                modelConfigs = OllamaModelConfig.query.filter_by(base_model_id=info.id, user_id=user_id).all()
-                model_info_list.append(
-                    {
-                        "id": info.id,
-                        "model_name": info.model_name,
-                        "supplier": info.model_supplier,
-                        "describe": info.describe,
-                        "model_configs": [modelConfig.to_dict() for modelConfig in modelConfigs]
-                    }
-                )
-            return model_info_list
+            key = f"user:{user_id}:page:{page}:{page_size}" if page else f"user:{user_id}:all"
+            return catalog_cache.get_or_load(OLLAMA_MODEL_NAMESPACE, key, load)
         except Exception as e:
             raise Exception({'code': 500, 'msg': "获取info列表失败" + str(e)})
 
@@ -1,7 +1,13 @@
+import logging
+
 from app.mapper import UserMapper, ModelMapper, VectorMapper
 from app.services import ModelService
 from app.services.VectorService import VectorService
 from app.utils import JwtUtil
+from app.utils.LoginLimiter import login_limiter
+from app.utils.PasswordHasher import PasswordHasherBusy
+
+logger = logging.getLogger("UserService")
 
 
 class UserService:
@@ -25,11 +31,24 @@ class UserService:
             raise Exception({'code': 500, 'msg': "注册失败"+str(e)})
 
     @staticmethod
-    def login(email, password):
+    def login(email, password, ip=None):
+        # 准入限制在查库和校验密码之前，登录风暴只影响登录接口
+        retry_after = login_limiter.acquire(email, ip)
+        if retry_after:
+            raise Exception({'code': 429, 'msg': f"登录尝试过于频繁，请 {retry_after} 秒后再试"})
         user = UserMapper.get_user_by_email(email)
         if not user:
             raise Exception({'code': 404, 'msg': "用户不存在"})
-        if JwtUtil.authenticate_user(user, email, password):
+        try:
+            verified, new_hash = JwtUtil.verify_password_and_update(password, user.password)
+        except PasswordHasherBusy as e:
+            raise Exception({'code': 503, 'msg': str(e)})
+        if verified:
+            if new_hash:
+                try:
+                    UserMapper.update_password_hash(user.id, new_hash)
+                except Exception as e:
+                    logger.warning(f"用户 {user.id} 密码重新哈希失败: {str(e)}")
             token = JwtUtil.generate_jwt(user.id, user.name, user.email, user.type)
             return {
                 "id": user.id,
@@ -42,6 +61,10 @@ class UserService:
         else:
             raise Exception({'code': 401, 'msg': "密码错误"})
 
+    @staticmethod
+    def logout(token):
+        JwtUtil.revoke_jwt(token)
+
     @staticmethod
     def get_user_by_email(user_email):
         user = UserMapper.get_user_info(user_email)
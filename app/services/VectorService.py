@@ -1,9 +1,13 @@
 # app/services/VectorService.py
 from app.mapper import VectorMapper, ModelMapper
 from app.utils.TransUtil import get_embedding
-from app.utils.chromadb_utils import get_chromadb_client
+from app.utils.chromadb_utils import get_chromadb_client, chroma_manager, collection_name_of, is_connection_error
+from app.utils.LocalVectorIndex import local_index_manager
+from app.utils.LexicalIndex import lexical_index_manager, reciprocal_rank_fusion
+from app.utils.DocumentStream import iter_document_nodes, parse_document, CHUNK_HASH_KEY
+from app.config import Config
 from app.utils.EmbbedingModel import ChatEmbeddings
-from app.utils.file_utils import save_uploaded_file
+from app.utils.file_utils import save_uploaded_file, file_sha256
 from app.models.vector_db import VectorDb
 from app.models.document import Document
 from app.extensions import db
@@ -12,15 +16,23 @@ import chromadb.errors  # 新增导入
 import logging
 import os
 import uuid
-import shutil
 import asyncio
 import time
+import threading
+import multiprocessing
+import tarfile
+import zipfile
+from collections import OrderedDict, deque
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
 from llama_index.core import (
-    SimpleDirectoryReader,
     VectorStoreIndex,
     StorageContext, load_index_from_storage
 )
 from llama_index.core.node_parser import SimpleNodeParser
+from llama_index.core.schema import MetadataMode
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from app.models.model_info import ModelInfo
 
@@ -30,8 +42,55 @@ logger = logging.getLogger("VectorService")
 
 MAX_RETRIES = 5
 RETRY_DELAY = 2
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB文件大小限制
+MAX_FILE_SIZE = Config.MAX_UPLOAD_SIZE_MB * 1024 * 1024  # 上传文件大小限制
+UPLOAD_COPY_BUFFER = 1024 * 1024  # 保存上传文件时每次复制的字节数
 BASE_DOCS_DIR = os.path.join("data", "vector_docs")  # 文档存储基础目录（跨平台路径）
+INGEST_NODE_BATCH = 64  # 每批写入向量存储的节点数，批次之间汇报进度、检查取消
+LEXICAL_SEGMENT_NODES = 1024  # 每个 BM25 段文件最多包含的分块数
+CHROMA_DELETE_BATCH = 1000  # 按 id 删除时每次请求的条数
+LOCAL_SNAPSHOT_BATCH = 1000  # 从 ChromaDB 构建本地索引时每次读取的条数
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+DOCUMENT_METADATA_KEYS = ("document_id", "original_name")  # 入库时写入分块元数据的文档信息
+DOCUMENT_CACHE_SIZE = 1024  # 文件名 -> (文档ID, 原始文件名) 缓存条数
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# 压缩包中只入库这些类型的文件，其余（图片、可执行文件等）跳过
+BULK_FILE_EXTENSIONS = (".pdf", ".docx", ".pptx", ".txt", ".text", ".md", ".markdown", ".rst", ".log",
+                        ".csv", ".json", ".html", ".htm", ".epub", ".ipynb")
+
+_document_cache = OrderedDict()
+_document_cache_lock = threading.Lock()
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
+
+
+def is_archive(file_name):
+    return file_name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _get_parse_executor():
+    """解析进程池（spawn 启动，子进程不继承 Flask、数据库和 Redis 连接）"""
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ProcessPoolExecutor(
+                max_workers=Config.INGESTION_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_executor
+
+
+def _reset_parse_executor(executor):
+    """子进程异常退出后进程池不可再用，丢弃后下次重建（已被替换时不重复处理）"""
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            _parse_executor = None
+
+
+class IngestionCancelled(Exception):
+    """文件入库任务被取消"""
 
 
 class VectorService:
@@ -48,7 +107,7 @@ class VectorService:
             logger.error(f"未找到向量数据库: {vector_db_id}")
             return False
 
-        collection_name = f"vector_db_{vector_db_id}"
+        collection_name = collection_name_of(vector_db_id)
         retries = 0
 
         # 准备集合配置
@@ -78,6 +137,7 @@ class VectorService:
                 # 尝试直接传递distance参数（如果ChromaDB支持）
                 try:
                     collection = client.create_collection(**collection_kwargs)
+                    chroma_manager.cache_collection(collection_name, collection)
                     # 如果创建成功，尝试设置distance（某些版本可能需要通过其他方式设置）
                     logger.info(f"成功创建集合: {collection_name}, distance: {distance}")
                 except TypeError:
@@ -86,6 +146,7 @@ class VectorService:
                         collection = client.create_collection(name=collection_name, metadata=metadata)
                     else:
                         collection = client.create_collection(name=collection_name)
+                    chroma_manager.cache_collection(collection_name, collection)
                     logger.info(f"成功创建集合: {collection_name} (使用默认distance)")
                 
                 return True
@@ -121,59 +182,16 @@ class VectorService:
         success = await VectorService.create_chroma_collection(vector_db.id)
         if not success:
             logger.error(f"无法为向量数据库 {vector_db.id} 创建ChromaDB集合")
+        else:
+            # 新向量库的 BM25 索引从一开始就是完整的，检索时不需要从 ChromaDB 补建
+            lexical_index_manager.mark_complete(vector_db.id)
 
         return vector_db
 
     @staticmethod
     def ensure_collection_exists(vector_db_id):
-        client = get_chromadb_client()
-        if not client:
-            logger.error("无法获取 ChromaDB 客户端")
-            return False
-
-        collection_name = f"vector_db_{vector_db_id}"
-        try:
-            client.get_collection(name=collection_name)
-            return True
-        except (ValueError, chromadb.errors.NotFoundError):  # 修改异常类型
-            try:
-                # 获取向量数据库配置
-                vector_db = VectorMapper.get_vector_db(vector_db_id)
-                if vector_db:
-                    metadata = {}
-                    if vector_db.collection_metadata:  # 使用collection_metadata字段
-                        try:
-                            import json
-                            metadata = json.loads(vector_db.collection_metadata)
-                            if not isinstance(metadata, dict):
-                                metadata = {}
-                        except:
-                            metadata = {}
-                    
-                    collection_kwargs = {
-                        'name': collection_name,
-                    }
-                    if metadata:
-                        collection_kwargs['metadata'] = metadata
-                    
-                    try:
-                        client.create_collection(**collection_kwargs)
-                    except TypeError:
-                        # 只有当metadata不为空时才传递metadata参数
-                        if metadata:
-                            client.create_collection(name=collection_name, metadata=metadata)
-                        else:
-                            client.create_collection(name=collection_name)
-                else:
-                    client.create_collection(name=collection_name)
-                logger.info(f"同步创建集合: {collection_name}")
-                return True
-            except Exception as e:
-                logger.error(f"同步创建集合失败: {str(e)}")
-                return False
-        except Exception as e:
-            logger.error(f"集合检查异常: {str(e)}")
-            return False
+        """确保集合存在，集合句柄由 chroma_manager 缓存，命中缓存时无网络开销"""
+        return VectorService.get_chroma_collection(vector_db_id) is not None
 
     @staticmethod
     def get_vector_db(vector_db_id):
@@ -198,12 +216,12 @@ class VectorService:
         if not vector_db:
             return None
         
-        # 查询文档总数
-        total = Document.query.filter_by(vector_db_id=vector_db_id).count()
+        # 查询文档总数（入库中的文档不列出）
+        total = Document.query.filter_by(vector_db_id=vector_db_id, status='ready').count()
         
         # 分页查询文档
         offset = (page - 1) * page_size
-        documents = Document.query.filter_by(vector_db_id=vector_db_id)\
+        documents = Document.query.filter_by(vector_db_id=vector_db_id, status='ready')\
             .order_by(Document.upload_at.desc())\
             .offset(offset)\
             .limit(page_size)\
@@ -241,30 +259,26 @@ class VectorService:
         if result:
             try:
                 # 删除 ChromDB 集合
+                chroma_manager.invalidate_collection(collection_name_of(vector_db_id))
                 client = get_chromadb_client()
-                client.delete_collection(name=f"vector_db_{vector_db_id}")
+                client.delete_collection(name=collection_name_of(vector_db_id))
                 logger.info(f"已删除ChromaDB集合: vector_db_{vector_db_id}")
             except ValueError:
                 logger.warning(f"ChromaDB 集合 {f'vector_db_{vector_db_id}'} 不存在，无需删除。")
             except Exception as e:
                 logger.error(f"删除集合失败: {str(e)}", exc_info=True)
+            local_index_manager.drop(vector_db_id)
+            lexical_index_manager.drop(vector_db_id)
         return result
 
     @staticmethod
     def insert_vectors(vector_db_id, vectors, metadatas=None, ids=None):
         """插入向量到集合，确保集合存在"""
-        # 确保集合存在
-        if not VectorService.ensure_collection_exists(vector_db_id):
-            logger.error(f"无法确保集合存在: vector_db_{vector_db_id}")
-            return False
-
-        client = get_chromadb_client()
-        collection_name = f"vector_db_{vector_db_id}"
-
-        try:
-            collection = client.get_collection(name=collection_name)
-        except Exception as e:
-            logger.error(f"获取集合失败: {str(e)}")
+        # 确保集合存在（一次获取，复用缓存的集合句柄）
+        collection_name = collection_name_of(vector_db_id)
+        collection = VectorService.get_chroma_collection(vector_db_id)
+        if collection is None:
+            logger.error(f"无法确保集合存在: {collection_name}")
             return False
 
         # 确保ids不为None且长度匹配
@@ -287,6 +301,8 @@ class VectorService:
                     metadatas=batch_metadatas,
                     ids=batch_ids
                 )
+                local_index_manager.add(vector_db_id, batch_ids, batch_vectors, [""] * len(batch_ids),
+                                        batch_metadatas or [{}] * len(batch_ids))
 
             logger.info(f"成功插入{len(vectors)}个向量到集合{collection_name}")
             return True
@@ -296,16 +312,16 @@ class VectorService:
 
     @staticmethod
     def get_chroma_collection(vector_db_id):
-        """获取 ChromaDB 集合对象，如果不存在则创建"""
+        """获取 ChromaDB 集合对象，如果不存在则创建（集合句柄由 chroma_manager 缓存）"""
         client = get_chromadb_client()
         if not client:
             logger.error("无法获取 ChromaDB 客户端")
             return None
 
-        collection_name = f"vector_db_{vector_db_id}"
+        collection_name = collection_name_of(vector_db_id)
         try:
-            # 尝试获取集合
-            collection = client.get_collection(name=collection_name)
+            # 尝试获取集合（优先命中缓存）
+            collection = chroma_manager.get_collection(collection_name)
             return collection
         except (ValueError, chromadb.errors.NotFoundError) as e:
             # 集合不存在，尝试创建
@@ -337,13 +353,14 @@ class VectorService:
                             collection = client.create_collection(
                                 name=collection_name
                             )
+                        chroma_manager.cache_collection(collection_name, collection)
                         logger.info(f"成功创建集合: {collection_name}")
                         return collection
                     except chromadb.errors.ChromaError as create_error:
                         # 如果集合已存在（并发创建），尝试再次获取
                         if "already exists" in str(create_error).lower():
                             try:
-                                collection = client.get_collection(name=collection_name)
+                                collection = chroma_manager.get_collection(collection_name)
                                 logger.info(f"集合已存在，获取成功: {collection_name}")
                                 return collection
                             except Exception as get_error:
@@ -358,6 +375,7 @@ class VectorService:
                 else:
                     # 如果没有配置，使用默认配置创建
                     collection = client.create_collection(name=collection_name)
+                    chroma_manager.cache_collection(collection_name, collection)
                     logger.info(f"使用默认配置创建集合: {collection_name}")
                     return collection
             except Exception as create_error:
@@ -365,38 +383,139 @@ class VectorService:
                 return None
         except Exception as e:
             logger.error(f"获取集合失败: {str(e)}")
+            if is_connection_error(e):
+                chroma_manager.mark_unhealthy(client)
             return None
 
     @staticmethod
-    def upload_file(vector_db_id, file, user_id, describe):  # 添加 user_id 参数
-        """上传文件并处理为向量存储 (使用 LlamaIndex + ChromaDB)"""
+    def save_upload(vector_db_id, file):
+        """
+        保存上传的文件到向量数据库目录
+        :return: (原始文件名, 唯一文件名, 保存路径)
+        """
         filename = getattr(file, 'filename', 'unknown')
-        logger.info(f"开始上传文件到向量数据库 {vector_db_id}: {filename}")
-
-        # 1. 保存文件到指定目录
         vector_db_dir = os.path.join(BASE_DOCS_DIR, f"vector_db_{vector_db_id}")
         os.makedirs(vector_db_dir, exist_ok=True)  # 确保目录存在
 
         # 生成唯一文件名
         unique_filename = f"{uuid.uuid4().hex}_{filename}"
         save_path = os.path.join(vector_db_dir, unique_filename)
-        file_saved = False  # 文件保存状态标志
 
+        # 分块复制上传流，超过大小限制时中止并删除已写入的部分
+        source = getattr(file, 'stream', file)
+        written = 0
+        try:
+            with open(save_path, 'wb') as f:
+                while True:
+                    chunk = source.read(UPLOAD_COPY_BUFFER)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > MAX_FILE_SIZE:
+                        raise ValueError(f"文件 {filename} 超过大小限制 {Config.MAX_UPLOAD_SIZE_MB}MB")
+                    f.write(chunk)
+        except Exception:
+            if os.path.exists(save_path):
+                os.remove(save_path)
+            raise
+
+        logger.info(f"文件保存成功: {save_path}（{written} 字节）")
+        return filename, unique_filename, save_path
+
+    @staticmethod
+    def _iter_archive_members(archive_path):
+        """逐个产出压缩包中的普通文件 (成员路径, 打开函数)，跳过目录和链接"""
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir():
+                        yield info.filename, lambda info=info: zf.open(info)
+        else:
+            with tarfile.open(archive_path, "r:*") as tf:
+                for member in tf:
+                    if member.isfile():
+                        yield member.name, lambda member=member: tf.extractfile(member)
+
+    @staticmethod
+    def extract_archive(vector_db_id, file):
+        """
+        保存并解压 zip/tar 压缩包，每个成员文件按 save_upload 的方式保存（同样受单文件大小限制）
+        成员路径只取文件名，原始路径作为显示名；解压总量和文件数超过限制时整体失败
+        :return: ([(原始文件名, 唯一文件名, 保存路径)], [跳过的成员路径])
+        """
+        archive_name, _, archive_path = VectorService.save_upload(vector_db_id, file)
+        saved, skipped = [], []
+        total = 0
         try:
-            # 保存上传的文件
-            if hasattr(file, 'save'):
-                file.save(save_path)
-            elif hasattr(file, 'write'):
-                with open(save_path, 'wb') as f:
-                    f.write(file.read())
-            else:
-                with open(save_path, 'wb') as f:
-                    shutil.copyfileobj(file, f)
-
-            file_saved = True  # 标记文件已成功保存
-            logger.info(f"文件保存成功: {save_path}")
-
-            # 2. 使用 LlamaIndex 处理文件
+            try:
+                for member_name, open_member in VectorService._iter_archive_members(archive_path):
+                    base_name = os.path.basename(member_name)
+                    if (not base_name or base_name.startswith(".") or "__MACOSX" in member_name
+                            or os.path.splitext(base_name)[1].lower() not in BULK_FILE_EXTENSIONS):
+                        skipped.append(member_name)
+                        continue
+                    if len(saved) >= Config.BULK_MAX_FILES:
+                        raise ValueError(f"压缩包 {archive_name} 中的文件超过 {Config.BULK_MAX_FILES} 个")
+                    with open_member() as stream:
+                        _, unique_filename, save_path = VectorService.save_upload(
+                            vector_db_id, SimpleNamespace(filename=base_name, stream=stream))
+                    saved.append((member_name[-255:], unique_filename, save_path))
+                    # 按实际写入的字节数累计，不信任压缩包头中声明的大小
+                    total += os.path.getsize(save_path)
+                    if total > Config.BULK_MAX_TOTAL_MB * 1024 * 1024:
+                        raise ValueError(f"压缩包 {archive_name} 解压后超过 {Config.BULK_MAX_TOTAL_MB}MB")
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                raise ValueError(f"无法解析压缩包 {archive_name}: {str(e)}")
+        except Exception:
+            for _, _, save_path in saved:
+                if os.path.exists(save_path):
+                    os.remove(save_path)
+            raise
+        finally:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+        logger.info(f"压缩包 {archive_name} 解压完成：{len(saved)} 个文件，跳过 {len(skipped)} 个")
+        return saved, skipped
+
+    @staticmethod
+    def upload_file(vector_db_id, file, user_id, describe):  # 添加 user_id 参数
+        """上传文件并处理为向量存储 (使用 LlamaIndex + ChromaDB)"""
+        filename = getattr(file, 'filename', 'unknown')
+        logger.info(f"开始上传文件到向量数据库 {vector_db_id}: {filename}")
+
+        try:
+            filename, unique_filename, save_path = VectorService.save_upload(vector_db_id, file)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"文件保存失败: {str(e)}", exc_info=True)
+            raise Exception(f"文件处理失败: {str(e)}")
+
+        return VectorService.ingest_file(vector_db_id, save_path, unique_filename, filename, user_id, describe)
+
+    @staticmethod
+    def ingest_file(vector_db_id, save_path, unique_filename, filename, user_id, describe,
+                    progress_callback=None, cancel_check=None, keep_file_on_error=False):
+        """
+        将已保存的文件解析、分块、嵌入并写入 ChromaDB，最后保存 Document 记录
+        :param progress_callback: 进度回调 progress_callback(百分比, 阶段说明)
+        :param cancel_check: 返回 True 时中止处理并抛出 IngestionCancelled
+        :param keep_file_on_error: 失败时保留已保存的文件（供任务重试使用）
+        :return: 文档ID
+        """
+        def report(progress, stage):
+            if progress_callback:
+                progress_callback(progress, stage)
+
+        def check_cancel():
+            if cancel_check and cancel_check():
+                raise IngestionCancelled(f"文件处理已取消: {filename}")
+
+        chroma_collection = None
+        document_id = None
+        try:
+            check_cancel()
+            report(5, "preparing")
             # 获取 ChromaDB 集合
             chroma_collection = VectorService.get_chroma_collection(vector_db_id)
             if not chroma_collection:
@@ -411,17 +530,13 @@ class VectorService:
             vector_db = VectorMapper.get_vector_db(vector_db_id)
             if not vector_db:
                 raise Exception("向量数据库不存在")
-            
+
             # 初始化嵌入模型
             model_info_id = vector_db.embedding_id
             if not model_info_id:
                 raise Exception("模型配置ID为空")
             embedding_model = get_embedding(model_info_id)
 
-            # 读取并处理文件
-            documents = SimpleDirectoryReader(input_files=[save_path]).load_data()
-            logger.info(f"成功加载 {len(documents)} 个文档片段")
-            
             # 使用配置的chunk_size和chunk_overlap创建节点解析器
             chunk_size = vector_db.chunk_size or 1024
             chunk_overlap = vector_db.chunk_overlap or 200
@@ -429,78 +544,711 @@ class VectorService:
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap
             )
-            
-            # 创建索引并存储，使用节点解析器
-            logger.info(f"开始创建向量索引，文档数量: {len(documents)}")
-            index = VectorStoreIndex.from_documents(
-                documents=documents,
+
+            # 解析之前先做重复检测：内容完全相同的文件直接返回已有文档；
+            # 同一向量库中已有同名文档时视为新版本，增量更新（只嵌入变化的分块）
+            content_hash = file_sha256(save_path)
+            if Config.INGEST_DEDUP_ENABLED:
+                duplicate = VectorService._find_duplicate(vector_db_id, content_hash, unique_filename)
+                if duplicate is not None:
+                    logger.info(f"{filename} 与已有文档 {duplicate.id}（{duplicate.original_name}）内容相同，跳过入库")
+                    if os.path.exists(save_path):
+                        os.remove(save_path)
+                    report(100, "completed")
+                    return duplicate.id
+                previous = VectorService._find_previous_version(vector_db_id, filename, unique_filename)
+                if previous is not None:
+                    return VectorService._reindex_document(
+                        previous, save_path, content_hash, describe, chroma_collection,
+                        VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embedding_model),
+                        embedding_model, node_parser, report, check_cancel
+                    )
+
+            # 先保存文档记录：分块元数据携带 document_id 与 original_name，检索结果无需再查库
+            document = VectorService._prepare_document(vector_db_id, save_path, unique_filename, filename,
+                                                       user_id, describe, chroma_collection, content_hash)
+            document_id = document.id
+
+            # 流式解析：逐页/逐块读取并增量分块，每攒够一批节点就嵌入并写入向量存储，
+            # BM25 段按 LEXICAL_SEGMENT_NODES 分段写入，内存中只保留当前批次
+            report(10, "indexing")
+            index = VectorStoreIndex(
+                nodes=[],
                 storage_context=storage_context,
-                embed_model=embedding_model,
-                node_parser=node_parser
-            )
-            logger.info("向量索引创建完成")
-            nodes = storage_context.docstore.docs
-            logger.info(f"生成的节点数量: {len(nodes)}")
-            for node_id, node in nodes.items():
-                print(f"Node ID: {node_id}")
-                print(f"Content: {node.text}")  # 文本内容
-                print(f"Metadata: {node.metadata}")  # 元数据
-                print("---")
-
-            # 3. 保存文档信息到数据库
-            logger.info("开始保存文档信息到数据库")
-            file_extension = os.path.splitext(filename)[1]
-            file_type = file_extension[1:] if file_extension else "unknown"
-            
-            # 获取文件大小（如果文件已被删除，使用之前保存的大小）
-            try:
-                file_size = os.path.getsize(save_path) if os.path.exists(save_path) else 0
-            except:
-                file_size = 0
-
-            logger.info(f"准备保存文档信息到数据库: {filename}, 类型: {file_type}, 大小: {file_size}")
-            document = Document(
-                user_id=user_id,  # 使用传入的用户ID
-                vector_db_id=vector_db_id,
-                name=unique_filename,
-                describe=describe if describe else None,  # 确保空字符串转为None
-                original_name=filename,
-                type=file_type,
-                size=file_size,
-                save_path=save_path,
+                embed_model=embedding_model
             )
+            # document_id / original_name 只用于检索结果展示，不参与嵌入和提示词
+            nodes = iter_document_nodes(save_path, node_parser,
+                                        {"document_id": document_id, "original_name": filename},
+                                        DOCUMENT_METADATA_KEYS)
+            batch = []
+            lexical_batch = ([], [], [])
+            state = {"lexical_part": 0, "nodes": 0}
+            heartbeat = VectorService._document_heartbeat(lambda: [document_id])
 
-            db.session.add(document)
-            db.session.commit()
+            def flush(final=False):
+                check_cancel()
+                heartbeat()
+                if batch:
+                    VectorService._write_nodes(index, embedding_model, vector_db_id, batch)
+                    for item in batch:
+                        lexical_batch[0].append(item.node_id)
+                        lexical_batch[1].append(item.get_content())
+                        lexical_batch[2].append(dict(item.metadata))
+                    state["nodes"] += len(batch)
+                    batch.clear()
+                # 第 0 段总是写入，空文档也有段文件（补建时据此判断已建过）
+                if len(lexical_batch[0]) >= LEXICAL_SEGMENT_NODES or \
+                        (final and (lexical_batch[0] or state["lexical_part"] == 0)):
+                    lexical_index_manager.add_document(vector_db_id, unique_filename, *lexical_batch,
+                                                       part=state["lexical_part"])
+                    state["lexical_part"] += 1
+                    for items in lexical_batch:
+                        items.clear()
+
+            for node, progress in nodes:
+                batch.append(node)
+                if len(batch) >= INGEST_NODE_BATCH:
+                    flush()
+                    report(10 + 80 * progress, "indexing")
+            flush(final=True)
+            logger.info(f"向量索引创建完成，生成的节点数量: {state['nodes']}")
+
+            # 3. 文档信息已在开始时保存
+            check_cancel()
+            report(95, "saving")
             logger.info(f"文件信息已保存到 document 数据库，ID: {document.id}, 文档名称: {document.original_name}")
-            
-            # 向量化处理完成后，删除临时文件（改为临时存储逻辑）
-            if file_saved and os.path.exists(save_path):
-                try:
-                    os.remove(save_path)
-                    logger.info(f"向量化完成，已删除临时文件: {save_path}")
-                    # 更新文档记录，标记文件已删除
-                    document.save_path = None  # 或者设置为空字符串，表示文件已删除
-                    db.session.commit()
-                except Exception as delete_error:
-                    logger.warning(f"删除临时文件失败: {str(delete_error)}，但不影响向量数据")
-            
+
+            VectorService._finish_document(document, save_path)
+            report(100, "completed")
             return document.id  # 返回文档ID
 
         except Exception as e:
             logger.error(f"处理过程中发生错误: {str(e)}", exc_info=True)
+            VectorService._cleanup_failed_ingest(vector_db_id, chroma_collection, unique_filename, document_id,
+                                                 None if keep_file_on_error else save_path)
+            if isinstance(e, IngestionCancelled):
+                raise
+            raise Exception(f"文件处理失败: {str(e)}")
 
-            # 错误处理：清理已保存的文件
-            if file_saved and os.path.exists(save_path):
-                try:
-                    os.remove(save_path)
-                    logger.info(f"处理失败，已删除临时文件: {save_path}")
-                except Exception as delete_error:
-                    logger.error(f"删除文件失败: {str(delete_error)}")
+    @staticmethod
+    def _finish_document(document, save_path):
+        """向量化处理完成后，标记文档为 ready，删除临时文件（临时存储逻辑）并标记文档记录"""
+        document.status = 'ready'
+        db.session.commit()
+        if os.path.exists(save_path):
+            try:
+                os.remove(save_path)
+                logger.info(f"向量化完成，已删除临时文件: {save_path}")
+                # 更新文档记录，标记文件已删除
+                document.save_path = None  # 或者设置为空字符串，表示文件已删除
+                db.session.commit()
+            except Exception as delete_error:
+                logger.warning(f"删除临时文件失败: {str(delete_error)}，但不影响向量数据")
 
-            # 回滚数据库操作
-            db.session.rollback()
-            raise Exception(f"文件处理失败: {str(e)}")
+    @staticmethod
+    def _cleanup_failed_ingest(vector_db_id, chroma_collection, unique_filename, document_id, save_path=None):
+        """
+        入库失败后的清理：已写入的部分向量、本地索引、文档记录；save_path 不为空时同时删除已保存的文件
+        """
+        # 清理已写入的部分向量，避免残留孤立分块
+        if chroma_collection is not None:
+            try:
+                chroma_collection.delete(where={"file_name": unique_filename})
+            except Exception as delete_error:
+                logger.warning(f"清理集合 {collection_name_of(vector_db_id)} 中的部分向量失败: {str(delete_error)}")
+        try:
+            local_index_manager.delete_where(vector_db_id, unique_filename)
+            lexical_index_manager.delete_document(vector_db_id, unique_filename)
+        except Exception as delete_error:
+            logger.warning(f"清理本地索引中的部分向量失败: {str(delete_error)}")
+
+        # 错误处理：清理已保存的文件
+        if save_path and os.path.exists(save_path):
+            try:
+                os.remove(save_path)
+                logger.info(f"处理失败，已删除临时文件: {save_path}")
+            except Exception as delete_error:
+                logger.error(f"删除文件失败: {str(delete_error)}")
+
+        # 回滚数据库操作，并删除开始时保存的文档记录
+        db.session.rollback()
+        if document_id is not None:
+            try:
+                Document.query.filter_by(id=document_id).delete()
+                db.session.commit()
+            except Exception as delete_error:
+                db.session.rollback()
+                logger.error(f"删除文档记录 {document_id} 失败: {str(delete_error)}")
+
+    @staticmethod
+    def _find_duplicate(vector_db_id, content_hash, unique_filename):
+        """同一向量库中内容相同且已入库完成的文档"""
+        return Document.query.filter(
+            Document.vector_db_id == vector_db_id,
+            Document.content_hash == content_hash,
+            Document.name != unique_filename,
+            Document.status == 'ready'
+        ).first()
+
+    @staticmethod
+    def _find_previous_version(vector_db_id, filename, unique_filename):
+        """同一向量库中同名且已入库完成的文档（重新上传视为新版本）"""
+        return Document.query.filter(
+            Document.vector_db_id == vector_db_id,
+            Document.original_name == filename,
+            Document.name != unique_filename,
+            Document.status == 'ready'
+        ).first()
+
+    @staticmethod
+    def _existing_chunks(chroma_collection, file_name):
+        """文档现有分块 {chunk_hash: [id, ...]}，旧分块没有哈希，归入 None（全部视为过期）"""
+        chunks = {}
+        offset = 0
+        while True:
+            batch = chroma_collection.get(where={"file_name": file_name}, include=["metadatas"],
+                                          limit=LOCAL_SNAPSHOT_BATCH, offset=offset)
+            for item_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                chunks.setdefault((metadata or {}).get(CHUNK_HASH_KEY), []).append(item_id)
+            if len(batch["ids"]) < LOCAL_SNAPSHOT_BATCH:
+                return chunks
+            offset += LOCAL_SNAPSHOT_BATCH
+
+    @staticmethod
+    def _delete_chunks(vector_db_id, chroma_collection, ids):
+        for i in range(0, len(ids), CHROMA_DELETE_BATCH):
+            chroma_collection.delete(ids=ids[i:i + CHROMA_DELETE_BATCH])
+        local_index_manager.delete_ids(vector_db_id, ids)
+
+    @staticmethod
+    def _rebuild_lexical_document(vector_db_id, chroma_collection, file_name):
+        """按 ChromaDB 中的分块重写文档的 BM25 段（增量更新失败后恢复一致）"""
+        lexical_index_manager.delete_document(vector_db_id, file_name)
+        offset, part = 0, 0
+        while True:
+            batch = chroma_collection.get(where={"file_name": file_name}, include=["documents", "metadatas"],
+                                          limit=LEXICAL_SEGMENT_NODES, offset=offset)
+            if batch["ids"] or part == 0:
+                metadatas = [{key: value for key, value in (metadata or {}).items() if not key.startswith("_node")}
+                             for metadata in batch["metadatas"]]
+                lexical_index_manager.add_document(vector_db_id, file_name, batch["ids"],
+                                                   [text or "" for text in batch["documents"]], metadatas, part=part)
+                part += 1
+            if len(batch["ids"]) < LEXICAL_SEGMENT_NODES:
+                return
+            offset += LEXICAL_SEGMENT_NODES
+
+    @staticmethod
+    def _reindex_document(previous, save_path, content_hash, describe, chroma_collection, index,
+                          embedding_model, node_parser, report, check_cancel):
+        """
+        增量更新已有文档：沿用原文档记录和 file_name，
+        新版本中内容哈希与现有分块相同的分块原样保留（不嵌入、不写入），只嵌入写入新增/变化的分块，最后删除不再出现的旧分块
+        失败时删除本次新写入的分块，旧版本保持不变
+        :return: 文档ID
+        """
+        vector_db_id = previous.vector_db_id
+        existing = VectorService._existing_chunks(chroma_collection, previous.name)
+        inserted = []
+        batch = []
+        lexical_batch = ([], [], [])
+        state = {"lexical_part": 0, "reused": 0}
+
+        def flush(final=False):
+            check_cancel()
+            if batch:
+                VectorService._write_nodes(index, embedding_model, vector_db_id, batch)
+                inserted.extend(node.node_id for node in batch)
+                batch.clear()
+            if len(lexical_batch[0]) >= LEXICAL_SEGMENT_NODES or \
+                    (final and (lexical_batch[0] or state["lexical_part"] == 0)):
+                lexical_index_manager.add_document(vector_db_id, previous.name, *lexical_batch,
+                                                   part=state["lexical_part"])
+                state["lexical_part"] += 1
+                for items in lexical_batch:
+                    items.clear()
+
+        report(10, "indexing")
+        try:
+            nodes = iter_document_nodes(save_path, node_parser,
+                                        {"document_id": previous.id, "original_name": previous.original_name},
+                                        DOCUMENT_METADATA_KEYS)
+            for node, progress in nodes:
+                # 与旧版本分块使用同一 file_name，删除文档时一并删除
+                node.metadata["file_name"] = previous.name
+                same = existing.get(node.metadata[CHUNK_HASH_KEY])
+                if same:
+                    node.id_ = same.pop()
+                    state["reused"] += 1
+                else:
+                    batch.append(node)
+                lexical_batch[0].append(node.node_id)
+                lexical_batch[1].append(node.get_content())
+                lexical_batch[2].append(dict(node.metadata))
+                if len(batch) >= INGEST_NODE_BATCH or len(lexical_batch[0]) >= LEXICAL_SEGMENT_NODES:
+                    flush()
+                    report(10 + 80 * progress, "indexing")
+            flush(final=True)
+            check_cancel()
+        except Exception:
+            try:
+                if inserted:
+                    VectorService._delete_chunks(vector_db_id, chroma_collection, inserted)
+                VectorService._rebuild_lexical_document(vector_db_id, chroma_collection, previous.name)
+            except Exception as restore_error:
+                logger.error(f"恢复文档 {previous.id} 的旧版本失败: {str(restore_error)}")
+            raise
+
+        # 新版本已完整写入，删除不再出现的旧分块；失败只留下多余分块，下次更新时会被清理
+        report(95, "saving")
+        stale = [item_id for ids in existing.values() for item_id in ids]
+        try:
+            lexical_index_manager.delete_document(vector_db_id, previous.name, keep_parts=state["lexical_part"])
+            VectorService._delete_chunks(vector_db_id, chroma_collection, stale)
+        except Exception as e:
+            logger.warning(f"删除文档 {previous.id} 的过期分块失败: {str(e)}")
+
+        file_extension = os.path.splitext(previous.original_name)[1]
+        previous.type = file_extension[1:] if file_extension else "unknown"
+        previous.size = os.path.getsize(save_path)
+        previous.content_hash = content_hash
+        if describe:
+            previous.describe = describe
+        db.session.commit()
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        logger.info(f"文档 {previous.id}（{previous.original_name}）增量更新完成：复用 {state['reused']} 个分块，"
+                    f"新增 {len(inserted)} 个，删除 {len(stale)} 个")
+        report(100, "completed")
+        return previous.id
+
+    @staticmethod
+    def ingest_bulk(vector_db_id, files, user_id, describe, on_result, progress_callback=None, cancel_check=None):
+        """
+        批量入库同一向量库的多个已保存文件
+        - 解析分块在进程池中并行执行（CPU 密集），同时在途的文件数有上限，避免解析结果堆积
+        - 所有文件共用一个 VectorStoreIndex，节点跨文件凑批嵌入并写入 ChromaDB
+        - 每个文件独立成功或失败，失败的文件会清理已写入的向量和文档记录（保留已保存的文件以便重试）
+        - 文档记录在文件提交解析时才创建；超过 BULK_PARSE_MAX_FILE_MB 的文件批次结束后走流式 ingest_file
+        :param files: [{"key", "save_path", "save_name", "file_name"}]，key 由调用方定义（如任务ID）
+        :param on_result: on_result(key, document_id, error)，成功时 error 为 None
+        :param progress_callback: progress_callback(key, 百分比, 阶段)
+        :param cancel_check: cancel_check(key) 返回 True 时放弃该文件（以 IngestionCancelled 结束）
+        """
+        def report(key, progress, stage):
+            if progress_callback:
+                progress_callback(key, progress, stage)
+
+        chroma_collection = VectorService.get_chroma_collection(vector_db_id)
+        vector_db = VectorMapper.get_vector_db(vector_db_id)
+        if not chroma_collection or not vector_db or not vector_db.embedding_id:
+            error = Exception("无法获取 ChromaDB 集合" if not chroma_collection else "向量数据库不存在或未配置嵌入模型")
+            for entry in files:
+                on_result(entry["key"], None, error)
+            return
+        embedding_model = get_embedding(vector_db.embedding_id)
+        storage_context = StorageContext.from_defaults(vector_store=ChromaVectorStore(chroma_collection=chroma_collection))
+        index = VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embedding_model)
+        chunk_size = vector_db.chunk_size or 1024
+        chunk_overlap = vector_db.chunk_overlap or 200
+
+        states = {}  # key -> {"entry", "document", "remaining", "lexical"}
+
+        def fail(key, error):
+            state = states.pop(key, None)
+            if state is None:
+                return
+            if not isinstance(error, IngestionCancelled):
+                logger.error(f"批量入库文件 {state['entry']['file_name']} 失败: {str(error)}")
+            document = state["document"]
+            VectorService._cleanup_failed_ingest(vector_db_id, chroma_collection, state["entry"]["save_name"],
+                                                 document.id if document is not None else None)
+            on_result(key, None, error)
+
+        def finish(key):
+            state = states[key]
+            document = state["document"]
+            try:
+                lexical_index_manager.add_document(vector_db_id, state["entry"]["save_name"], *state["lexical"])
+                VectorService._finish_document(document, state["entry"]["save_path"])
+            except Exception as e:
+                fail(key, e)
+                return
+            states.pop(key)
+            on_result(key, document.id, None)
+
+        def check_cancel(key):
+            if key in states and cancel_check and cancel_check(key):
+                fail(key, IngestionCancelled(f"文件处理已取消: {states[key]['entry']['file_name']}"))
+            return key in states
+
+        def flush(batch):
+            alive = {key for key in {key for key, _ in batch} if check_cancel(key)}
+            batch = [(key, node) for key, node in batch if key in alive]
+            if not batch:
+                return
+            try:
+                VectorService._write_nodes(index, embedding_model, vector_db_id, [node for _, node in batch])
+            except Exception as e:
+                for key in {key for key, _ in batch}:
+                    fail(key, e)
+                return
+            for key, node in batch:
+                state = states[key]
+                state["lexical"][0].append(node.node_id)
+                state["lexical"][1].append(node.get_content())
+                state["lexical"][2].append(dict(node.metadata))
+                state["remaining"] -= 1
+            for key in {key for key, _ in batch}:
+                if states[key]["remaining"] == 0:
+                    finish(key)
+
+        queue = deque()
+        # 已有同名文档（增量更新）、与同批次文件内容相同或超过大小上限的文件，批次结束后逐个走 ingest_file
+        deferred = []
+        batch_hashes = set()
+        max_parse_size = Config.BULK_PARSE_MAX_FILE_MB * 1024 * 1024
+        for entry in files:
+            key = entry["key"]
+            try:
+                if os.path.getsize(entry["save_path"]) > max_parse_size:
+                    deferred.append(entry)
+                    continue
+                content_hash = file_sha256(entry["save_path"])
+                if Config.INGEST_DEDUP_ENABLED:
+                    duplicate = VectorService._find_duplicate(vector_db_id, content_hash, entry["save_name"])
+                    if duplicate is not None:
+                        logger.info(f"{entry['file_name']} 与已有文档 {duplicate.id} 内容相同，跳过入库")
+                        os.remove(entry["save_path"])
+                        on_result(key, duplicate.id, None)
+                        continue
+                    if content_hash in batch_hashes or VectorService._find_previous_version(
+                            vector_db_id, entry["file_name"], entry["save_name"]) is not None:
+                        deferred.append(entry)
+                        continue
+                    batch_hashes.add(content_hash)
+            except Exception as e:
+                on_result(key, None, e)
+                continue
+            states[key] = {"entry": entry, "document": None, "remaining": None, "lexical": ([], [], []),
+                           "content_hash": content_hash}
+            queue.append(key)
+
+        max_in_flight = Config.INGESTION_PARSE_PROCESSES * 2
+        heartbeat_interval = Config.INGESTION_LEASE_SECONDS / 3
+        heartbeat = VectorService._document_heartbeat(
+            lambda: [state["document"].id for state in states.values() if state["document"] is not None])
+        in_flight = {}
+        pending = []  # 待写入的 (key, node)，跨文件凑批
+        try:
+            while queue or in_flight:
+                while queue and len(in_flight) < max_in_flight:
+                    key = queue.popleft()
+                    if not check_cancel(key):
+                        continue
+                    entry = states[key]["entry"]
+                    try:
+                        document = states[key]["document"] = VectorService._prepare_document(
+                            vector_db_id, entry["save_path"], entry["save_name"], entry["file_name"],
+                            user_id, describe, chroma_collection, states[key]["content_hash"])
+                    except Exception as e:
+                        fail(key, e)
+                        continue
+                    executor = _get_parse_executor()
+                    future = executor.submit(
+                        parse_document, entry["save_path"], chunk_size, chunk_overlap,
+                        {"document_id": document.id, "original_name": entry["file_name"]}, DOCUMENT_METADATA_KEYS)
+                    in_flight[future] = (key, executor)
+                    report(key, 10, "parsing")
+                if not in_flight:
+                    continue
+                # 等待解析时也按间隔续约已创建的文档记录
+                done, _ = wait(in_flight, timeout=heartbeat_interval, return_when=FIRST_COMPLETED)
+                heartbeat()
+                for future in done:
+                    key, executor = in_flight.pop(future)
+                    try:
+                        nodes = future.result()
+                    except BrokenProcessPool as e:
+                        _reset_parse_executor(executor)
+                        fail(key, Exception(f"解析进程异常退出: {str(e)}"))
+                        continue
+                    except Exception as e:
+                        fail(key, e)
+                        continue
+                    if not check_cancel(key):
+                        continue
+                    states[key]["remaining"] = len(nodes)
+                    report(key, 50, "indexing")
+                    if not nodes:
+                        finish(key)
+                        continue
+                    pending.extend((key, node) for node in nodes)
+                    while len(pending) >= INGEST_NODE_BATCH:
+                        flush(pending[:INGEST_NODE_BATCH])
+                        pending = pending[INGEST_NODE_BATCH:]
+            flush(pending)
+        except Exception as e:
+            logger.error(f"向量库 {vector_db_id} 批量入库异常: {str(e)}", exc_info=True)
+            for key in list(states):
+                fail(key, e)
+
+        for entry in deferred:
+            key = entry["key"]
+            try:
+                document_id = VectorService.ingest_file(
+                    vector_db_id, entry["save_path"], entry["save_name"], entry["file_name"], user_id, describe,
+                    progress_callback=lambda progress, stage, key=key: report(key, progress, stage),
+                    cancel_check=(lambda key=key: cancel_check(key)) if cancel_check else None,
+                    keep_file_on_error=True
+                )
+                on_result(key, document_id, None)
+            except Exception as e:
+                on_result(key, None, e)
+        logger.info(f"向量库 {vector_db_id} 批量入库结束，共 {len(files)} 个文件")
+
+    @staticmethod
+    def _prepare_document(vector_db_id, save_path, unique_filename, filename, user_id, describe, chroma_collection,
+                          content_hash=None):
+        """
+        创建文档记录（ingesting，全部分块写入后由 _finish_document 标记为 ready）；
+        同名记录已存在说明上次处理中途中断（任务重试），先清理其残留向量再复用
+        """
+        document = Document.query.filter_by(name=unique_filename).first()
+        if document is not None:
+            logger.info(f"复用未完成的文档记录 {document.id}，清理残留向量: {unique_filename}")
+            chroma_collection.delete(where={"file_name": unique_filename})
+            local_index_manager.delete_where(vector_db_id, unique_filename)
+            lexical_index_manager.delete_document(vector_db_id, unique_filename)
+            document.status = 'ingesting'
+            document.update_at = db.func.now()
+            db.session.commit()
+            return document
+
+        file_extension = os.path.splitext(filename)[1]
+        file_type = file_extension[1:] if file_extension else "unknown"
+
+        # 获取文件大小
+        try:
+            file_size = os.path.getsize(save_path) if os.path.exists(save_path) else 0
+        except:
+            file_size = 0
+
+        VectorService._init_lexical_index(vector_db_id, chroma_collection)
+        logger.info(f"准备保存文档信息到数据库: {filename}, 类型: {file_type}, 大小: {file_size}")
+        document = Document(
+            user_id=user_id,  # 使用传入的用户ID
+            vector_db_id=vector_db_id,
+            name=unique_filename,
+            describe=describe if describe else None,  # 确保空字符串转为None
+            original_name=filename,
+            type=file_type,
+            size=file_size,
+            save_path=save_path,
+            content_hash=content_hash,
+            status='ingesting',
+        )
+        db.session.add(document)
+        db.session.commit()
+        return document
+
+    @staticmethod
+    def _resolve_documents(file_names):
+        """
+        旧分块的元数据中没有 document_id，按文件名批量查询（一次 IN 查询），结果缓存
+        :return: {file_name: (document_id, original_name)}
+        """
+        resolved = {}
+        missing = []
+        with _document_cache_lock:
+            for name in file_names:
+                if name in _document_cache:
+                    _document_cache.move_to_end(name)
+                    resolved[name] = _document_cache[name]
+                else:
+                    missing.append(name)
+        if missing:
+            rows = db.session.query(Document.name, Document.id, Document.original_name) \
+                .filter(Document.name.in_(missing)).all()
+            with _document_cache_lock:
+                for name, document_id, original_name in rows:
+                    resolved[name] = _document_cache[name] = (document_id, original_name)
+                while len(_document_cache) > DOCUMENT_CACHE_SIZE:
+                    _document_cache.popitem(last=False)
+        return resolved
+
+    @staticmethod
+    def _ingesting_document_ids(document_ids):
+        """给定文档中尚未入库完成的文档ID（一次 IN 查询）"""
+        if not document_ids:
+            return set()
+        rows = db.session.query(Document.id) \
+            .filter(Document.id.in_(document_ids), Document.status != 'ready').all()
+        return {document_id for document_id, in rows}
+
+    @staticmethod
+    def _document_heartbeat(get_document_ids):
+        """返回续约函数：入库过程中调用，每 1/3 租约时长最多更新一次 ingesting 文档的 update_at"""
+        interval = Config.INGESTION_LEASE_SECONDS / 3
+        last = {"at": time.monotonic()}
+
+        def beat():
+            now = time.monotonic()
+            if now - last["at"] < interval:
+                return
+            last["at"] = now
+            document_ids = [document_id for document_id in get_document_ids() if document_id is not None]
+            if not document_ids:
+                return
+            try:
+                Document.query.filter(Document.id.in_(document_ids), Document.status == 'ingesting') \
+                    .update({Document.update_at: db.func.now()}, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"文档记录续约失败: {str(e)}")
+        return beat
+
+    @staticmethod
+    def cleanup_stale_documents():
+        """
+        清理写入进程已退出（超过 INGESTION_LEASE_SECONDS 未续约）的 ingesting 文档记录及其部分向量，
+        保留已保存的文件，任务仍可重试；按条件删除，期间被续约或复用的记录不受影响
+        """
+        cutoff = db.session.query(db.func.now()).scalar() - timedelta(seconds=Config.INGESTION_LEASE_SECONDS)
+        stale = Document.query.filter(Document.status == 'ingesting', Document.update_at < cutoff).all()
+        cleaned = 0
+        for document in stale:
+            document_id, vector_db_id, name = document.id, document.vector_db_id, document.name
+            original_name = document.original_name
+            deleted = Document.query.filter(Document.id == document_id, Document.status == 'ingesting',
+                                            Document.update_at < cutoff).delete(synchronize_session=False)
+            db.session.commit()
+            if not deleted:
+                continue
+            logger.info(f"清理未完成入库的文档记录 {document_id}: {original_name}")
+            with _document_cache_lock:
+                _document_cache.pop(name, None)
+            VectorService._cleanup_failed_ingest(vector_db_id, VectorService.get_chroma_collection(vector_db_id),
+                                                 name, None)
+            cleaned += 1
+        return cleaned
+
+    @staticmethod
+    def _write_nodes(index, embedding_model, vector_db_id, nodes):
+        """一批节点嵌入后写入向量存储并同步本地索引"""
+        # 先自行嵌入（insert_nodes 会跳过已有 embedding 的节点），同一批向量再同步到本地索引
+        VectorService._embed_nodes(embedding_model, nodes)
+        client = get_chromadb_client()
+        try:
+            index.insert_nodes(nodes)
+        except Exception as e:
+            if is_connection_error(e):
+                chroma_manager.mark_unhealthy(client)
+            raise
+        VectorService._sync_local_index(vector_db_id, nodes)
+
+    @staticmethod
+    def _embed_nodes(embedding_model, nodes):
+        """批量嵌入节点并写回 node.embedding，与 VectorStoreIndex 使用相同的嵌入文本"""
+        pending = [node for node in nodes if node.embedding is None]
+        if not pending:
+            return
+        embeddings = embedding_model.get_text_embedding_batch(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+        )
+        for node, embedding in zip(pending, embeddings):
+            node.embedding = embedding
+
+    @staticmethod
+    def _sync_local_index(vector_db_id, nodes):
+        """本地索引已存在时同步追加，失败不影响 ChromaDB 写入（下次重建时会补齐）"""
+        try:
+            local_index_manager.add(
+                vector_db_id,
+                [node.node_id for node in nodes],
+                [node.embedding for node in nodes],
+                [node.get_content() for node in nodes],
+                [dict(node.metadata) for node in nodes]
+            )
+        except Exception as e:
+            logger.warning(f"同步本地索引失败，删除本地索引等待重建: {str(e)}")
+            local_index_manager.drop(vector_db_id)
+
+    @staticmethod
+    def _iter_chroma_batches(collection, include):
+        """按 LOCAL_SNAPSHOT_BATCH 分页读取集合，逐批产出 (ids, embeddings, texts, metadatas)"""
+        total = collection.count()
+        for offset in range(0, total, LOCAL_SNAPSHOT_BATCH):
+            batch = collection.get(include=include, limit=LOCAL_SNAPSHOT_BATCH, offset=offset)
+            texts = [text or "" for text in batch["documents"]]
+            # LlamaIndex 在元数据中保存的节点序列化内容与 documents 重复，不再保存
+            metadatas = [{key: value for key, value in (metadata or {}).items() if not key.startswith("_node")}
+                         for metadata in batch["metadatas"]]
+            yield batch["ids"], batch.get("embeddings"), texts, metadatas
+
+    @staticmethod
+    def _chroma_snapshot(vector_db_id):
+        """读取集合全部分块用于构建本地索引，集合过大或不可用时返回 None"""
+        collection = VectorService.get_chroma_collection(vector_db_id)
+        if collection is None:
+            return None
+        total = collection.count()
+        if total > Config.LOCAL_VECTOR_MAX_ITEMS:
+            logger.info(f"集合 {collection_name_of(vector_db_id)} 共 {total} 条，超过本地索引上限，继续使用 ChromaDB")
+            return None
+        ids, vectors, texts, metadatas = [], [], [], []
+        for batch_ids, batch_vectors, batch_texts, batch_metadatas in VectorService._iter_chroma_batches(
+                collection, ["embeddings", "documents", "metadatas"]):
+            ids.extend(batch_ids)
+            vectors.extend(batch_vectors)
+            texts.extend(batch_texts)
+            metadatas.extend(batch_metadatas)
+        return ids, vectors, texts, metadatas
+
+    @staticmethod
+    def _chroma_lexical_batches(vector_db_id):
+        """BM25 补建的数据源：分批读取集合的文本和元数据（不受本地索引条数上限限制），集合不可用时返回 None"""
+        collection = VectorService.get_chroma_collection(vector_db_id)
+        if collection is None:
+            return None
+        return ((ids, texts, metadatas) for ids, _, texts, metadatas
+                in VectorService._iter_chroma_batches(collection, ["documents", "metadatas"]))
+
+    @staticmethod
+    def _init_lexical_index(vector_db_id, chroma_collection):
+        """向量库还没有 BM25 目录且集合为空时直接标记完整，之后每个文档入库都会写段文件"""
+        try:
+            if not lexical_index_manager.exists(vector_db_id) and chroma_collection.count() == 0:
+                lexical_index_manager.mark_complete(vector_db_id)
+        except Exception as e:
+            logger.warning(f"初始化向量库 {vector_db_id} 的 BM25 索引失败: {str(e)}")
+
+    @staticmethod
+    def _query_lexical(vector_db_id, query_text, n_results):
+        """BM25 检索，返回 [{"id", "text", "score", "metadata"}]；索引不可用时返回 None"""
+        try:
+            return lexical_index_manager.search(
+                vector_db_id, query_text, n_results,
+                loader=lambda: VectorService._chroma_lexical_batches(vector_db_id)
+            )
+        except Exception as e:
+            logger.warning(f"BM25 检索失败: {str(e)}", exc_info=True)
+            return None
+
+    @staticmethod
+    def _query_local(vector_db, embedding_model, query_text, n_results):
+        """本地索引检索，返回 [{"id", "text", "score", "metadata"}]；不可用时返回 None"""
+        try:
+            query_embedding = embedding_model.get_query_embedding(query_text)
+            return local_index_manager.search(
+                vector_db.id, query_embedding, n_results, vector_db.distance or "cosine",
+                loader=lambda: VectorService._chroma_snapshot(vector_db.id)
+            )
+        except Exception as e:
+            logger.warning(f"本地索引检索失败，回退到 ChromaDB: {str(e)}", exc_info=True)
+            return None
 
     @staticmethod
     def delete_file(document_id):
@@ -523,16 +1271,23 @@ class VectorService:
             vector_db_id = document.vector_db_id
             client = get_chromadb_client()
             if client:
-                collection_name = f"vector_db_{vector_db_id}"
+                collection_name = collection_name_of(vector_db_id)
                 try:
-                    collection = client.get_collection(name=collection_name)
+                    collection = chroma_manager.get_collection(collection_name)
                     # 删除向量集合中与该文档相关的数据
                     collection.delete(where={"file_name": document.name})
                     logger.info(f"已删除向量集合中的数据: {document.name}")
                 except Exception as e:
                     logger.error(f"删除向量集合中的数据失败: {str(e)}")
+            try:
+                local_index_manager.delete_where(vector_db_id, document.name)
+                lexical_index_manager.delete_document(vector_db_id, document.name)
+            except Exception as e:
+                logger.error(f"删除本地索引中的数据失败: {str(e)}")
 
             # 删除数据库记录
+            with _document_cache_lock:
+                _document_cache.pop(document.name, None)
             db.session.delete(document)
             db.session.commit()
 
@@ -562,8 +1317,11 @@ class VectorService:
             logger.error(f"获取用户向量数据库列表失败: {str(e)}")
             return []
     @staticmethod
-    def query_vectors(vector_db_id, query_text, n_results=None):
-        """查询向量数据库 (使用 LlamaIndex)"""
+    def query_vectors(vector_db_id, query_text, n_results=None, mode=None):
+        """
+        查询向量数据库（VECTOR_BACKEND=local 时优先使用本地索引，否则使用 LlamaIndex + ChromaDB）
+        :param mode: dense / lexical / hybrid，默认 RETRIEVAL_MODE
+        """
         # 获取向量数据库配置
         vector_db = VectorMapper.get_vector_db(vector_db_id)
         if not vector_db:
@@ -573,52 +1331,101 @@ class VectorService:
         # 使用配置的topk，如果没有传入n_results
         if n_results is None:
             n_results = vector_db.topk or 10
+        mode = mode or Config.RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式: {mode}，可选 {', '.join(RETRIEVAL_MODES)}")
         
-        # 获取 ChromaDB 集合
-        chroma_collection = VectorService.get_chroma_collection(vector_db_id)
-        if not chroma_collection:
-            logger.error("无法获取 ChromaDB 集合")
-            return None
-
         try:
-            # 创建向量存储
-            vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-
             # 初始化嵌入模型
             model_info_id = vector_db.embedding_id
             if not model_info_id:
                 raise Exception("模型配置ID为空")
             embedding_model = get_embedding(model_info_id)
 
-            # 加载索引
-            index = VectorStoreIndex.from_vector_store(
-                vector_store=vector_store,
-                embed_model=embedding_model
-            )
+            lexical_hits = None
+            if mode != "dense":
+                lexical_hits = VectorService._query_lexical(vector_db_id, query_text, n_results)
+                if lexical_hits is None:
+                    # BM25 索引不可用时 lexical / hybrid 都回退为向量检索，而不是返回空结果
+                    logger.warning(f"向量库 {vector_db_id} 的 BM25 索引不可用，{mode} 检索回退为 dense")
+                    mode = "dense"
 
-            # 创建查询引擎，使用配置的topk
-            retriever = index.as_retriever(similarity_top_k=n_results)
-            nodes = retriever.retrieve(query_text)
+            hits = []
+            if mode != "lexical":
+                hits = None
+                if Config.VECTOR_BACKEND == "local":
+                    hits = VectorService._query_local(vector_db, embedding_model, query_text, n_results)
+                if hits is None:
+                    hits = VectorService._query_chroma(vector_db_id, embedding_model, query_text, n_results)
+                    if hits is None:
+                        return None
+                # 相似度阈值只作用于向量检索分数
+                document_similarity = vector_db.document_similarity
+                hits = [hit for hit in hits if hit["score"] >= document_similarity]
 
-            document_similarity = vector_db.document_similarity
+            if mode == "lexical":
+                hits = lexical_hits
+            elif mode == "hybrid":
+                hits = reciprocal_rank_fusion([hits, lexical_hits], Config.RETRIEVAL_RRF_K)[:n_results]
+
+            # 新分块自带 document_id / original_name，旧分块按文件名批量补查
+            legacy_names = {hit["metadata"].get("file_name") for hit in hits
+                            if hit["metadata"].get("document_id") is None and hit["metadata"].get("file_name")}
+            resolved = VectorService._resolve_documents(legacy_names) if legacy_names else {}
+            # 正在入库的文档已有部分分块写入，检索结果中跳过
+            ingesting = VectorService._ingesting_document_ids(
+                {hit["metadata"]["document_id"] for hit in hits if hit["metadata"].get("document_id") is not None})
 
             res = []
-            for node in nodes:
-                if node.score < document_similarity:
+            for hit in hits:
+                metadata = hit["metadata"]
+                if metadata.get("document_id") is not None:
+                    document_id, document_name = metadata["document_id"], metadata.get("original_name")
+                elif metadata.get("file_name") in resolved:
+                    document_id, document_name = resolved[metadata["file_name"]]
+                else:
                     continue
-                file_name = node.metadata.get("file_name")
-                if file_name:
-                    document = Document.query.filter_by(name=file_name).first()
-                    if document:
-                        res.append({"text": node.text, "document_name": document.original_name, "score": node.score, "document_id": document.id})
+                if document_id in ingesting:
+                    continue
+                res.append({"text": hit["text"], "document_name": document_name, "score": hit["score"], "document_id": document_id})
 
             # 执行查询
             return res
         except Exception as e:
             logger.error(f"向量查询失败: {str(e)}", exc_info=True)
             return None
+
+    @staticmethod
+    def _query_chroma(vector_db_id, embedding_model, query_text, n_results):
+        """通过 LlamaIndex + ChromaDB 检索，返回 [{"id", "text", "score", "metadata"}]"""
+        # 获取 ChromaDB 集合
+        chroma_collection = VectorService.get_chroma_collection(vector_db_id)
+        if not chroma_collection:
+            logger.error("无法获取 ChromaDB 集合")
+            return None
+
+        # 创建向量存储
+        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+
+        # 加载索引
+        index = VectorStoreIndex.from_vector_store(
+            vector_store=vector_store,
+            embed_model=embedding_model
+        )
+
+        # 创建查询引擎，使用配置的topk
+        retriever = index.as_retriever(similarity_top_k=n_results)
+        client = get_chromadb_client()
+        try:
+            nodes = retriever.retrieve(query_text)
+        except Exception as e:
+            if is_connection_error(e):
+                chroma_manager.mark_unhealthy(client)
+            raise
+        return [{"id": node.node_id, "text": node.text, "score": node.score, "metadata": node.metadata} for node in nodes]
+
     @staticmethod
-    def query_vector_by_model(model_config_id, query_text, n_results=10):
+    def query_vector_by_model(model_config_id, query_text, n_results=None):
         try:
             vector_db_id = ModelMapper.get_vector_db_id(model_config_id)
             if vector_db_id is None:
@@ -0,0 +1,69 @@
+import json
+import logging
+from typing import Callable
+
+import redis
+
+from app.config import Config
+
+logger = logging.getLogger("CatalogCache")
+
+# 命名空间：公开模型配置（/model/modelconfig/getpublic）、Ollama 模型列表（/ollama_model/modelinfo/getlist）
+MODEL_CONFIG_NAMESPACE = "model_config"
+OLLAMA_MODEL_NAMESPACE = "ollama_model"
+
+
+class CatalogCache:
+    """
+    模型目录的版本化读穿缓存（Redis）
+    - 每个命名空间一个版本号，缓存键带版本：catalog:{namespace}:v{version}:{key}
+    - 写操作（创建/更新/删除）调用 invalidate() 递增版本号，旧版本的键不再被读取，按 TTL 自然过期
+    - Redis 不可用时直接查库
+    """
+    prefix = "catalog:"
+
+    def __init__(self, ttl: int, enabled: bool = True):
+        self._ttl = ttl
+        self._enabled = enabled
+        self._redis = None
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB,
+                                      decode_responses=True)
+        return self._redis
+
+    def get_or_load(self, namespace: str, key: str, loader: Callable):
+        """
+        :param loader: 未命中时调用，返回值需可 JSON 序列化
+        """
+        if not self._enabled:
+            return loader()
+        cache_key = None
+        try:
+            client = self._get_redis()
+            version = client.get(f"{self.prefix}{namespace}:version") or 0
+            cache_key = f"{self.prefix}{namespace}:v{version}:{key}"
+            cached = client.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"读取目录缓存失败: {str(e)}")
+        data = loader()
+        if cache_key is not None:
+            try:
+                self._get_redis().set(cache_key, json.dumps(data, ensure_ascii=False), ex=self._ttl)
+            except Exception as e:
+                logger.warning(f"写入目录缓存失败: {str(e)}")
+        return data
+
+    def invalidate(self, namespace: str) -> None:
+        if not self._enabled:
+            return
+        try:
+            self._get_redis().incr(f"{self.prefix}{namespace}:version")
+        except Exception as e:
+            logger.warning(f"目录缓存失效失败，{namespace} 将在 {self._ttl} 秒内过期: {str(e)}")
+
+
+catalog_cache = CatalogCache(Config.CATALOG_CACHE_TTL, Config.CATALOG_CACHE_ENABLED)
@@ -0,0 +1,145 @@
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from llama_index.core.llms import ChatMessage
+
+from app.config import Config
+from app.utils.EmbbedingModel import estimate_tokens
+
+logger = logging.getLogger("ContextBuilder")
+
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色、分隔符等固定开销
+CONTEXT_PREFIX = "通过检索知识库已知：\n"
+CONTEXT_SUFFIX = "\n请根据检索结果和上下文回答用户问题，如果没有检索到知识，和用户说明情况"
+
+_counters: Dict[str, Callable[[str], int]] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_name: str) -> Callable[[str], int]:
+    """
+    获取模型的 token 计数函数
+    CHAT_TOKEN_COUNTER=tiktoken 时优先使用 tiktoken（未知模型用 cl100k_base），
+    tiktoken 不可用（未安装、离线无法下载词表）时退回 estimate_tokens 估算
+    """
+    counter = _counters.get(model_name)
+    if counter is not None:
+        return counter
+    with _counters_lock:
+        counter = _counters.get(model_name)
+        if counter is not None:
+            return counter
+        counter = estimate_tokens
+        if Config.CHAT_TOKEN_COUNTER == "tiktoken":
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                counter = lambda text: len(encoding.encode(text or "", disallowed_special=()))
+            except Exception as e:
+                logger.warning(f"tiktoken 不可用，使用估算计数: {str(e)}")
+        _counters[model_name] = counter
+        return counter
+
+
+def format_contexts(contexts: List[dict]) -> List[str]:
+    """检索结果格式化为紧凑文本，每个片段一段"""
+    chunks = []
+    for i, context in enumerate(contexts, 1):
+        name = context.get("document_name")
+        header = f"[{i}] 《{name}》" if name else f"[{i}]"
+        chunks.append(f"{header}\n{context.get('text', '')}")
+    return chunks
+
+
+class ContextBuilder:
+    """
+    按 token 预算组装发送给模型的消息
+    - 预算 = context_window - num_output（为回答预留）
+    - 系统提示与当前用户消息必选
+    - 检索片段按相关度依次放入，最多占剩余预算的 CHAT_CONTEXT_RATIO
+    - 历史消息从新到旧放入剩余预算，放不下即停止，保证历史连续
+    - usage 记录各部分占用的 token 数
+    """
+
+    def __init__(self, model_name: str, context_window: int, num_output: int, context_ratio: Optional[float] = None):
+        self.count = get_token_counter(model_name)
+        self.budget = max(context_window - num_output, 0)
+        self.context_ratio = Config.CHAT_CONTEXT_RATIO if context_ratio is None else context_ratio
+
+    @classmethod
+    def for_llm(cls, llm) -> "ContextBuilder":
+        return cls(llm.model, llm.context_window, llm.num_output)
+
+    def _message_tokens(self, content: str) -> int:
+        return self.count(content or "") + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, system_prompt: Optional[str], history: List[dict], contexts: Optional[List[dict]] = None):
+        """
+        :param system_prompt: 系统提示（由模型在请求时添加，这里只计入预算）
+        :param history: 历史消息，最新的在前，history[0] 为当前用户消息
+        :param contexts: 检索结果，按相关度排序
+        :return: (按时间正序的 ChatMessage 列表, usage)
+        """
+        system_tokens = self._message_tokens(system_prompt) if system_prompt else 0
+        remaining = self.budget - system_tokens
+
+        current, older = (history[0], history[1:]) if history else (None, [])
+        current_tokens = self._message_tokens(current['content']) if current else 0
+        remaining -= current_tokens
+
+        # 检索片段
+        context_message = None
+        context_tokens = 0
+        context_chunks = 0
+        if contexts:
+            cap = int(max(remaining, 0) * self.context_ratio)
+            used = self._message_tokens(CONTEXT_PREFIX + CONTEXT_SUFFIX)
+            selected = []
+            for chunk in format_contexts(contexts):
+                chunk_tokens = self.count(chunk) + 1
+                if used + chunk_tokens > cap:
+                    break
+                selected.append(chunk)
+                used += chunk_tokens
+            if selected:
+                context_message = ChatMessage(
+                    role="system",
+                    content=CONTEXT_PREFIX + "\n\n".join(selected) + CONTEXT_SUFFIX
+                )
+                context_tokens = used
+                context_chunks = len(selected)
+                remaining -= used
+
+        # 历史消息（从新到旧）
+        kept = []
+        history_tokens = 0
+        for msg in older:
+            tokens = self._message_tokens(msg['content'])
+            if history_tokens + tokens > remaining:
+                break
+            kept.append(msg)
+            history_tokens += tokens
+
+        messages = [ChatMessage(role=msg['role'], content=msg['content']) for msg in reversed(kept)]
+        if current:
+            messages.append(ChatMessage(role=current['role'], content=current['content']))
+        if context_message is not None:
+            messages.append(context_message)
+
+        usage = {
+            "budget": self.budget,
+            "system": system_tokens,
+            "current": current_tokens,
+            "history": history_tokens,
+            "history_messages": len(kept),
+            "history_dropped": len(older) - len(kept),
+            "contexts": context_tokens,
+            "context_chunks": context_chunks,
+            "context_dropped": len(contexts or []) - context_chunks,
+            "total": system_tokens + current_tokens + history_tokens + context_tokens,
+        }
+        return messages, usage
@@ -0,0 +1,170 @@
+import codecs
+import hashlib
+import logging
+import os
+from typing import Iterator, Sequence, Tuple
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.node_parser import SimpleNodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import BaseNode, MetadataMode
+
+logger = logging.getLogger("DocumentStream")
+
+TEXT_EXTENSIONS = (".txt", ".text", ".md", ".markdown", ".rst", ".log")
+STREAMABLE_EXTENSIONS = TEXT_EXTENSIONS + (".pdf", ".docx")
+TEXT_BLOCK_BYTES = 256 * 1024  # 纯文本每次读取的字节数
+DOCX_BLOCK_CHARS = 256 * 1024  # docx 段落累积到该字符数输出一块
+# 与 SimpleDirectoryReader 一致：文件元数据不参与嵌入和提示词
+FILE_METADATA_EXCLUDED_KEYS = ("file_name", "file_type", "file_size",
+                               "creation_date", "last_modified_date", "last_accessed_date")
+
+CHUNK_HASH_KEY = "chunk_hash"  # 分块元数据中的内容哈希，重新上传时据此复用未变化的分块
+
+# (文本, 附加元数据, 是否接续上一块的同一逻辑文档, 读取进度 0~1)
+Block = Tuple[str, dict, bool, float]
+
+
+def is_streamable(file_name: str) -> bool:
+    return os.path.splitext(file_name)[1].lower() in STREAMABLE_EXTENSIONS
+
+
+def _cut_point(text: str) -> int:
+    """在后半段最后一个空白字符之前切开，避免把一个词拆到两块"""
+    idx = max(text.rfind("\n"), text.rfind(" "))
+    return idx if idx > len(text) // 2 else len(text)
+
+
+def _iter_text(path: str) -> Iterator[Block]:
+    size = os.path.getsize(path) or 1
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    read = 0
+    pending = ""
+    first = True
+    with open(path, "rb") as f:
+        while True:
+            raw = f.read(TEXT_BLOCK_BYTES)
+            read += len(raw)
+            data = pending + decoder.decode(raw, final=not raw)
+            if raw:
+                cut = _cut_point(data)
+                block, pending = data[:cut], data[cut:]
+            else:
+                block, pending = data, ""
+            if block:
+                yield block, {}, not first, min(read / size, 1.0)
+                first = False
+            if not raw:
+                break
+
+
+def _iter_pdf(path: str) -> Iterator[Block]:
+    """逐页解析，每页一个逻辑文档（与 PDFReader 一样带 page_label）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    total = len(reader.pages) or 1
+    try:
+        labels = reader.page_labels
+    except Exception:
+        labels = []
+    for i, page in enumerate(reader.pages):
+        label = labels[i] if i < len(labels) else str(i + 1)
+        yield page.extract_text() or "", {"page_label": label}, False, (i + 1) / total
+
+
+def _iter_docx(path: str) -> Iterator[Block]:
+    import docx
+
+    paragraphs = docx.Document(path).paragraphs
+    total = len(paragraphs) or 1
+    buffer, size, first = [], 0, True
+    for i, paragraph in enumerate(paragraphs):
+        buffer.append(paragraph.text)
+        size += len(paragraph.text) + 1
+        if size >= DOCX_BLOCK_CHARS:
+            # 接续块以换行开头，保证与上一块拼接时段落仍然分隔
+            yield ("" if first else "\n") + "\n".join(buffer), {}, not first, (i + 1) / total
+            buffer, size, first = [], 0, False
+    if buffer:
+        yield ("" if first else "\n") + "\n".join(buffer), {}, not first, 1.0
+
+
+def _iter_fallback(path: str) -> Iterator[Block]:
+    """其他格式交给 SimpleDirectoryReader 一次性解析（不能流式读取）"""
+    logger.info(f"{os.path.basename(path)} 不支持流式解析，整体加载")
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    total = len(documents) or 1
+    for i, document in enumerate(documents):
+        yield document.text, dict(document.metadata), False, (i + 1) / total
+
+
+def iter_blocks(path: str) -> Iterator[Block]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in TEXT_EXTENSIONS:
+        return _iter_text(path)
+    if extension == ".pdf":
+        return _iter_pdf(path)
+    if extension == ".docx":
+        return _iter_docx(path)
+    return _iter_fallback(path)
+
+
+def chunk_hash(text: str, metadata: dict) -> str:
+    """分块内容哈希：文本加页码（同样的文本换了页也视为变化）"""
+    page = str(metadata.get("page_label", ""))
+    return hashlib.sha256(f"{page}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _build_nodes(splits, document) -> list:
+    """build_nodes_from_splits 不复制元数据（由 NodeParser 后处理补上），这里补齐并记录内容哈希"""
+    nodes = build_nodes_from_splits(splits, document)
+    for node, text in zip(nodes, splits):
+        node.metadata = dict(document.metadata)
+        node.metadata[CHUNK_HASH_KEY] = chunk_hash(text, node.metadata)
+    return nodes
+
+
+def iter_document_nodes(path: str, node_parser, metadata: dict,
+                        excluded_keys: Sequence[str] = ()) -> Iterator[Tuple[BaseNode, float]]:
+    """
+    流式解析并增量分块，逐个产出 (节点, 读取进度)
+    每块文本与上一块留下的最后一个分块拼接后重新切分，最后一个分块可能不完整，留到下一块，
+    这样跨块处仍按 chunk_size / chunk_overlap 切分，内存中只保留当前块
+    :param node_parser: SentenceSplitter（SimpleNodeParser）
+    :param metadata: 写入每个节点的附加元数据
+    :param excluded_keys: 不参与嵌入和提示词的附加元数据键
+    """
+    file_metadata = default_file_metadata_func(path)
+    excluded = list(FILE_METADATA_EXCLUDED_KEYS) + [key for key in tuple(excluded_keys) + (CHUNK_HASH_KEY,)
+                                                    if key not in FILE_METADATA_EXCLUDED_KEYS]
+    document, metadata_str, carry = None, "", None
+    for text, extra, continues, progress in iter_blocks(path):
+        if document is None or not continues:
+            if carry:
+                for node in _build_nodes([carry], document):
+                    yield node, progress
+            carry = None
+            document = Document(text="", metadata={**file_metadata, **extra, **metadata})
+            document.excluded_embed_metadata_keys = list(excluded)
+            document.excluded_llm_metadata_keys = list(excluded)
+            metadata_str = max(document.get_metadata_str(MetadataMode.EMBED),
+                               document.get_metadata_str(MetadataMode.LLM), key=len)
+        splits = node_parser.split_text_metadata_aware(carry + text if carry else text, metadata_str)
+        carry = splits.pop() if splits else None
+        for node in _build_nodes(splits, document):
+            yield node, progress
+    if carry:
+        for node in _build_nodes([carry], document):
+            yield node, 1.0
+
+
+def parse_document(path: str, chunk_size: int, chunk_overlap: int, metadata: dict,
+                   excluded_keys: Sequence[str] = ()) -> list:
+    """
+    解析并分块整个文件，返回节点列表（不含 embedding）
+    批量入库时在子进程中执行，参数和返回值都需要可序列化
+    """
+    node_parser = SimpleNodeParser.from_defaults(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [node for node, _ in iter_document_nodes(path, node_parser, metadata, excluded_keys)]
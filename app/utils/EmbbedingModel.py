@@ -1,9 +1,57 @@
 from typing import Optional
-from typing import Any, List
+from typing import Any, List, Iterator, Tuple
 from llama_index.core.bridge.pydantic import Field, PrivateAttr
 from llama_index.core.embeddings import BaseEmbedding
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIStatusError, APIConnectionError, APITimeoutError
 import asyncio  # 添加 asyncio 导入
+import logging
+import random
+import threading
+import weakref
+
+from app.config import Config
+from app.utils.EmbeddingCache import get_embedding_cache, EmbeddingCache
+
+logger = logging.getLogger("EmbeddingModel")
+
+
+# 粗略估算文本 token 数：中文约 1 字 1 token，其余约 4 字符 1 token
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 1
+    cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+# 400 错误的 code / message 中出现这些片段时视为批次或输入超限（各服务商措辞不同）
+BATCH_TOO_LARGE_MARKERS = ("too large", "too long", "too many", "maximum", "exceed", "limit",
+                           "context_length", "context length", "batch size", "tokens",
+                           "超过", "超出", "过长", "过大", "上限")
+
+
+# 判断是否为“批次过大”类的请求错误，这类错误可以通过拆分批次解决；其他 400（参数、模型名错误等）直接抛出
+def is_batch_too_large_error(e: Exception) -> bool:
+    if not isinstance(e, APIStatusError):
+        return False
+    if e.status_code == 413:
+        return True
+    if e.status_code != 400:
+        return False
+    detail = f"{getattr(e, 'code', None) or ''} {getattr(e, 'message', None) or ''}".lower()
+    return any(marker in detail for marker in BATCH_TOO_LARGE_MARKERS)
+
+
+# 判断是否为可重试错误：限流、服务端错误和网络错误
+def is_retryable_error(e: Exception) -> bool:
+    if isinstance(e, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(e, APIStatusError) and (e.status_code == 429 or e.status_code >= 500)
+
+
+# 指数退避 + 全抖动（full jitter）
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 20.0) -> float:
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
 
 # 嵌入模型封装类
 class ChatEmbeddings(BaseEmbedding):
@@ -15,7 +63,14 @@ class ChatEmbeddings(BaseEmbedding):
         "volumes of async API calls, setting this to false can improve stability."
     ),
                                )
+    max_batch_size: int = Field(default=10, gt=0, description="单次 embeddings 请求的最大文本条数")
+    max_batch_tokens: int = Field(default=8192, gt=0, description="单次 embeddings 请求的估算 token 上限")
+    max_concurrency: int = Field(default=4, gt=0, description="异步接口同时在途的批量请求数")
+    max_retries: int = Field(default=3, ge=0, description="异步接口遇到 429/5xx 时的最大重试次数")
+    use_cache: bool = Field(default=True, description="是否使用内容寻址的嵌入缓存（EmbeddingCache）")
     _client: Optional[Any] = PrivateAttr()
+    _aclients: Any = PrivateAttr()  # 事件循环 -> AsyncOpenAI（弱引用键，循环回收后自动移除）
+    _aclient_lock: Any = PrivateAttr()
 
     # 初始化函数
     def __init__(
@@ -24,16 +79,32 @@ class ChatEmbeddings(BaseEmbedding):
             api_key: Optional[str],
             base_url: Optional[str],
             reuse_client: bool = True,
+            max_batch_size: Optional[int] = None,
+            max_batch_tokens: Optional[int] = None,
+            max_concurrency: Optional[int] = None,
+            max_retries: Optional[int] = None,
             **kwargs: Any,
     ) -> None:
+        max_batch_size = max_batch_size or Config.EMBEDDING_BATCH_SIZE
+        max_batch_tokens = max_batch_tokens or Config.EMBEDDING_BATCH_TOKENS
+        max_concurrency = max_concurrency or Config.EMBEDDING_MAX_CONCURRENCY
+        max_retries = Config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        # LlamaIndex 按 embed_batch_size 分组调用 _get_text_embeddings，再由本类按批次上限拆分请求
+        kwargs.setdefault("embed_batch_size", max(max_batch_size, 100))
         super().__init__(
             model=model,
             api_key=api_key,
             base_url=base_url,
             reuse_client=reuse_client,
+            max_batch_size=max_batch_size,
+            max_batch_tokens=max_batch_tokens,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries,
             **kwargs,
         )
         self._client = None
+        self._aclients = weakref.WeakKeyDictionary()
+        self._aclient_lock = threading.Lock()
 
     # 客户端管理
     def _get_client(self) -> OpenAI:
@@ -44,6 +115,41 @@ class ChatEmbeddings(BaseEmbedding):
             self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
         return self._client
 
+    # 异步客户端管理：httpx 连接池绑定事件循环，每个事件循环一个客户端
+    # 实例通过模型注册表在请求线程间共享，字典读写加锁，返回局部变量而不是共享属性
+    async def _aget_aclient(self) -> AsyncOpenAI:
+        # 重试由本类带抖动的退避逻辑负责，关闭 SDK 自带重试避免叠加
+        if not self.reuse_client:
+            return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+        loop = asyncio.get_running_loop()
+        with self._aclient_lock:
+            entry = self._aclients.get(loop)
+            if entry is not None:
+                return entry[0]
+            # 未经 shutdown_asyncgens 就关闭的循环无法再关闭其客户端，只移除引用
+            for closed_loop in [l for l in self._aclients if l.is_closed()]:
+                del self._aclients[closed_loop]
+            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+            closer = self._aclient_lifetime(client)
+            # 字典持有 closer 的强引用，避免被回收时提前触发关闭
+            self._aclients[loop] = (client, closer)
+        await closer.__anext__()
+        return client
+
+    async def _aclient_lifetime(self, client: AsyncOpenAI):
+        """事件循环结束时（asyncio.run 退出前调用 loop.shutdown_asyncgens）关闭客户端的连接池并移除记录"""
+        try:
+            yield
+        finally:
+            with self._aclient_lock:
+                for loop in [l for l, entry in self._aclients.items() if entry[0] is client]:
+                    del self._aclients[loop]
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"关闭异步嵌入客户端失败: {str(e)}")
+
     @classmethod
     def class_name(cls) -> str:
         return "ChatEmbeddings"
@@ -58,33 +164,142 @@ class ChatEmbeddings(BaseEmbedding):
 
     # 文本嵌入方法
     def _get_text_embedding(self, text: str) -> List[float]:
-        return self.get_general_text_embedding(text)
+        return self._get_text_embeddings([text])[0]
 
-    # 批量文本嵌入方法
-    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+    # 查询缓存，返回 (缓存, 每条文本的缓存键, 命中结果, 需要嵌入的去重文本)
+    def _lookup_cache(self, texts: List[str]):
+        cache = get_embedding_cache() if self.use_cache else None
+        if cache is None:
+            return None, None, {}, list(dict.fromkeys(texts))
+        keys = [EmbeddingCache.make_key(self.model, self.base_url, text) for text in texts]
+        found = cache.get_many(list(dict.fromkeys(keys)))
+        pending = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        return cache, keys, found, pending
+
+    # 合并缓存命中与新嵌入结果，并写回缓存
+    def _merge_cache(self, texts, cache, keys, found, pending, embeddings) -> List[List[float]]:
+        computed = dict(zip(pending, embeddings))
+        if cache is None:
+            return [computed[text] for text in texts]
+        cache.put_many({EmbeddingCache.make_key(self.model, self.base_url, text): vector
+                        for text, vector in computed.items()})
+        return [found[key] if key in found else computed[text] for text, key in zip(texts, keys)]
+
+    # 按条数和 token 预算切分批次，返回 (起始下标, 批次文本)
+    def _iter_batches(self, texts: List[str]) -> Iterator[Tuple[int, List[str]]]:
+        start = 0
+        batch: List[str] = []
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield start, batch
+                start, batch, batch_tokens = i, [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield start, batch
+
+    # 单次批量请求，按返回的 index 还原输入顺序
+    def _create_batch_embeddings(self, batch: List[str]) -> List[List[float]]:
+        response = self._get_client().embeddings.create(
+            model=self.model,
+            input=batch,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    # 批量请求，服务端拒绝过大的批次时对半拆分重试
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        try:
+            return self._create_batch_embeddings(batch)
+        except Exception as e:
+            if len(batch) <= 1 or not is_batch_too_large_error(e):
+                raise
+            mid = len(batch) // 2
+            logger.warning(f"嵌入批次被拒绝（{len(batch)} 条），拆分为 {mid}+{len(batch) - mid} 条重试: {str(e)}")
+            return self._embed_batch(batch[:mid]) + self._embed_batch(batch[mid:])
+
+    # 不经过缓存的批量嵌入
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
         embedding_list: List[List[float]] = []
 
-        for text in texts:
-            embeddings = self.get_general_text_embedding(text)
-            embedding_list.append(embeddings)
+        for _, batch in self._iter_batches(texts):
+            embedding_list.extend(self._embed_batch(batch))
 
         return embedding_list
 
+    # 批量文本嵌入方法（先查缓存，只嵌入未命中的文本）
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cache, keys, found, pending = self._lookup_cache(texts)
+        embeddings = self._embed_texts(pending) if pending else []
+        return self._merge_cache(texts, cache, keys, found, pending, embeddings)
+
     # 查询嵌入方法
     def _get_query_embedding(self, query: str) -> List[float]:
-        return self.get_general_text_embedding(query)
+        return self._get_text_embeddings([query])[0]
+
+    # 异步单次批量请求，429/5xx/网络错误时带抖动退避重试
+    async def _acreate_batch_embeddings(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            client = await self._aget_aclient()
+            try:
+                try:
+                    response = await client.embeddings.create(
+                        model=self.model,
+                        input=batch,
+                    )
+                finally:
+                    if not self.reuse_client:
+                        await client.close()
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = backoff_delay(attempt)
+                attempt += 1
+                logger.warning(f"嵌入请求失败，{delay:.2f}s 后第 {attempt} 次重试: {str(e)}")
+                await asyncio.sleep(delay)
+
+    # 异步批量请求，服务端拒绝过大的批次时对半拆分重试
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float]]:
+        try:
+            return await self._acreate_batch_embeddings(batch)
+        except Exception as e:
+            if len(batch) <= 1 or not is_batch_too_large_error(e):
+                raise
+            mid = len(batch) // 2
+            logger.warning(f"嵌入批次被拒绝（{len(batch)} 条），拆分为 {mid}+{len(batch) - mid} 条重试: {str(e)}")
+            left = await self._aembed_batch(batch[:mid])
+            right = await self._aembed_batch(batch[mid:])
+            return left + right
 
     # 异步查询嵌入方法
     async def _aget_query_embedding(self, query: str) -> List[float]:
-        return self.get_general_text_embedding(query)
+        return (await self._aget_text_embeddings([query]))[0]
 
     # 异步文本嵌入方法
     async def _aget_text_embedding(self, text: str) -> List[float]:
-        return self.get_general_text_embedding(text)
+        return (await self._aget_text_embeddings([text]))[0]
 
-    # 异步批量文本嵌入方法
+    # 异步批量文本嵌入方法（先查缓存，只嵌入未命中的文本）
     async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return self._get_text_embeddings(texts)
+        cache, keys, found, pending = self._lookup_cache(texts)
+        embeddings = await self._aembed_texts(pending) if pending else []
+        return self._merge_cache(texts, cache, keys, found, pending, embeddings)
+
+    # 不经过缓存的异步批量嵌入：信号量限制并发，结果按输入顺序回填
+    async def _aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        embedding_list: List[Optional[List[float]]] = [None] * len(texts)
+
+        async def run(start: int, batch: List[str]) -> None:
+            async with semaphore:
+                embeddings = await self._aembed_batch(batch)
+            embedding_list[start:start + len(batch)] = embeddings
+
+        await asyncio.gather(*(run(start, batch) for start, batch in self._iter_batches(texts)))
+        return embedding_list
 
 
 if __name__ == "__main__":
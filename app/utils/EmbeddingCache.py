@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import redis
+
+from app.config import Config
+
+logger = logging.getLogger("EmbeddingCache")
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    """向量压缩为 float32 字节串，内存和 Redis 两层共用同一编码"""
+    return array('f', vector).tobytes()
+
+
+def _unpack(data: bytes) -> List[float]:
+    vector = array('f')
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    内容寻址的嵌入缓存
+    - 键：(嵌入模型名, base_url, sha256(text))，同一文本在任意向量库中只嵌入一次
+    - 一级：进程内 LRU，按字节上限淘汰
+    - 二级：Redis，按 TTL 过期，进程重启或多 worker 之间共享
+    - 统计各层命中/未命中次数，见 stats()
+    """
+    prefix = "emb:"
+
+    def __init__(self, max_memory_bytes: int, redis_ttl: int, use_redis: bool = True):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> packed bytes
+        self._memory_bytes = 0
+        self._max_memory_bytes = max_memory_bytes
+        self._redis_ttl = redis_ttl
+        self._redis = None
+        if use_redis:
+            # 单独的二进制连接，ConversationStore 的连接开启了 decode_responses
+            self._redis = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB)
+        self._stats = {"memory_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    @staticmethod
+    def make_key(model: str, base_url: str, text: str) -> str:
+        namespace = hashlib.sha256(f"{model}\n{base_url}".encode("utf-8")).hexdigest()[:16]
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{EmbeddingCache.prefix}{namespace}:{digest}"
+
+    def _memory_put(self, key: str, data: bytes) -> None:
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self._max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 key -> 向量；Redis 命中会回填内存层"""
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for key in keys:
+                data = self._memory.get(key)
+                if data is None:
+                    missing.append(key)
+                    continue
+                self._memory.move_to_end(key)
+                found[key] = _unpack(data)
+            self._stats["memory_hits"] += len(found)
+
+        if missing and self._redis is not None:
+            try:
+                values = self._redis.mget(missing)
+            except redis.RedisError as e:
+                logger.warning(f"嵌入缓存读取 Redis 失败: {str(e)}")
+                values = [None] * len(missing)
+                with self._lock:
+                    self._stats["redis_errors"] += 1
+            redis_found = {key: data for key, data in zip(missing, values) if data is not None}
+            with self._lock:
+                for key, data in redis_found.items():
+                    self._memory_put(key, data)
+                self._stats["redis_hits"] += len(redis_found)
+            for key, data in redis_found.items():
+                found[key] = _unpack(data)
+
+        with self._lock:
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        packed = {key: _pack(vector) for key, vector in items.items()}
+        with self._lock:
+            for key, data in packed.items():
+                self._memory_put(key, data)
+        if self._redis is None:
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for key, data in packed.items():
+                pipe.set(key, data, ex=self._redis_ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"嵌入缓存写入 Redis 失败: {str(e)}")
+            with self._lock:
+                self._stats["redis_errors"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """进程级嵌入缓存，EMBEDDING_CACHE_ENABLED 关闭时返回 None"""
+    global _embedding_cache
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    max_memory_bytes=Config.EMBEDDING_CACHE_MEMORY_BYTES,
+                    redis_ttl=Config.EMBEDDING_CACHE_REDIS_TTL,
+                    use_redis=Config.EMBEDDING_CACHE_REDIS_ENABLED,
+                )
+    return _embedding_cache
@@ -5,24 +5,22 @@ from flask import request, current_app
 import jwt
 from functools import wraps
 
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from app.forms.base import ErrorResponse
 from app.mapper import UserMapper
-from app.models.permission import Role, Route, RoleRoute
 from app.models.user import User
+from app.utils.PasswordHasher import password_hasher
+from app.utils.RouteAuthorizer import route_authorizer
+from app.utils.TokenCache import token_cache, token_digest, REVOKED
 
 from app.config import Config
 
 from app.extensions import db
 
-# 密码哈希上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 def get_password_hash(password: str) -> str:
-    """生成密码哈希"""
-    return pwd_context.hash(password)
+    """生成密码哈希（在专用线程池中计算）"""
+    return password_hasher.hash(password)
 
 def generate_jwt(id: int, name: str, email: str, type: int) -> str:
     payload = {
@@ -42,59 +40,80 @@ def authenticate_user(user: User, email: str, password: str):
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify(plain_password, hashed_password)
+
+def verify_password_and_update(plain_password: str, hashed_password: str):
+    """验证密码，返回 (是否匹配, 新哈希)；哈希的 cost 与当前配置不一致时新哈希不为 None"""
+    return password_hasher.verify_and_update(plain_password, hashed_password)
 
 def verify_jwt(token: str):
+    """
+    验证令牌并返回 claims，失败时返回 {'error': ...}
+    验签结果按令牌摘要缓存到 exp，注销列表在同一次查找中检查
+    """
+    digest = token_digest(token)
+    cached = token_cache.lookup(digest)
+    if cached is REVOKED:
+        return {'error': 'Token revoked'}
+    if cached is not None:
+        return cached
     try:
-        return jwt.decode(token, Config.secret_key, algorithms=['HS256'])
+        payload = jwt.decode(token, Config.secret_key, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         return {'error': 'Token expired'}
     except jwt.InvalidTokenError:
         return {'error': 'Invalid token'}
+    if token_cache.is_revoked_remote(digest):
+        token_cache.revoke(digest, payload.get('exp'))
+        return {'error': 'Token revoked'}
+    token_cache.put(digest, payload)
+    return payload
+
+def revoke_jwt(token: str) -> None:
+    """注销令牌（退出登录），令牌过期前所有进程都拒绝该令牌"""
+    try:
+        payload = jwt.decode(token, Config.secret_key, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        # 已过期或无效的令牌本来就无法通过验证
+        return
+    token_cache.revoke(token_digest(token), payload.get('exp'))
+
+def extract_token(header: str) -> str:
+    """从 Authorization 头中提取令牌（兼容 Bearer 前缀和直接 Token）"""
+    if header.startswith('Bearer '):
+        return header.split(' ', 1)[1].strip()
+    return header.strip()
 
 
 from flask import request, current_app
 from werkzeug.exceptions import Forbidden
 from urllib.parse import urlparse
-import re
 
 
 def verify_permission(role_id: int, path: str, method: str) -> bool:
     try:
+        # 路由与角色权限使用内存中的授权索引（前缀树 + 角色位图），不查库
+        index = route_authorizer.get_index()
         # 1. 验证角色是否存在
-        role = Role.query.get(role_id)
-        if not role:
+        if not index.has_role(role_id):
             current_app.logger.warning(f"无效角色ID: {role_id}")
             return False
+        role_name = index.role_names[role_id]
         # 2. 标准化路径（移除查询参数）
         clean_path = urlparse(path).path
-        # 3. 获取所有路由定义
-        all_routes = Route.query.filter_by(method=method.upper()).all()
-        # 4. 查找匹配的路由
-        matched_route = None
-        for route in all_routes:
-            # 将路由路径中的变量部分转换为通配符
-            route_pattern = re.sub(r'<[^>]+>', r'[^/]+', route.path)
-            if re.fullmatch(route_pattern, clean_path):
-                matched_route = route
-                break
+        # 3. 查找匹配的路由
+        matched_route = index.match(method, clean_path)
         if not matched_route:
             current_app.logger.warning(f"未找到匹配路由: {method} {clean_path}")
             return False
-        # 5. 检查角色是否有该路由权限
-        has_permission = db.session.query(
-            RoleRoute.query.filter_by(
-                route_id=matched_route.id,
-                role_id=role_id
-            ).exists()
-        ).scalar()
-        if has_permission:
+        # 4. 检查角色是否有该路由权限
+        if index.allows(role_id, matched_route):
             current_app.logger.debug(
-                f"权限验证通过: 角色[{role.name}]可以访问 {method} {clean_path} "
-                f"(匹配路由: {matched_route.path})"
+                f"权限验证通过: 角色[{role_name}]可以访问 {method} {clean_path} "
+                f"(匹配路由: {matched_route[2]})"
             )
             return True
-        current_app.logger.info(f"权限不足: 角色[{role.name}]无法访问 {method} {clean_path}")
+        current_app.logger.info(f"权限不足: 角色[{role_name}]无法访问 {method} {clean_path}")
         return False
     except Exception as e:
         current_app.logger.error(f"权限验证失败: {method} {path}. 错误: {str(e)}")
@@ -103,30 +122,19 @@ def verify_permission(role_id: int, path: str, method: str) -> bool:
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        print(request.path, request.method)
-        # 打印所有请求头（调试用）
-        # current_app.logger.debug(f"所有请求头: {request.headers}")
-        auth_header = request.headers.get('Authorization', '')
-        # current_app.logger.debug(f"原始Authorization头: {auth_header}")
-
-        # 提取Token（兼容Bearer前缀和直接Token）
-        if auth_header.startswith('Bearer '):
-            token = auth_header.split(' ', 1)[1].strip()
-        else:
-            token = auth_header.strip()
-
-        # current_app.logger.debug(f"提取的Token: {token}")
-
+        current_app.logger.debug(f"{request.method} {request.path}")
+        token = extract_token(request.headers.get('Authorization', ''))
         if not token:
             return ErrorResponse(code=401, message='未提供有效的访问令牌').to_json()
         payload = verify_jwt(token)
         if 'error' in payload:
             return ErrorResponse(code=401, message=payload['error']).to_json()
-        payload = verify_jwt(token)
 
         if not verify_permission(int(payload['type']), request.path, request.method):
             return ErrorResponse(code=403, message='无权限访问').to_json()
 
-        request.user = User(id=payload['id'], name=payload['name'], email=payload['email'], type=payload['type'])
+        # 同一请求内只构建一次（嵌套的 login_required 复用）
+        if getattr(request, 'user', None) is None:
+            request.user = User(id=payload['id'], name=payload['name'], email=payload['email'], type=payload['type'])
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
@@ -149,14 +149,23 @@ class ChatGLM(CustomLLM):
 
     # 流式聊天功能实现
     def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> CompletionResponseGen:
+        # 与 chat 一致，添加系统提示
+        system_message = [ChatMessage(
+            role=MessageRole.SYSTEM,
+            content=self.system_prompt
+        )]
+
         if isinstance(messages, str):
             messages = [ChatMessage(content=messages, role=MessageRole.USER)]
 
         response_text = ""
-        message_dicts: List = to_messages_dicts(messages)
-        response = self._chat(message_dicts, stream=False)
+        message_dicts: List = to_messages_dicts(system_message + list(messages))
+        response = self._chat(message_dicts, stream=True)
 
         for chunk in response:
+            # 部分服务商的最后一个分片只携带 usage，没有 choices
+            if not chunk.choices:
+                continue
             token = chunk.choices[0].delta.content
             if token is not None:
                 response_text += token
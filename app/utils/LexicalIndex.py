@@ -0,0 +1,265 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import zlib
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+
+from app.config import Config
+from app.utils.chromadb_utils import collection_name_of
+
+logger = logging.getLogger("LexicalIndex")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_\-.]*|[\u4e00-\u9fff]+")
+COMPOUND_SEPARATORS = re.compile(r"[-._]")
+BM25_K1 = 1.5
+BM25_B = 0.75
+COMPLETE_MARKER = ".complete"
+BACKFILL_SEGMENT_ITEMS = 1024  # 补建时每个段文件最多包含的分块数
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文/数字按词切分并保留 err-404、v1.2.3 这类复合词（同时索引其组成部分），中文按字二元组切分
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer((text or "").lower()):
+        token = match.group()
+        if '\u4e00' <= token[0] <= '\u9fff':
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+            continue
+        token = token.rstrip("-.")
+        if not token:
+            continue
+        tokens.append(token)
+        if COMPOUND_SEPARATORS.search(token):
+            tokens.extend(part for part in COMPOUND_SEPARATORS.split(token) if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(result_lists: List[List[dict]], k: int = 60) -> List[dict]:
+    """
+    倒数排名融合：score = Σ 1 / (k + rank)，按 hit["id"] 合并多路结果
+    融合后的 hit 保留第一次出现时的内容，score 为融合分数
+    """
+    fused: Dict[str, dict] = {}
+    scores: Dict[str, float] = defaultdict(float)
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, 1):
+            scores[hit["id"]] += 1.0 / (k + rank)
+            fused.setdefault(hit["id"], hit)
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [dict(fused[hit_id], score=score) for hit_id, score in ordered]
+
+
+def _segment_prefix(file_name: str) -> str:
+    return hashlib.sha1(file_name.encode("utf-8")).hexdigest()
+
+
+def _segment_name(file_name: str, part: int = 0) -> str:
+    """大文档分多个段写入，第 0 段沿用原来的文件名"""
+    prefix = _segment_prefix(file_name)
+    return f"{prefix}.seg" if part == 0 else f"{prefix}.{part}.seg"
+
+
+class LexicalIndex:
+    """
+    单个向量库的 BM25 倒排索引（内存中合并后的只读视图）
+    磁盘上每个文档一个或多个 zlib 压缩的段文件，包含该文档分块的文本、元数据、长度和倒排表；
+    增删文档只需写入或删除对应段文件，检索时发现段文件变化再重新合并。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.docs: List[dict] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[tuple]] = {}
+        self.avgdl = 0.0
+        self.signature = None
+        self.load()
+
+    def current_signature(self):
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(".seg"):
+                    entries.append((entry.name, entry.stat().st_mtime_ns))
+        return tuple(sorted(entries))
+
+    def load(self) -> None:
+        signature = self.current_signature()
+        docs, lengths = [], []
+        postings: Dict[str, List[tuple]] = defaultdict(list)
+        for name, _ in signature:
+            try:
+                with open(os.path.join(self.path, name), "rb") as f:
+                    segment = json.loads(zlib.decompress(f.read()))
+            except (OSError, ValueError, zlib.error) as e:
+                logger.warning(f"跳过损坏的段文件 {name}: {str(e)}")
+                continue
+            base = len(docs)
+            for item in segment["items"]:
+                docs.append({"id": item["id"], "text": item["text"], "metadata": item["metadata"]})
+                lengths.append(item["length"])
+            for term, entries in segment["postings"].items():
+                postings[term].extend((base + i, tf) for i, tf in entries)
+        self.docs, self.lengths, self.postings = docs, lengths, dict(postings)
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self.signature = signature
+
+    def refresh(self) -> None:
+        if self.current_signature() != self.signature:
+            self.load()
+
+    def search(self, query: str, k: int) -> List[dict]:
+        """BM25 检索，返回 [{"id", "text", "metadata", "score"}]，按分数降序"""
+        total = len(self.docs)
+        if not total or k <= 0:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            for doc, tf in entries:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / self.avgdl)
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [dict(self.docs[doc], score=score) for doc, score in top]
+
+
+class LexicalIndexManager:
+    """
+    各向量库 BM25 索引的读写
+    - 入库时 add_document 写入段文件，delete_document 删除段文件
+    - 首次检索时加载；目录中没有 .complete 标记时，用 loader 从 ChromaDB 为缺少段文件的旧文档补建
+    - 新建或空的向量库在写入第一个文档前调用 mark_complete，不需要补建
+    """
+
+    def __init__(self, base_dir: str):
+        self._base_dir = base_dir
+        self._lock = threading.Lock()
+        self._locks: Dict[int, threading.RLock] = {}
+        self._indexes: Dict[int, LexicalIndex] = {}
+
+    def path_of(self, vector_db_id: int) -> str:
+        return os.path.join(self._base_dir, collection_name_of(vector_db_id))
+
+    def _lock_of(self, vector_db_id: int) -> threading.RLock:
+        with self._lock:
+            return self._locks.setdefault(vector_db_id, threading.RLock())
+
+    def _write_segment(self, path: str, file_name: str, ids, texts, metadatas, part: int = 0) -> None:
+        items = []
+        postings: Dict[str, List[list]] = defaultdict(list)
+        for i, (item_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            counts = Counter(tokenize(text))
+            items.append({"id": item_id, "text": text, "metadata": metadata or {},
+                          "length": sum(counts.values())})
+            for term, tf in counts.items():
+                postings[term].append([i, tf])
+        segment = {"file_name": file_name, "items": items, "postings": postings}
+        os.makedirs(path, exist_ok=True)
+        target = os.path.join(path, _segment_name(file_name, part))
+        with open(target + ".tmp", "wb") as f:
+            f.write(zlib.compress(json.dumps(segment, ensure_ascii=False).encode("utf-8")))
+        os.replace(target + ".tmp", target)
+
+    def add_document(self, vector_db_id: int, file_name: str, ids, texts, metadatas, part: int = 0) -> None:
+        """写入文档的一个段；流式入库的大文档按 part 0, 1, 2... 分段写入"""
+        with self._lock_of(vector_db_id):
+            self._write_segment(self.path_of(vector_db_id), file_name, ids, texts, metadatas, part)
+
+    def delete_document(self, vector_db_id: int, file_name: str, keep_parts: int = 0) -> None:
+        """删除文档的段文件；keep_parts > 0 时保留前 keep_parts 段（文档重写后段数变少时清理多余的段）"""
+        with self._lock_of(vector_db_id):
+            path = self.path_of(vector_db_id)
+            if not os.path.isdir(path):
+                return
+            prefix = _segment_prefix(file_name) + "."
+            with os.scandir(path) as it:
+                names = [entry.name for entry in it if entry.name.startswith(prefix) and entry.name.endswith(".seg")]
+            for name in names:
+                part = name[len(prefix):-len(".seg")]
+                if int(part or 0) >= keep_parts:
+                    os.remove(os.path.join(path, name))
+
+    def drop(self, vector_db_id: int) -> None:
+        with self._lock_of(vector_db_id):
+            self._indexes.pop(vector_db_id, None)
+            shutil.rmtree(self.path_of(vector_db_id), ignore_errors=True)
+
+    def exists(self, vector_db_id: int) -> bool:
+        return os.path.isdir(self.path_of(vector_db_id))
+
+    def mark_complete(self, vector_db_id: int) -> None:
+        """标记索引完整（所有文档都有段文件）"""
+        with self._lock_of(vector_db_id):
+            path = self.path_of(vector_db_id)
+            os.makedirs(path, exist_ok=True)
+            open(os.path.join(path, COMPLETE_MARKER), "w").close()
+
+    def _backfill(self, vector_db_id: int, loader: Callable) -> bool:
+        """
+        为没有段文件的文档从 ChromaDB 补建，loader 不可用时返回 False
+        :param loader: 返回分批迭代的 (ids, texts, metadatas)，集合不可用时返回 None
+        """
+        batches = loader()
+        if batches is None:
+            return False
+        path = self.path_of(vector_db_id)
+        os.makedirs(path, exist_ok=True)
+        with os.scandir(path) as it:
+            existing = {entry.name for entry in it if entry.name.endswith(".seg")}
+        pending = defaultdict(lambda: ([], [], []))
+        parts = defaultdict(int)
+
+        def flush(file_name):
+            self._write_segment(path, file_name, *pending.pop(file_name), part=parts[file_name])
+            parts[file_name] += 1
+
+        # 逐批读取，每个文档累积到 BACKFILL_SEGMENT_ITEMS 条即写出一段，不在内存中保留整个集合
+        for ids, texts, metadatas in batches:
+            for item_id, text, metadata in zip(ids, texts, metadatas):
+                file_name = (metadata or {}).get("file_name")
+                if not file_name or _segment_name(file_name) in existing:
+                    continue
+                group = pending[file_name]
+                group[0].append(item_id)
+                group[1].append(text)
+                group[2].append(metadata)
+                if len(group[0]) >= BACKFILL_SEGMENT_ITEMS:
+                    flush(file_name)
+        for file_name in list(pending):
+            flush(file_name)
+        open(os.path.join(path, COMPLETE_MARKER), "w").close()
+        logger.info(f"BM25 索引补建完成: {path}，新增 {len(parts)} 个文档")
+        return True
+
+    def search(self, vector_db_id: int, query: str, k: int,
+               loader: Optional[Callable] = None) -> Optional[List[dict]]:
+        """检索；索引不完整且无法补建时返回 None"""
+        with self._lock_of(vector_db_id):
+            path = self.path_of(vector_db_id)
+            if not os.path.exists(os.path.join(path, COMPLETE_MARKER)):
+                if loader is None or not self._backfill(vector_db_id, loader):
+                    return None
+            index = self._indexes.get(vector_db_id)
+            if index is None:
+                index = self._indexes[vector_db_id] = LexicalIndex(path)
+            else:
+                index.refresh()
+            return index.search(query, k)
+
+
+lexical_index_manager = LexicalIndexManager(Config.LEXICAL_INDEX_DIR)
@@ -0,0 +1,329 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.config import Config
+from app.utils.chromadb_utils import collection_name_of
+
+logger = logging.getLogger("LocalVectorIndex")
+
+# hnswlib 随 chroma-hnswlib 一起安装，不可用时只使用精确检索
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    hnswlib = None
+    HNSWLIB_AVAILABLE = False
+
+SUPPORTED_DISTANCES = ("cosine", "l2", "ip")
+
+
+class LocalVectorIndex:
+    """
+    单个向量库的本地索引
+    目录结构：
+    - meta.json    维度、条数，写入完成后原子替换，读取方以它为准
+    - vectors.f32  float32 行矩阵，以 np.memmap 只读映射
+    - items.jsonl  每行 {"id", "text", "metadata"}，内存中只保留 id、file_name 和行偏移
+
+    分数与 ChromaVectorStore 保持一致（1 - 距离）：cosine 为余弦相似度，ip 为内积，l2 为 1 - 欧氏距离平方。
+    条数达到 LOCAL_VECTOR_ANN_THRESHOLD 且 hnswlib 可用时改用 HNSW 近似检索。
+    所有方法由 LocalIndexManager 的同一把锁串行调用。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim = None
+        self.count = 0
+        self._vectors = None
+        self._norms = None
+        self._ids: List[str] = []
+        self._id_rows: Dict[str, int] = {}
+        self._file_names: List[Optional[str]] = []
+        self._offsets: List[int] = []
+        self._items_end = 0
+        self._ann = None
+        self._ann_space = None
+        self._stamp = None
+        self._load()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    @classmethod
+    def create(cls, path: str) -> "LocalVectorIndex":
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, "vectors.f32"), "wb").close()
+        open(os.path.join(path, "items.jsonl"), "wb").close()
+        cls._write_meta(path, None, 0)
+        return cls(path)
+
+    @staticmethod
+    def _write_meta(path: str, dim, count: int) -> None:
+        meta_path = os.path.join(path, "meta.json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": dim, "count": count}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _current_stamp(self):
+        st = os.stat(self._file("meta.json"))
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self) -> None:
+        with open(self._file("meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta.get("dim")
+        expected = meta.get("count", 0)
+
+        self._ids, self._file_names, self._offsets = [], [], []
+        offset = 0
+        with open(self._file("items.jsonl"), "rb") as f:
+            for _ in range(expected):
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                item = json.loads(line)
+                self._ids.append(item["id"])
+                self._file_names.append((item.get("metadata") or {}).get("file_name"))
+                self._offsets.append(offset)
+                offset += len(line)
+        self._items_end = offset
+        self.count = len(self._ids)
+        self._id_rows = {item_id: row for row, item_id in enumerate(self._ids)}
+        self._map_vectors()
+        self._stamp = self._current_stamp()
+
+    def _map_vectors(self, norms=None) -> None:
+        """重新映射向量文件；norms 为空时整体计算一次范数（只在加载和重写时发生）"""
+        if self.count and self.dim:
+            self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                      shape=(self.count, self.dim))
+            self._norms = np.linalg.norm(self._vectors, axis=1) if norms is None else norms
+        else:
+            self._vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+            self._norms = np.zeros(0, dtype=np.float32)
+        self._ann = None
+
+    def refresh(self) -> None:
+        """其他进程写入后重新加载"""
+        if self._current_stamp() != self._stamp:
+            self._load()
+
+    def add(self, ids: List[str], vectors, texts: List[str], metadatas: List[dict]) -> int:
+        """追加向量，已存在的 id 会被跳过，返回实际写入的条数"""
+        seen = set()
+        keep = []
+        for i, item_id in enumerate(ids):
+            if item_id in self._id_rows or item_id in seen:
+                continue
+            seen.add(item_id)
+            keep.append(i)
+        if not keep:
+            return 0
+        matrix = np.asarray(vectors, dtype=np.float32)[keep]
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {matrix.shape[1]} 与索引维度 {self.dim} 不一致")
+
+        lines = [
+            json.dumps({"id": ids[i], "text": texts[i], "metadata": metadatas[i] or {}}, ensure_ascii=False)
+            .encode("utf-8") + b"\n"
+            for i in keep
+        ]
+        # 先截掉上次异常中断留下的半截数据，再追加
+        with open(self._file("vectors.f32"), "r+b") as f:
+            f.truncate(self.count * self.dim * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(matrix.tobytes())
+        with open(self._file("items.jsonl"), "r+b") as f:
+            f.truncate(self._items_end)
+            f.seek(0, os.SEEK_END)
+            f.write(b"".join(lines))
+
+        first_row = self.count
+        for i, line in zip(keep, lines):
+            self._id_rows[ids[i]] = len(self._ids)
+            self._ids.append(ids[i])
+            self._file_names.append((metadatas[i] or {}).get("file_name"))
+            self._offsets.append(self._items_end)
+            self._items_end += len(line)
+        self.count = len(self._ids)
+        self._write_meta(self.path, self.dim, self.count)
+
+        ann, ann_space = self._ann, self._ann_space
+        # 只计算新增行的范数，避免每批追加都读一遍整个向量文件
+        self._map_vectors(np.concatenate([self._norms, np.linalg.norm(matrix, axis=1)]))
+        if ann is not None:
+            if ann.get_max_elements() < self.count:
+                ann.resize_index(max(self.count * 2, 1024))
+            ann.add_items(matrix, np.arange(first_row, self.count))
+            self._ann, self._ann_space = ann, ann_space
+        self._stamp = self._current_stamp()
+        return len(keep)
+
+    def delete_where(self, file_name: str) -> int:
+        """删除某个文件的全部分块，重写数据文件"""
+        return self._rewrite([row for row, name in enumerate(self._file_names) if name != file_name])
+
+    def delete_ids(self, ids) -> int:
+        """按 id 删除分块，重写数据文件"""
+        remove = set(ids)
+        return self._rewrite([row for row, item_id in enumerate(self._ids) if item_id not in remove])
+
+    def _rewrite(self, keep_rows: List[int]) -> int:
+        removed = self.count - len(keep_rows)
+        if not removed:
+            return 0
+        lines = self._read_lines(keep_rows)
+        vectors = np.asarray(self._vectors[keep_rows]) if keep_rows else np.zeros((0, self.dim or 0), np.float32)
+        with open(self._file("vectors.f32.tmp"), "wb") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        with open(self._file("items.jsonl.tmp"), "wb") as f:
+            f.write(b"".join(lines))
+        self._vectors = None
+        os.replace(self._file("vectors.f32.tmp"), self._file("vectors.f32"))
+        os.replace(self._file("items.jsonl.tmp"), self._file("items.jsonl"))
+        self._write_meta(self.path, self.dim, len(keep_rows))
+        self._load()
+        return removed
+
+    def _read_lines(self, rows: List[int]) -> List[bytes]:
+        lines = []
+        with open(self._file("items.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                lines.append(f.readline())
+        return lines
+
+    def _use_ann(self) -> bool:
+        threshold = Config.LOCAL_VECTOR_ANN_THRESHOLD
+        return HNSWLIB_AVAILABLE and threshold > 0 and self.count >= threshold
+
+    def _get_ann(self, distance: str):
+        if self._ann is None or self._ann_space != distance:
+            logger.info(f"为 {self.path} 构建 HNSW 索引（{self.count} 条，{distance}）")
+            ann = hnswlib.Index(space=distance, dim=self.dim)
+            ann.init_index(max_elements=max(self.count * 2, 1024), ef_construction=200, M=16)
+            ann.add_items(np.asarray(self._vectors), np.arange(self.count))
+            self._ann, self._ann_space = ann, distance
+        return self._ann
+
+    def search(self, query, k: int, distance: str = "cosine") -> List[dict]:
+        """返回最相似的 k 条：{"id", "text", "metadata", "score"}，按分数降序"""
+        if not self.count or k <= 0:
+            return []
+        distance = distance if distance in SUPPORTED_DISTANCES else "cosine"
+        k = min(k, self.count)
+        q = np.asarray(query, dtype=np.float32)
+
+        if self._use_ann():
+            ann = self._get_ann(distance)
+            ann.set_ef(max(64, k * 4))
+            labels, distances = ann.knn_query(q, k=k)
+            rows, scores = labels[0], 1.0 - distances[0]
+        else:
+            dots = self._vectors @ q
+            if distance == "cosine":
+                scores = dots / (self._norms * np.linalg.norm(q) + 1e-12)
+            elif distance == "ip":
+                scores = dots
+            else:
+                scores = 1.0 - (self._norms ** 2 - 2 * dots + float(q @ q))
+            rows = np.argpartition(-scores, k - 1)[:k]
+            rows = rows[np.argsort(-scores[rows])]
+            scores = scores[rows]
+
+        hits = []
+        for line, score in zip(self._read_lines([int(row) for row in rows]), scores):
+            item = json.loads(line)
+            item["score"] = float(score)
+            hits.append(item)
+        return hits
+
+
+class LocalIndexManager:
+    """
+    各向量库本地索引的加载、构建与同步
+    - 索引不存在时可由 loader 从 ChromaDB 快照构建（get 传入 loader）
+    - add / delete_where / delete_ids 只同步已存在的索引，不存在时什么也不做
+    - 同一向量库的构建、写入和检索共用一把锁，构建期间的写入会等待构建完成后再追加（按 id 去重）
+    """
+
+    def __init__(self, base_dir: str):
+        self._base_dir = base_dir
+        self._lock = threading.Lock()
+        self._locks: Dict[int, threading.RLock] = {}
+        self._indexes: Dict[int, LocalVectorIndex] = {}
+
+    def path_of(self, vector_db_id: int) -> str:
+        return os.path.join(self._base_dir, collection_name_of(vector_db_id))
+
+    def _lock_of(self, vector_db_id: int) -> threading.RLock:
+        with self._lock:
+            return self._locks.setdefault(vector_db_id, threading.RLock())
+
+    def _open(self, vector_db_id: int, loader: Optional[Callable] = None) -> Optional[LocalVectorIndex]:
+        """调用方持有该向量库的锁"""
+        index = self._indexes.get(vector_db_id)
+        path = self.path_of(vector_db_id)
+        if index is not None and LocalVectorIndex.exists(path):
+            index.refresh()
+            return index
+        self._indexes.pop(vector_db_id, None)
+        if not LocalVectorIndex.exists(path):
+            if loader is None:
+                return None
+            snapshot = loader()
+            if snapshot is None:
+                return None
+            index = LocalVectorIndex.create(path)
+            ids, vectors, texts, metadatas = snapshot
+            if ids:
+                index.add(ids, vectors, texts, metadatas)
+            logger.info(f"本地向量索引构建完成: {path}，共 {index.count} 条")
+        else:
+            index = LocalVectorIndex(path)
+        self._indexes[vector_db_id] = index
+        return index
+
+    def search(self, vector_db_id: int, query, k: int, distance: str = "cosine",
+               loader: Optional[Callable] = None) -> Optional[List[dict]]:
+        """检索；索引不存在且无法构建时返回 None，由调用方回退到 ChromaDB"""
+        with self._lock_of(vector_db_id):
+            index = self._open(vector_db_id, loader)
+            if index is None:
+                return None
+            return index.search(query, k, distance)
+
+    def add(self, vector_db_id: int, ids, vectors, texts, metadatas) -> int:
+        with self._lock_of(vector_db_id):
+            index = self._open(vector_db_id)
+            return index.add(ids, vectors, texts, metadatas) if index is not None else 0
+
+    def delete_where(self, vector_db_id: int, file_name: str) -> int:
+        with self._lock_of(vector_db_id):
+            index = self._open(vector_db_id)
+            return index.delete_where(file_name) if index is not None else 0
+
+    def delete_ids(self, vector_db_id: int, ids) -> int:
+        with self._lock_of(vector_db_id):
+            index = self._open(vector_db_id)
+            return index.delete_ids(ids) if index is not None else 0
+
+    def drop(self, vector_db_id: int) -> None:
+        with self._lock_of(vector_db_id):
+            self._indexes.pop(vector_db_id, None)
+            shutil.rmtree(self.path_of(vector_db_id), ignore_errors=True)
+
+
+local_index_manager = LocalIndexManager(Config.LOCAL_VECTOR_DIR)
@@ -0,0 +1,60 @@
+import logging
+from typing import Optional
+
+import redis
+
+from app.config import Config
+
+logger = logging.getLogger("LoginLimiter")
+
+KEY_PREFIX = "auth:login:"
+
+
+class LoginLimiter:
+    """
+    登录准入限制：按账号和按 IP 在固定时间窗口内计数（Redis INCR，窗口到期自动清零）
+    超过任一上限时拒绝，请求不会进入密码校验；Redis 不可用时放行
+    """
+
+    def __init__(self, window: int, max_per_account: int, max_per_ip: int):
+        self.window = max(window, 1)
+        self.limits = {"account": max_per_account, "ip": max_per_ip}
+        self._redis = None
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB,
+                                      decode_responses=True)
+        return self._redis
+
+    def acquire(self, account: str, ip: Optional[str]) -> Optional[int]:
+        """
+        记录一次登录尝试
+        :return: 被限制时返回需要等待的秒数，否则返回 None
+        """
+        keys = [("account", (account or "").strip().lower())]
+        if ip:
+            keys.append(("ip", ip))
+        keys = [(kind, f"{KEY_PREFIX}{kind}:{value}") for kind, value in keys if self.limits[kind] > 0]
+        if not keys:
+            return None
+        try:
+            pipe = self._get_redis().pipeline()
+            for _, key in keys:
+                pipe.set(key, 0, ex=self.window, nx=True)
+                pipe.incr(key)
+                pipe.ttl(key)
+            results = pipe.execute()
+        except Exception as e:
+            logger.warning(f"登录准入计数失败，放行: {str(e)}")
+            return None
+        retry_after = None
+        for i, (kind, key) in enumerate(keys):
+            count, ttl = results[i * 3 + 1], results[i * 3 + 2]
+            if count > self.limits[kind]:
+                logger.info(f"登录尝试过多（{kind}: {count}/{self.limits[kind]}）: {key}")
+                retry_after = max(retry_after or 0, ttl if ttl and ttl > 0 else self.window)
+        return retry_after
+
+
+login_limiter = LoginLimiter(Config.LOGIN_RATE_WINDOW, Config.LOGIN_MAX_PER_ACCOUNT, Config.LOGIN_MAX_PER_IP)
@@ -1,7 +1,8 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
+import os
 from pathlib import Path
 
+from app.utils.PEFT.ModelServer import local_model_registry
+
 def _normalize_path(path):
     """Normalize a file path to handle mixed separators."""
     if not path:
@@ -22,36 +23,30 @@ def _normalize_path(path):
 def chat_with_base(model_path, history):
     # Normalize path to handle mixed path separators
     model_path = _normalize_path(model_path)
-    
-    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        device_map="auto",  # 自动选择 GPU 或 CPU
-        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-        local_files_only=True,
-    )
+
+    # 模型常驻内存，只在首次使用时从磁盘加载
+    entry = local_model_registry.get_base(model_path)
+    tokenizer = entry.tokenizer
     if isinstance(history, str):
         history = [
             {"role": "user", "content": history}
         ]
 
-    # 生成回复
-    inputs = tokenizer.apply_chat_template(
+    # 生成回复：请求交给调度器，与同一模型上的并发请求合批生成
+    input_ids = tokenizer.apply_chat_template(
         history,
-        return_tensors="pt",
         add_generation_prompt=True
-    ).to(model.device)
-
-
-    outputs = model.generate(
-        inputs,
+    )
+    # 基座上可能挂载了微调适配器，adapter_name=None 表示关闭适配器推理
+    new_tokens = entry.scheduler.generate(
+        input_ids,
         max_new_tokens=512,
         do_sample=True,
         temperature=0.7,
         top_p=0.9,
     )
     # 解码AI 回复
-    response = tokenizer.decode(outputs[0][len(inputs[0]):], skip_special_tokens=True)
+    response = tokenizer.decode(new_tokens, skip_special_tokens=True)
 
     return response
 if __name__ == '__main__':
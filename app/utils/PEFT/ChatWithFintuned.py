@@ -1,23 +1,8 @@
 import torch
 import os
 from pathlib import Path
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from peft import PeftModel
 
-# Check if bitsandbytes is available
-try:
-    import bitsandbytes as bnb
-    from transformers import BitsAndBytesConfig
-    BITSANDBYTES_AVAILABLE = True
-except (ImportError, ModuleNotFoundError, Exception) as e:
-    BITSANDBYTES_AVAILABLE = False
-    BitsAndBytesConfig = None
-    error_msg = str(e)
-    if "metadata" in error_msg.lower() or "package" in error_msg.lower():
-        print(f"Warning: bitsandbytes package metadata is missing or corrupted: {e}")
-        print("To fix this, try reinstalling bitsandbytes: pip uninstall bitsandbytes && pip install bitsandbytes")
-    else:
-        print(f"Warning: bitsandbytes is not available: {e}")
+from app.utils.PEFT.ModelServer import local_model_registry
 
 print(torch.cuda.is_available())  # 应该返回True
 print(torch.version.cuda)  # 显示CUDA版本
@@ -41,50 +26,26 @@ def _normalize_path(path):
     except (OSError, ValueError):
         return os.path.normpath(path_str)
 
-def chat_with_finetuned(model_path, peft_model_path, load_in_4bit, history):
+def adapter_name_of(peft_model_path):
+    """适配器名称：默认取 LoRA 目录名，PEFT 要求名称中不含 '.'"""
+    return os.path.basename(os.path.normpath(peft_model_path)).replace('.', '_') or "default"
+
+
+def chat_with_finetuned(model_path, peft_model_path, load_in_4bit, history, adapter_name=None):
     # Normalize paths to handle mixed path separators
     model_path = _normalize_path(model_path)
     peft_model_path = _normalize_path(peft_model_path)
-    
-    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-    tokenizer.pad_token = tokenizer.eos_token
-    tokenizer.padding_side = "right"
-
-    # Check if bitsandbytes is available when load_in_4bit is requested
-    if load_in_4bit and not BITSANDBYTES_AVAILABLE:
-        raise ImportError(
-            "bitsandbytes is required for 4-bit quantization but is not available. "
-            "This may be due to missing package metadata. "
-            "To fix: pip uninstall bitsandbytes && pip install bitsandbytes "
-            "Alternatively, set load_in_4bit=False to disable quantization."
-        )
-    
-    model_kwargs = {
-        "device_map": "auto",
-        "local_files_only": True
-    }
-    
-    if load_in_4bit and BITSANDBYTES_AVAILABLE:
-        bnb_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_compute_dtype=torch.bfloat16
-        )
-        model_kwargs["quantization_config"] = bnb_config
-    
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        **model_kwargs
-    )
+    adapter_name = adapter_name or adapter_name_of(peft_model_path)
 
-    # 然后加载LoRA
-    model = PeftModel.from_pretrained(model, peft_model_path)
+    # 同一基座只常驻一份，各微调模型的 LoRA 按名称挂载在上面
+    entry = local_model_registry.get_base(model_path, load_in_4bit)
+    tokenizer = entry.tokenizer
 
-    # 使用组合模型进行推理
-    inputs = tokenizer(history, return_tensors="pt").to("cuda")
-    outputs = model.generate(**inputs, max_new_tokens=1024)
-    print(tokenizer.decode(outputs[0], skip_special_tokens=True))
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+    # 请求交给调度器，与同一基座上的并发请求（可能属于其他适配器）合批生成
+    input_ids = tokenizer(history)["input_ids"]
+    new_tokens = entry.scheduler.generate(input_ids, max_new_tokens=1024,
+                                          adapter_name=adapter_name, adapter_path=peft_model_path)
+    return tokenizer.decode(input_ids + new_tokens, skip_special_tokens=True)
 
 if __name__ == "__main__":
     model_path = r"D:\Projects\PEFT\Qwen\Qwen1.5-1.8B-Chat"
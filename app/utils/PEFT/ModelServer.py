@@ -0,0 +1,415 @@
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import peft
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from app.config import Config
+
+logger = logging.getLogger("ModelServer")
+
+# Check if bitsandbytes is available
+try:
+    import bitsandbytes as bnb
+    from transformers import BitsAndBytesConfig
+    BITSANDBYTES_AVAILABLE = True
+except (ImportError, ModuleNotFoundError, Exception) as e:
+    BITSANDBYTES_AVAILABLE = False
+    BitsAndBytesConfig = None
+    error_msg = str(e)
+    if "metadata" in error_msg.lower() or "package" in error_msg.lower():
+        print(f"Warning: bitsandbytes package metadata is missing or corrupted: {e}")
+        print("To fix this, try reinstalling bitsandbytes: pip uninstall bitsandbytes && pip install bitsandbytes")
+    else:
+        print(f"Warning: bitsandbytes is not available: {e}")
+
+# 混合适配器批次中代表“不使用 LoRA”的名称（PEFT 约定）
+BASE_ADAPTER = "__base__"
+
+
+def _version_tuple(version):
+    parts = []
+    for part in version.split(".")[:3]:
+        digits = "".join(ch for ch in part if ch.isdigit())
+        parts.append(int(digits) if digits else 0)
+    return tuple(parts)
+
+
+# PEFT 0.10 起 LoRA 支持在 generate 中通过 adapter_names 为批次内每条样本指定适配器
+PEFT_MIXED_BATCH = _version_tuple(peft.__version__) >= (0, 10, 0)
+
+
+def load_base_model(model_path, load_in_4bit=False):
+    """从本地目录加载基座模型和分词器，基座对话与微调对话共用同一份"""
+    # Check if bitsandbytes is available when load_in_4bit is requested
+    if load_in_4bit and not BITSANDBYTES_AVAILABLE:
+        raise ImportError(
+            "bitsandbytes is required for 4-bit quantization but is not available. "
+            "This may be due to missing package metadata. "
+            "To fix: pip uninstall bitsandbytes && pip install bitsandbytes "
+            "Alternatively, set load_in_4bit=False to disable quantization."
+        )
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    model_kwargs = {
+        "device_map": "auto",  # 自动选择 GPU 或 CPU
+        "torch_dtype": torch.float16 if torch.cuda.is_available() else torch.float32,
+        "local_files_only": True,
+    }
+    if load_in_4bit:
+        model_kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16
+        )
+
+    model = AutoModelForCausalLM.from_pretrained(model_path, **model_kwargs)
+    model.eval()
+    return model, tokenizer
+
+
+def _memory_footprint(model):
+    try:
+        return int(model.get_memory_footprint())
+    except Exception:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+class QueueFullError(Exception):
+    """模型生成队列已满"""
+    pass
+
+
+class _GenerationRequest:
+    def __init__(self, input_ids, max_new_tokens, adapter_name, adapter_path, generate_kwargs):
+        self.input_ids = list(input_ids)
+        self.max_new_tokens = max_new_tokens
+        self.adapter_name = adapter_name
+        self.adapter_path = adapter_path
+        self.generate_kwargs = generate_kwargs
+        self.future = Future()
+
+
+class GenerationScheduler:
+    """
+    单个常驻模型前的批量生成调度器
+    - 请求进入队列，后台线程在收集窗口内攒批，左填充后一次 generate，再按请求拆分输出
+    - 采样参数相同的请求才会合批；PEFT 不支持混合适配器时还要求适配器相同
+    - 每个请求有自己的 max_new_tokens，输出在各自上限或 eos 处截断
+    - 队列长度超过上限时直接拒绝（QueueFullError），空闲一段时间后后台线程退出
+    """
+
+    def __init__(self, entry, window_seconds, max_batch_size, max_queue, idle_timeout=30.0):
+        self._entry = entry
+        self._window_seconds = window_seconds
+        self._max_batch_size = max_batch_size
+        self._max_queue = max_queue
+        self._idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._worker = None
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, input_ids, max_new_tokens, adapter_name=None, adapter_path=None, **generate_kwargs) -> Future:
+        """提交生成请求，Future 的结果为新生成的 token id 列表"""
+        request = _GenerationRequest(input_ids, max_new_tokens, adapter_name, adapter_path, generate_kwargs)
+        with self._cond:
+            if len(self._queue) >= self._max_queue:
+                raise QueueFullError(f"模型 {self._entry.key} 生成队列已满（{self._max_queue}），请稍后重试")
+            self._queue.append(request)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return request.future
+
+    def generate(self, input_ids, max_new_tokens, adapter_name=None, adapter_path=None, **generate_kwargs) -> list:
+        return self.submit(input_ids, max_new_tokens, adapter_name, adapter_path, **generate_kwargs).result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait(self._idle_timeout)
+                    if not self._queue:
+                        self._worker = None
+                        return
+                # 收集窗口：凑满一批或窗口结束即开始生成
+                deadline = time.monotonic() + self._window_seconds
+                while len(self._queue) < self._max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            self._execute(batch)
+
+    def _group_key(self, request):
+        adapter = None if PEFT_MIXED_BATCH else request.adapter_name
+        return tuple(sorted(request.generate_kwargs.items())), adapter
+
+    def _take_batch(self):
+        """取出队首请求及其后可以合批的请求，其余请求保持原顺序（调用方持有 self._cond）"""
+        first = self._queue.popleft()
+        key = self._group_key(first)
+        batch, rest = [first], deque()
+        while self._queue:
+            request = self._queue.popleft()
+            if len(batch) < self._max_batch_size and self._group_key(request) == key:
+                batch.append(request)
+            else:
+                rest.append(request)
+        self._queue = rest
+        return batch
+
+    def _execute(self, batch):
+        entry = self._entry
+        tokenizer = entry.tokenizer
+        try:
+            with entry.lock:
+                ready = []
+                for request in batch:
+                    try:
+                        if request.adapter_name:
+                            entry.ensure_adapter(request.adapter_name, request.adapter_path)
+                        ready.append(request)
+                    except Exception as e:
+                        request.future.set_exception(e)
+                if not ready:
+                    return
+
+                # 左填充，保证各请求的新 token 从同一列开始
+                pad_id = tokenizer.pad_token_id
+                width = max(len(request.input_ids) for request in ready)
+                input_ids = torch.tensor(
+                    [[pad_id] * (width - len(r.input_ids)) + r.input_ids for r in ready],
+                    device=entry.model.device
+                )
+                attention_mask = torch.tensor(
+                    [[0] * (width - len(r.input_ids)) + [1] * len(r.input_ids) for r in ready],
+                    device=entry.model.device
+                )
+                adapter_names = [request.adapter_name for request in ready]
+                if len(set(adapter_names)) == 1:
+                    adapter_names = adapter_names[0]
+                with torch.no_grad():
+                    outputs = entry.generate(
+                        adapter_names,
+                        input_ids=input_ids,
+                        attention_mask=attention_mask,
+                        max_new_tokens=max(request.max_new_tokens for request in ready),
+                        pad_token_id=pad_id,
+                        **ready[0].generate_kwargs
+                    )
+
+            eos_ids = tokenizer.eos_token_id
+            eos_ids = set(eos_ids) if isinstance(eos_ids, (list, tuple)) else {eos_ids}
+            for request, row in zip(ready, outputs):
+                tokens = row[width:].tolist()[:request.max_new_tokens]
+                for i, token in enumerate(tokens):
+                    if token in eos_ids:
+                        tokens = tokens[:i]
+                        break
+                request.future.set_result(tokens)
+        except Exception as e:
+            logger.error(f"批量生成失败（{len(batch)} 条请求）: {str(e)}", exc_info=True)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+
+class LoadedModel:
+    """
+    常驻内存的基座模型及其分词器
+    - adapters: 已挂载在该基座上的 LoRA 适配器，名称 -> 目录
+    - lock: 串行化同一基座上的适配器切换与推理，调用 ensure_adapter / generate 前需持有
+    - scheduler: 对话请求经由调度器合批生成
+    """
+
+    def __init__(self, key, model, tokenizer):
+        self.key = key
+        self.model = model
+        self.tokenizer = tokenizer
+        self.lock = threading.Lock()
+        self.adapters = {}
+        self.size_bytes = _memory_footprint(model)
+        self.scheduler = GenerationScheduler(
+            self,
+            window_seconds=Config.LOCAL_GEN_BATCH_WINDOW_MS / 1000,
+            max_batch_size=Config.LOCAL_GEN_MAX_BATCH,
+            max_queue=Config.LOCAL_GEN_MAX_QUEUE
+        )
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked() or self.scheduler.pending > 0
+
+    def ensure_adapter(self, adapter_name, adapter_path):
+        """按名称挂载 LoRA 适配器，已挂载则直接返回"""
+        if self.adapters.get(adapter_name) == adapter_path:
+            return
+        if adapter_name in self.adapters:
+            self.remove_adapter(adapter_name)
+        logger.info(f"挂载 LoRA 适配器 {adapter_name}: {adapter_path}")
+        if isinstance(self.model, PeftModel):
+            self.model.load_adapter(adapter_path, adapter_name=adapter_name)
+        else:
+            self.model = PeftModel.from_pretrained(self.model, adapter_path, adapter_name=adapter_name)
+            self.model.eval()
+        self.adapters[adapter_name] = adapter_path
+        self.size_bytes = _memory_footprint(self.model)
+
+    def remove_adapter(self, adapter_name):
+        if adapter_name not in self.adapters:
+            return
+        del self.adapters[adapter_name]
+        if self.adapters:
+            # PEFT 不允许删除当前激活的适配器，先切到其他适配器
+            if self.model.active_adapter == adapter_name:
+                self.model.set_adapter(next(iter(self.adapters)))
+            self.model.delete_adapter(adapter_name)
+        else:
+            self.model = self.model.unload()
+        self.size_bytes = _memory_footprint(self.model)
+
+    def generate(self, adapter_names=None, **kwargs):
+        """
+        在指定适配器上生成
+        :param adapter_names: None 表示基座；字符串表示整个批次使用该适配器；
+                              列表则为批次内每条样本指定适配器（None 表示基座）
+        """
+        names = adapter_names if isinstance(adapter_names, list) else [adapter_names]
+        distinct = set(names)
+        if distinct == {None}:
+            if isinstance(self.model, PeftModel):
+                with self.model.disable_adapter():
+                    return self.model.generate(**kwargs)
+            return self.model.generate(**kwargs)
+        if len(distinct) == 1:
+            self.model.set_adapter(names[0])
+            return self.model.generate(**kwargs)
+        if not PEFT_MIXED_BATCH:
+            raise ValueError("当前 PEFT 版本不支持在同一批次中混合多个适配器")
+        return self.model.generate(adapter_names=[name or BASE_ADAPTER for name in names], **kwargs)
+
+
+class LocalModelRegistry:
+    """
+    本地 HuggingFace 模型常驻注册表
+    - 每个基座（路径 + 量化方式）只从磁盘加载一次，之后的对话直接复用
+    - 基于同一基座的微调模型以 LoRA 适配器的形式挂载在这份基座上，按名称切换
+    - 按内存预算做 LRU 淘汰，正在推理的模型不会被淘汰
+    - 同一 key 的并发加载只会执行一次
+    """
+
+    def __init__(self, memory_budget_bytes: int):
+        self._memory_budget_bytes = memory_budget_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> LoadedModel
+        self._loading_locks = {}
+
+    def get(self, key, loader) -> LoadedModel:
+        """
+        获取常驻模型，不存在时调用 loader() -> (model, tokenizer) 加载
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+
+        with loading_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry
+            logger.info(f"加载本地模型: {key}")
+            model, tokenizer = loader()
+            entry = LoadedModel(key, model, tokenizer)
+            with self._lock:
+                self._entries[key] = entry
+                self._loading_locks.pop(key, None)
+                self._evict_over_budget(keep=key)
+            logger.info(f"本地模型已常驻: {key}，占用约 {entry.size_bytes / 1024 ** 2:.0f} MB")
+            return entry
+
+    def _evict_over_budget(self, keep=None):
+        """淘汰最久未使用且空闲的模型，直到总占用不超过预算（调用方持有 self._lock）"""
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        for key in list(self._entries.keys()):
+            if total <= self._memory_budget_bytes:
+                break
+            entry = self._entries[key]
+            if key == keep or entry.busy:
+                continue
+            del self._entries[key]
+            total -= entry.size_bytes
+            logger.info(f"内存预算不足，淘汰本地模型: {key}")
+        self._release_memory()
+
+    def evict(self, key) -> bool:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        # 等待正在进行的推理结束后再释放
+        with entry.lock:
+            pass
+        self._release_memory()
+        return True
+
+    def evict_where(self, predicate) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+        return sum(1 for key in keys if self.evict(key))
+
+    def remove_adapters_where(self, predicate) -> int:
+        """从所有常驻基座上卸载满足 predicate(name, path) 的适配器"""
+        with self._lock:
+            entries = list(self._entries.values())
+        removed = 0
+        for entry in entries:
+            with entry.lock:
+                for name, path in list(entry.adapters.items()):
+                    if predicate(name, path):
+                        entry.remove_adapter(name)
+                        removed += 1
+        if removed:
+            self._release_memory()
+        return removed
+
+    def get_base(self, model_path, load_in_4bit=False) -> LoadedModel:
+        load_in_4bit = bool(load_in_4bit)
+        return self.get((model_path, load_in_4bit), lambda: load_base_model(model_path, load_in_4bit))
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def stats(self) -> list:
+        with self._lock:
+            return [
+                {"key": str(key), "size_mb": round(entry.size_bytes / 1024 ** 2, 1), "busy": entry.busy,
+                 "adapters": list(entry.adapters)}
+                for key, entry in self._entries.items()
+            ]
+
+
+local_model_registry = LocalModelRegistry(Config.LOCAL_MODEL_MEMORY_BUDGET_MB * 1024 ** 2)
@@ -0,0 +1,65 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import Config
+
+logger = logging.getLogger("PasswordHasher")
+
+
+class PasswordHasherBusy(Exception):
+    """等待哈希的请求超过上限"""
+
+
+class PasswordHasher:
+    """
+    在专用线程池中计算和校验 bcrypt 哈希（bcrypt 计算时释放 GIL）
+    - 线程数固定，并发的登录/注册只占用这几个线程的 CPU，不会拖慢其他请求
+    - 排队（含执行中）的任务数超过 max_pending 时直接拒绝，不在请求线程上无限等待
+    - 只接受 cost 等于 rounds 的哈希，cost 调整后旧哈希在登录成功时重新计算
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                                    bcrypt__default_rounds=rounds,
+                                    bcrypt__min_rounds=rounds,
+                                    bcrypt__max_rounds=rounds)
+        self._workers = max(workers, 1)
+        self._slots = threading.BoundedSemaphore(max(max_pending, self._workers))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            logger.warning("密码哈希任务已满，拒绝请求")
+            raise PasswordHasherBusy("密码校验繁忙，请稍后再试")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password: str) -> str:
+        return self._run(self.context.hash, password)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(self.context.verify, password, hashed)
+
+    def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """返回 (是否匹配, 新哈希)；哈希参数过期时新哈希不为 None"""
+        return self._run(self.context.verify_and_update, password, hashed)
+
+
+password_hasher = PasswordHasher(Config.PASSWORD_HASH_WORKERS, Config.PASSWORD_HASH_MAX_PENDING, Config.BCRYPT_ROUNDS)
@@ -1,7 +1,10 @@
 import redis
 
+from app.config import Config
+
+
 class ConversationStore:
-    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0):
+    def __init__(self, host: str = Config.REDIS_HOST, port: int = Config.REDIS_PORT, db: int = Config.REDIS_DB):
         """初始化Redis连接"""
         self.redis_client = redis.Redis(
             host=host,
@@ -12,4 +15,3 @@ class ConversationStore:
 
     def get_redis_client(self):
         return self.redis_client
-
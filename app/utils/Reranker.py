@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from app.config import Config
+
+logger = logging.getLogger("Reranker")
+
+# sentence-transformers 自带 CrossEncoder，未安装时重排序不可用，检索结果保持向量检索顺序
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CrossEncoder = None
+    CROSS_ENCODER_AVAILABLE = False
+
+
+class CrossEncoderReranker:
+    """
+    本地 cross-encoder 重排序（CPU 推理）
+    - 模型在后台线程中懒加载，加载完成前的请求直接返回原顺序
+    - 候选按 batch_size 分批打分，每批之前检查时间预算，超时则放弃重排，回退原顺序
+    - 模型加载失败后不再重试，直到进程重启
+    """
+
+    def __init__(self, model_name: str, batch_size: int, max_length: int):
+        self.model_name = model_name
+        self.batch_size = max(batch_size, 1)
+        self.max_length = max_length
+        self._model = None
+        self._loading = False
+        self._failed = False
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return CROSS_ENCODER_AVAILABLE and bool(self.model_name) and not self._failed
+
+    def _load(self) -> None:
+        started = time.monotonic()
+        try:
+            model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            self._model = model
+            logger.info(f"重排序模型 {self.model_name} 加载完成，耗时 {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            self._failed = True
+            logger.error(f"重排序模型 {self.model_name} 加载失败: {str(e)}")
+        finally:
+            self._loading = False
+
+    def warmup(self, wait: bool = False):
+        """触发模型加载，wait=False 时在后台线程中加载；返回已加载的模型或 None"""
+        if self._model is not None or not self.available:
+            return self._model
+        with self._lock:
+            if self._model is None and not self._loading and not self._failed:
+                self._loading = True
+                if wait:
+                    self._load()
+                else:
+                    threading.Thread(target=self._load, name="reranker-loader", daemon=True).start()
+        return self._model
+
+    def rerank(self, query: str, hits: List[dict], top_n: int, time_budget: Optional[float] = None) -> List[dict]:
+        """
+        :param hits: 检索结果（含 text），按向量检索分数排序
+        :param top_n: 保留条数
+        :param time_budget: 打分时间预算（秒），None 表示不限
+        :return: 重排后的前 top_n 条（附 rerank_score）；不可用或超时时为原顺序的前 top_n 条
+        """
+        if len(hits) <= 1:
+            return hits[:top_n]
+        model = self.warmup()
+        if model is None:
+            return hits[:top_n]
+
+        started = time.monotonic()
+        scores = []
+        for start in range(0, len(hits), self.batch_size):
+            if time_budget is not None and time.monotonic() - started > time_budget:
+                logger.warning(f"重排序超出时间预算 {time_budget * 1000:.0f}ms，"
+                               f"已打分 {len(scores)}/{len(hits)} 条，使用原顺序")
+                return hits[:top_n]
+            pairs = [(query, hit.get("text") or "") for hit in hits[start:start + self.batch_size]]
+            try:
+                batch_scores = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            except Exception as e:
+                logger.error(f"重排序打分失败，使用原顺序: {str(e)}")
+                return hits[:top_n]
+            scores.extend(float(score) for score in batch_scores)
+
+        order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [dict(hits[i], rerank_score=scores[i]) for i in order]
+
+
+reranker = CrossEncoderReranker(Config.RERANK_MODEL, Config.RERANK_BATCH_SIZE, Config.RERANK_MAX_LENGTH)
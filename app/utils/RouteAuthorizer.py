@@ -0,0 +1,194 @@
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import redis
+
+from app.config import Config
+from app.extensions import db
+from app.models.permission import Role, Route, RoleRoute
+
+logger = logging.getLogger("RouteAuthorizer")
+
+VERSION_KEY = "auth:routes:version"
+CHANNEL = "auth:routes:changed"
+PARAM_PATTERN = re.compile(r'<[^>]+>')
+
+
+class _Node:
+    __slots__ = ("static", "param", "patterns", "route")
+
+    def __init__(self):
+        self.static: Dict[str, "_Node"] = {}
+        self.param: Optional["_Node"] = None  # 整段是变量，如 <int:id>
+        self.patterns: List[tuple] = []  # 段内混合变量，如 file_<name>.txt -> (正则, 子节点)
+        self.route = None  # (route_id, bit, path)
+
+
+class RouteIndex:
+    """
+    路由授权索引（构建后只读）
+    - 每个 HTTP 方法一棵按路径段组织的前缀树，<...> 变量匹配任意非空段
+    - 每个路由分配一个位，角色可访问的路由集合为一个整数位图
+    多个路由同时匹配时取 id 最小的一个，与原先按查询顺序取第一个匹配一致
+    """
+
+    def __init__(self, routes, role_routes, roles):
+        self.trees: Dict[str, _Node] = {}
+        self.role_names: Dict[int, str] = dict(roles)
+        self.role_bits: Dict[int, int] = {}
+        bits = {}
+        for bit, (route_id, path, method) in enumerate(sorted(routes)):
+            bits[route_id] = bit
+            self._insert((method or "GET").upper(), path, (route_id, bit, path))
+        for role_id, route_id in role_routes:
+            if route_id in bits:
+                self.role_bits[role_id] = self.role_bits.get(role_id, 0) | (1 << bits[route_id])
+
+    def _insert(self, method: str, path: str, route) -> None:
+        node = self.trees.setdefault(method, _Node())
+        for segment in path.split("/"):
+            if PARAM_PATTERN.fullmatch(segment):
+                node.param = node.param or _Node()
+                node = node.param
+            elif PARAM_PATTERN.search(segment):
+                pattern = re.compile(
+                    "[^/]+".join(re.escape(part) for part in PARAM_PATTERN.split(segment)))
+                child = next((c for p, c in node.patterns if p.pattern == pattern.pattern), None)
+                if child is None:
+                    child = _Node()
+                    node.patterns.append((pattern, child))
+                node = child
+            else:
+                node = node.static.setdefault(segment, _Node())
+        if node.route is None or route[0] < node.route[0]:
+            node.route = route
+
+    def match(self, method: str, path: str):
+        """返回 (route_id, bit, 路由路径)，没有匹配时返回 None"""
+        root = self.trees.get(method.upper())
+        if root is None:
+            return None
+        segments = path.split("/")
+        best = None
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(segments):
+                if node.route is not None and (best is None or node.route[0] < best[0]):
+                    best = node.route
+                continue
+            segment = segments[depth]
+            child = node.static.get(segment)
+            if child is not None:
+                stack.append((child, depth + 1))
+            if node.param is not None and segment:
+                stack.append((node.param, depth + 1))
+            for pattern, child in node.patterns:
+                if pattern.fullmatch(segment):
+                    stack.append((child, depth + 1))
+        return best
+
+    def has_role(self, role_id: int) -> bool:
+        return role_id in self.role_names
+
+    def allows(self, role_id: int, route) -> bool:
+        return bool((self.role_bits.get(role_id, 0) >> route[1]) & 1)
+
+
+class RouteAuthorizer:
+    """
+    持有当前的 RouteIndex，并在权限变更后重建
+    - 权限修改后调用 invalidate()：本进程标记过期，并通过 Redis 递增版本号、发布消息通知其他 worker
+    - 后台线程订阅通知，收到更高版本时标记过期；下一次鉴权时在请求上下文中重建，重建完成后整体替换
+    - Redis 不可用时按 AUTH_INDEX_TTL 定期重建，作为兜底
+    """
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._index: Optional[RouteIndex] = None
+        self._built_at = 0.0
+        self._version = 0
+        self._stale = True
+        self._lock = threading.Lock()
+        self._redis = None
+        self._listener = None
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB,
+                                      decode_responses=True)
+        return self._redis
+
+    def _start_listener(self) -> None:
+        if self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name="route-authorizer", daemon=True)
+        self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # 订阅期间可能错过通知，重新订阅后按最新版本判断一次
+                self._on_version(self._get_redis().get(VERSION_KEY))
+                for message in pubsub.listen():
+                    self._on_version(message.get("data"))
+            except Exception as e:
+                logger.warning(f"路由权限变更订阅中断，5 秒后重试: {str(e)}")
+                time.sleep(5)
+
+    def _on_version(self, version) -> None:
+        try:
+            version = int(version or 0)
+        except (TypeError, ValueError):
+            return
+        if version > self._version:
+            self._stale = True
+
+    def _build(self) -> None:
+        started = time.perf_counter()
+        version = self._version
+        try:
+            version = int(self._get_redis().get(VERSION_KEY) or 0)
+        except Exception as e:
+            logger.warning(f"读取路由权限版本失败: {str(e)}")
+        routes = db.session.query(Route.id, Route.path, Route.method).all()
+        role_routes = db.session.query(RoleRoute.role_id, RoleRoute.route_id).all()
+        roles = db.session.query(Role.id, Role.name).all()
+        index = RouteIndex(routes, role_routes, roles)
+        self._index, self._version, self._built_at = index, version, time.monotonic()
+        logger.info(f"路由授权索引已重建（版本 {version}，{len(routes)} 个路由，{len(roles)} 个角色，"
+                    f"耗时 {(time.perf_counter() - started) * 1000:.1f}ms）")
+
+    def get_index(self) -> RouteIndex:
+        """需要在应用上下文中调用（过期时查库重建）"""
+        self._start_listener()
+        if self._stale or self._index is None or time.monotonic() - self._built_at > self._ttl:
+            with self._lock:
+                if self._stale or self._index is None or time.monotonic() - self._built_at > self._ttl:
+                    # 先清除标记：重建期间到达的新通知会再次标记过期
+                    self._stale = False
+                    try:
+                        self._build()
+                    except Exception:
+                        self._stale = True
+                        if self._index is None:
+                            raise
+                        logger.error("路由授权索引重建失败，继续使用旧索引", exc_info=True)
+        return self._index
+
+    def invalidate(self) -> None:
+        """路由或角色权限变更后调用"""
+        self._stale = True
+        try:
+            client = self._get_redis()
+            client.publish(CHANNEL, client.incr(VERSION_KEY))
+        except Exception as e:
+            logger.warning(f"广播路由权限变更失败，其他进程将在 {self._ttl:.0f} 秒内刷新: {str(e)}")
+
+
+route_authorizer = RouteAuthorizer(Config.AUTH_INDEX_TTL)
@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+
+from app.config import Config
+
+logger = logging.getLogger("TokenCache")
+
+REVOKED_KEY_PREFIX = "auth:revoked:"
+CHANNEL = "auth:tokens:revoked"
+
+REVOKED = object()  # lookup 返回值：令牌已注销
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    已验证令牌的 claims 缓存（按令牌摘要索引，LRU 淘汰）
+    - 条目在令牌 exp 到期，且最多保留 ttl 秒（注销通知丢失时的兜底）
+    - 注销列表与缓存在同一次查找中检查；注销写入 Redis（过期时间为令牌剩余有效期）并发布通知，
+      后台线程订阅通知，把其他 worker 注销的令牌加入本地注销列表并移除缓存
+    - 未命中缓存的令牌验签后再查一次 Redis 注销记录；Redis 不可用时只依据本地注销列表
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # digest -> (claims, 缓存到期时间)
+        self._revoked = {}  # digest -> 令牌 exp
+        self._lock = threading.Lock()
+        self._redis = None
+        self._listener = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB,
+                                      decode_responses=True)
+        return self._redis
+
+    def _start_listener(self) -> None:
+        if self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name="token-revocation", daemon=True)
+        self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    digest, _, exp = str(message.get("data") or "").partition(":")
+                    if digest:
+                        self._mark_revoked(digest, float(exp or 0) or time.time() + self._ttl)
+            except Exception as e:
+                logger.warning(f"令牌注销订阅中断，5 秒后重试: {str(e)}")
+                time.sleep(5)
+
+    def _mark_revoked(self, digest: str, exp: float) -> None:
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked[digest] = exp
+
+    def lookup(self, digest: str):
+        """返回缓存的 claims；已注销时返回 REVOKED；未命中或已过期返回 None"""
+        self._start_listener()
+        now = time.time()
+        with self._lock:
+            exp = self._revoked.get(digest)
+            if exp is not None:
+                if exp > now:
+                    return REVOKED
+                del self._revoked[digest]
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def is_revoked_remote(self, digest: str) -> bool:
+        """查询 Redis 中的注销记录（缓存未命中时调用）"""
+        try:
+            return bool(self._get_redis().exists(REVOKED_KEY_PREFIX + digest))
+        except Exception as e:
+            logger.warning(f"查询令牌注销记录失败: {str(e)}")
+            return False
+
+    def put(self, digest: str, claims: dict) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        expires = min(float(claims.get("exp", now + self._ttl)), now + self._ttl)
+        if expires <= now:
+            return
+        with self._lock:
+            self._entries[digest] = (claims, expires)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+            if len(self._revoked) > self._max_size:
+                # 注销列表只需保留到令牌自然过期
+                self._revoked = {d: e for d, e in self._revoked.items() if e > now}
+
+    def revoke(self, digest: str, exp: Optional[float]) -> None:
+        """注销令牌，exp 为令牌过期时间（秒级时间戳）"""
+        now = time.time()
+        exp = float(exp) if exp else now + Config.access_token_expire_minutes * 60
+        self._mark_revoked(digest, exp)
+        try:
+            client = self._get_redis()
+            client.set(REVOKED_KEY_PREFIX + digest, 1, ex=max(int(exp - now) + 1, 1))
+            client.publish(CHANNEL, f"{digest}:{exp:.0f}")
+        except Exception as e:
+            logger.warning(f"广播令牌注销失败，其他进程将在 {self._ttl:.0f} 秒内失效: {str(e)}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = VerifiedTokenCache(Config.AUTH_TOKEN_CACHE_SIZE, Config.AUTH_TOKEN_CACHE_TTL)
@@ -1,5 +1,9 @@
+import threading
+import time
+from collections import OrderedDict
 from typing import List, Sequence, Dict
 from llama_index.core.llms import ChatMessage
+from app.config import Config
 from app.models.model_config import ModelConfig
 from app.models.model_info import ModelInfo
 from app.extensions import db
@@ -7,8 +11,83 @@ from app.utils.LLMModel import ChatGLM
 from app.utils.EmbbedingModel import ChatEmbeddings
 
 
+class ModelRegistry:
+    """
+    模型实例 LRU 注册表
+    - 以 (类型, id) 为键缓存 ChatGLM / ChatEmbeddings 实例，实例内部复用同一个 OpenAI client
+    - 每个条目记录创建时配置的 update_at 版本，超过 ttl 后用一次轻量查询校验版本，版本未变则继续复用
+    - ModelMapper 更新/删除配置时主动调用 invalidate
+    """
+
+    def __init__(self, max_size: int = 64, ttl: float = 60):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, instance, checked_at)
+
+    def get(self, key, version_loader):
+        """
+        命中且未过期直接返回；过期后调用 version_loader 校验版本
+        :return: (instance, version)，未命中或版本失效时 instance 为 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            return None, None
+        version, instance, checked_at = entry
+        if time.monotonic() - checked_at < self._ttl:
+            return instance, version
+        current_version = version_loader()
+        if current_version != version:
+            self.invalidate(key)
+            return None, current_version
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (version, instance, time.monotonic())
+        return instance, version
+
+    def put(self, key, version, instance):
+        with self._lock:
+            self._entries[key] = (version, instance, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+model_registry = ModelRegistry(max_size=Config.MODEL_REGISTRY_MAX_SIZE, ttl=Config.MODEL_REGISTRY_TTL)
+
+
+def _chat_version(model_config_id: int):
+    """聊天模型版本：(配置 update_at, 基础模型 update_at)，一次联表查询"""
+    row = db.session.query(ModelConfig.update_at, ModelInfo.update_at) \
+        .join(ModelInfo, ModelConfig.base_model_id == ModelInfo.id) \
+        .filter(ModelConfig.id == model_config_id) \
+        .first()
+    return tuple(row) if row else None
+
+
+def _embedding_version(model_info_id: int):
+    row = db.session.query(ModelInfo.update_at).filter(ModelInfo.id == model_info_id).first()
+    return row[0] if row else None
+
+
 # 通过model_config_id获取聊天模型
 def get_chatllm(model_config_id: int):
+    key = ("chat", int(model_config_id))
+    cached, _ = model_registry.get(key, lambda: _chat_version(model_config_id))
+    if cached is not None:
+        return cached
+
     model_config = ModelConfig.query.get(model_config_id)
     if not model_config:
         raise Exception("模型配置不存在")
@@ -33,15 +112,24 @@ def get_chatllm(model_config_id: int):
             base_url=base_url,
             system_prompt=prompt,
             temperature=temperature,
-            top_p=top_p
+            top_p=top_p,
+            context_window=Config.CHAT_CONTEXT_WINDOW,
+            num_output=Config.CHAT_NUM_OUTPUT
         )
-        return ChatModel
     except Exception as e:
         raise Exception("聊天模型创建失败："+str(e))
+    model_registry.put(key, (model_config.update_at, base_model_info.update_at), ChatModel)
+    return ChatModel
 
 
 # 通过model_info_id获取嵌入模型
+# model_info 只在数据库中维护（应用内没有写入接口），修改后由 update_at 版本校验在 TTL 内发现并重建
 def get_embedding(model_info_id: int):
+    key = ("embedding", int(model_info_id))
+    cached, _ = model_registry.get(key, lambda: _embedding_version(model_info_id))
+    if cached is not None:
+        return cached
+
     model_info = ModelInfo.query.get(model_info_id)
     if not model_info:
         raise Exception("模型信息不存在")
@@ -52,8 +140,12 @@ def get_embedding(model_info_id: int):
             base_url=model_info.base_url,
             api_key=model_info.api_key
         )
-        return embedding_model
-
     except Exception as e:
         raise Exception("聊天模型创建失败："+str(e))
+    model_registry.put(key, model_info.update_at, embedding_model)
+    return embedding_model
+
 
+def invalidate_chatllm(model_config_id: int):
+    """模型配置更新或删除后清除缓存的聊天模型"""
+    model_registry.invalidate(("chat", int(model_config_id)))
@@ -1,6 +1,8 @@
 import chromadb
 import logging
 import os
+import threading
+import requests
 from app.config import Config
 from chromadb.config import Settings
 
@@ -8,14 +10,40 @@ from chromadb.config import Settings
 logger = logging.getLogger("chromadb_utils")
 logger.setLevel(logging.INFO)
 
-# 初始化 ChromDB 客户端
-def get_chromadb_client():
+BACKEND_HTTP = "http"
+BACKEND_PERSISTENT = "persistent"
+
+
+def collection_name_of(vector_db_id) -> str:
+    """向量数据库对应的 ChromaDB 集合名"""
+    return f"vector_db_{vector_db_id}"
+
+
+def is_connection_error(e: Exception) -> bool:
+    """HTTP 客户端（基于 requests）连接失败或超时，需要重新建立连接"""
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          ConnectionError, TimeoutError))
+
+
+class ChromaClientManager:
     """
-    获取 ChromaDB 客户端
-    优先尝试 HTTP 客户端（Docker 服务），如果失败则使用本地持久化客户端
+    进程级 ChromaDB 客户端管理器
+    - 整个进程只维护一个长连接客户端，避免每次调用都新建 HttpClient 并 heartbeat
+    - 后台线程定期做健康检查，HTTP 服务不可用时切换到本地持久化客户端，服务恢复后切回
+    - 按集合名（vector_db_{id}）缓存集合句柄，切换后端时清空缓存
     """
-    # 首先尝试使用 HTTP 客户端（Docker 服务）
-    try:
+
+    def __init__(self, health_check_interval: float = None):
+        self._lock = threading.RLock()
+        self._client = None
+        self._backend = None
+        self._collections = {}
+        self._health_check_interval = health_check_interval or Config.CHROMA_HEALTH_CHECK_INTERVAL
+        self._health_thread = None
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _create_http_client():
         logger.info(f"尝试连接到 ChromaDB 服务器: {Config.CHROMA_SERVER_HOST}:{Config.CHROMA_SERVER_PORT}")
         client = chromadb.HttpClient(
             host=Config.CHROMA_SERVER_HOST,
@@ -30,19 +58,145 @@ def get_chromadb_client():
         heartbeat = client.heartbeat()
         logger.info(f"成功连接到 ChromaDB 服务器: {heartbeat}")
         return client
-    except Exception as e:
-        logger.warning(f"ChromaDB 服务器连接失败: {str(e)}，尝试使用本地持久化模式")
-    
-    # 如果 HTTP 客户端失败，使用本地持久化客户端
-    try:
+
+    @staticmethod
+    def _create_persistent_client():
         # 创建本地数据目录
         chroma_data_dir = os.path.join(Config.PROJECT_ROOT, "chroma_data")
         os.makedirs(chroma_data_dir, exist_ok=True)
-        
+
         logger.info(f"使用本地 ChromaDB 持久化模式，数据目录: {chroma_data_dir}")
         client = chromadb.PersistentClient(path=chroma_data_dir)
         logger.info("成功初始化本地 ChromaDB 客户端")
         return client
-    except Exception as e:
-        logger.error(f"本地 ChromaDB 初始化失败: {str(e)}")
-        return None
\ No newline at end of file
+
+    def _set_client(self, client, backend):
+        """切换客户端，后端变化时清空集合缓存"""
+        if backend != self._backend:
+            self._collections.clear()
+            if self._backend is not None:
+                logger.warning(f"ChromaDB 后端切换: {self._backend} -> {backend}")
+        self._client = client
+        self._backend = backend
+
+    def _connect(self):
+        """优先尝试 HTTP 客户端（Docker 服务），如果失败则使用本地持久化客户端"""
+        try:
+            self._set_client(self._create_http_client(), BACKEND_HTTP)
+            return self._client
+        except Exception as e:
+            logger.warning(f"ChromaDB 服务器连接失败: {str(e)}，尝试使用本地持久化模式")
+
+        try:
+            self._set_client(self._create_persistent_client(), BACKEND_PERSISTENT)
+            return self._client
+        except Exception as e:
+            logger.error(f"本地 ChromaDB 初始化失败: {str(e)}")
+            self._set_client(None, None)
+            return None
+
+    def get_client(self):
+        """获取当前客户端，首次调用时建立连接并启动健康检查线程"""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                self._connect()
+            self._start_health_check()
+            return self._client
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def get_collection(self, name: str):
+        """获取集合句柄（带缓存），集合不存在时抛出 ChromaDB 原始异常"""
+        collection = self._collections.get(name)
+        if collection is not None:
+            return collection
+        client = self.get_client()
+        if client is None:
+            return None
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = client.get_collection(name=name)
+                self._collections[name] = collection
+            return collection
+
+    def cache_collection(self, name: str, collection):
+        with self._lock:
+            self._collections[name] = collection
+
+    def invalidate_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def mark_unhealthy(self, client=None):
+        """
+        调用方遇到连接错误时主动触发重连
+        :param client: 出错时使用的客户端；已被其他请求或健康检查替换时不再重连，避免并发请求重复重连
+        """
+        with self._lock:
+            if client is not None and client is not self._client:
+                return
+            logger.warning("ChromaDB 请求连接失败，重新建立连接")
+            self._connect()
+
+    def _health_check_once(self):
+        with self._lock:
+            if self._client is None:
+                self._connect()
+                return
+            if self._backend == BACKEND_HTTP:
+                try:
+                    self._client.heartbeat()
+                except Exception as e:
+                    logger.warning(f"ChromaDB 健康检查失败: {str(e)}，重新建立连接")
+                    self._connect()
+                return
+        # 当前使用本地持久化客户端，尝试切回 HTTP 服务；连接在锁外建立，避免阻塞业务请求
+        try:
+            client = self._create_http_client()
+        except Exception:
+            return
+        with self._lock:
+            self._set_client(client, BACKEND_HTTP)
+
+    def _health_check_loop(self):
+        while not self._stop_event.wait(self._health_check_interval):
+            try:
+                self._health_check_once()
+            except Exception as e:
+                logger.error(f"ChromaDB 健康检查异常: {str(e)}")
+
+    def _start_health_check(self):
+        if self._health_check_interval <= 0:
+            return
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._health_thread = threading.Thread(
+            target=self._health_check_loop,
+            name="chromadb-health-check",
+            daemon=True
+        )
+        self._health_thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        with self._lock:
+            self._set_client(None, None)
+
+
+chroma_manager = ChromaClientManager()
+
+
+# 初始化 ChromDB 客户端
+def get_chromadb_client():
+    """
+    获取 ChromaDB 客户端
+    返回进程级共享的客户端，连接与健康检查由 ChromaClientManager 负责
+    """
+    return chroma_manager.get_client()
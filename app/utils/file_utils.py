@@ -1,4 +1,5 @@
 # app/utils/file_utils.py
+import hashlib
 import os
 import uuid
 import shutil
@@ -30,4 +31,13 @@ def save_uploaded_file(file, save_dir):
         return unique_filename
     except Exception as e:
         logger.error(f"文件保存失败: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+def file_sha256(path, buffer_size=1024 * 1024):
+    """分块计算文件的 SHA-256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(buffer_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
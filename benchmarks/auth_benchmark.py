@@ -0,0 +1,79 @@
+"""
+login_required 鉴权开销微基准（不连接数据库和 Redis）
+
+    python -m benchmarks.auth_benchmark [-n 20000] [--routes 300]
+
+分别统计每次请求的耗时：
+- decode：仅 jwt.decode（验签 + 解析 claims）
+- verify_jwt：命中已验证令牌缓存
+- decorator（缓存关闭 / 开启）：完整的 login_required（取令牌、验证、路由授权、构建 request.user）
+"""
+import argparse
+import time
+
+from flask import Flask, request
+
+from app.config import Config
+from app.utils import JwtUtil
+from app.utils.RouteAuthorizer import RouteIndex, route_authorizer
+from app.utils.TokenCache import token_cache
+
+
+def _install_index(route_count: int) -> str:
+    """构造 route_count 个路由的授权索引，返回被测请求路径"""
+    routes = [(i + 1, f"/bench/r{i}/<int:id>", "GET") for i in range(route_count)]
+    role_routes = [(1, i + 1) for i in range(route_count)]
+    route_authorizer._index = RouteIndex(routes, role_routes, [(1, "bench")])
+    route_authorizer._built_at = time.monotonic() + 10 ** 9
+    route_authorizer._stale = False
+    route_authorizer._listener = object()  # 不启动 Redis 订阅线程
+    return f"/bench/r{route_count - 1}/42"
+
+
+def _timeit(fn, n: int) -> float:
+    for _ in range(min(n, 1000)):
+        fn()
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=20000, help="每项的迭代次数")
+    parser.add_argument("--routes", type=int, default=300, help="授权索引中的路由数")
+    args = parser.parse_args()
+
+    path = _install_index(args.routes)
+    token = JwtUtil.generate_jwt(1, "bench", "bench@example.com", 1)
+    app = Flask(__name__)
+    view = JwtUtil.login_required(lambda: request.user.id)
+
+    def call_decorator():
+        with app.test_request_context(path, headers={"Authorization": f"Bearer {token}"}):
+            assert view() == 1
+
+    def decode():
+        JwtUtil.jwt.decode(token, Config.secret_key, algorithms=["HS256"])
+
+    # 不查询 Redis 注销记录，只比较本地开销
+    token_cache.is_revoked_remote = lambda digest: False
+    token_cache._listener = object()
+
+    results = [("decode", _timeit(decode, args.n))]
+    cache_size = token_cache._max_size
+    token_cache._max_size = 0
+    results.append(("decorator（缓存关闭）", _timeit(call_decorator, args.n)))
+    token_cache._max_size = cache_size
+    JwtUtil.verify_jwt(token)
+    results.append(("verify_jwt（缓存命中）", _timeit(lambda: JwtUtil.verify_jwt(token), args.n)))
+    results.append(("decorator（缓存开启）", _timeit(call_decorator, args.n)))
+
+    print(f"路由数 {args.routes}，迭代 {args.n} 次")
+    for name, micros in results:
+        print(f"{name:<24}{micros:8.2f} µs/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+-- 批量上传：ingestion_job 增加批次ID，新增 /vector/upload/bulk 路由
+-- 如果使用 db.create_all()，新建表时会自动包含该列，已有表需执行 ALTER
+
+-- 1. 批次ID列及索引
+ALTER TABLE ingestion_job ADD COLUMN batch_id VARCHAR(32) NULL COMMENT '批量上传的批次ID' AFTER vector_db_id;
+CREATE INDEX idx_ingestion_job_batch_id ON ingestion_job (batch_id);
+
+-- 2. 插入路由（如果不存在）
+INSERT INTO routes (path, name, component, method, created_at, updated_at)
+SELECT '/vector/upload/bulk', '批量上传文件', 'VectorDbDetail', 'POST', NOW(), NOW()
+WHERE NOT EXISTS (
+    SELECT 1 FROM routes WHERE path = '/vector/upload/bulk' AND method = 'POST'
+);
+
+-- 3. 获取路由ID
+SET @route_id = (SELECT id FROM routes WHERE path = '/vector/upload/bulk' AND method = 'POST' LIMIT 1);
+
+-- 4. 与 /vector/upload 拥有相同权限的角色同样获得该路由权限
+INSERT INTO role_routes (role_id, route_id, created_at)
+SELECT rr.role_id, @route_id, NOW()
+FROM role_routes rr
+JOIN routes r ON r.id = rr.route_id
+WHERE r.path = '/vector/upload' AND r.method = 'POST'
+AND NOT EXISTS (
+    SELECT 1 FROM role_routes x
+    WHERE x.role_id = rr.role_id AND x.route_id = @route_id
+);
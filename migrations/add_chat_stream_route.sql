@@ -0,0 +1,22 @@
+-- 添加 /chat/stream 流式对话路由（Server-Sent Events）
+
+-- 1. 插入路由（如果不存在）
+INSERT INTO routes (path, name, component, method, created_at, updated_at)
+SELECT '/chat/stream', '流式对话', 'Chat', 'POST', NOW(), NOW()
+WHERE NOT EXISTS (
+    SELECT 1 FROM routes WHERE path = '/chat/stream' AND method = 'POST'
+);
+
+-- 2. 获取路由ID
+SET @route_id = (SELECT id FROM routes WHERE path = '/chat/stream' AND method = 'POST' LIMIT 1);
+
+-- 3. 与 /chat/ 拥有相同权限的角色同样获得该路由权限
+INSERT INTO role_routes (role_id, route_id, created_at)
+SELECT rr.role_id, @route_id, NOW()
+FROM role_routes rr
+JOIN routes r ON r.id = rr.route_id
+WHERE r.path = '/chat/' AND r.method = 'POST'
+AND NOT EXISTS (
+    SELECT 1 FROM role_routes x
+    WHERE x.role_id = rr.role_id AND x.route_id = @route_id
+);
@@ -0,0 +1,26 @@
+-- 对话列表分页：新增 /chat/conversations 路由及列表/窗口查询所需的复合索引
+
+-- 1. 复合索引（游标分页按 user_id + update_at + id，最新消息按 conversation_id + create_at）
+CREATE INDEX idx_conversation_user_update ON conversation (user_id, update_at, id);
+CREATE INDEX idx_message_conversation_create ON message (conversation_id, create_at);
+
+-- 2. 插入路由（如果不存在）
+INSERT INTO routes (path, name, component, method, created_at, updated_at)
+SELECT '/chat/conversations', '对话列表分页', 'Chat', 'GET', NOW(), NOW()
+WHERE NOT EXISTS (
+    SELECT 1 FROM routes WHERE path = '/chat/conversations' AND method = 'GET'
+);
+
+-- 3. 获取路由ID
+SET @route_id = (SELECT id FROM routes WHERE path = '/chat/conversations' AND method = 'GET' LIMIT 1);
+
+-- 4. 与 /chat/histories 拥有相同权限的角色同样获得该路由权限
+INSERT INTO role_routes (role_id, route_id, created_at)
+SELECT rr.role_id, @route_id, NOW()
+FROM role_routes rr
+JOIN routes r ON r.id = rr.route_id
+WHERE r.path = '/chat/histories' AND r.method = 'GET'
+AND NOT EXISTS (
+    SELECT 1 FROM role_routes x
+    WHERE x.role_id = rr.role_id AND x.route_id = @route_id
+);
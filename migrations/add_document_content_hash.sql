@@ -0,0 +1,5 @@
+-- 文档内容哈希：上传时检测重复文件，同名文件重新上传时按分块哈希增量更新
+-- 分块哈希保存在向量元数据（chunk_hash）中，无需建表；已有文档的哈希为空，不参与重复检测
+
+ALTER TABLE document ADD COLUMN content_hash VARCHAR(64) NULL COMMENT '文件内容 SHA-256' AFTER save_path;
+CREATE INDEX idx_document_vector_db_hash ON document (vector_db_id, content_hash);
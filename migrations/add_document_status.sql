@@ -0,0 +1,5 @@
+-- 文档入库状态：文档记录在分块开始前创建（ingesting），全部分块写入后标记为 ready
+-- 文档列表、检索结果和新版本查找只使用 ready 的文档；已有文档默认为 ready
+
+ALTER TABLE document ADD COLUMN status VARCHAR(16) NOT NULL DEFAULT 'ready' COMMENT 'ingesting, ready' AFTER content_hash;
+CREATE INDEX idx_document_status ON document (status);
@@ -0,0 +1,5 @@
+-- 文档更新时间：入库期间定期续约，启动时只清理超过 INGESTION_LEASE_SECONDS 未续约的 ingesting 文档
+-- 已有文档的更新时间取上传时间
+
+ALTER TABLE document ADD COLUMN update_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP AFTER upload_at;
+UPDATE document SET update_at = upload_at;
@@ -0,0 +1,5 @@
+-- 入库任务租约：记录执行进程和最近续约时间
+-- 启动恢复和手动重试只接管租约已过期（执行进程已退出）的 running 任务
+
+ALTER TABLE ingestion_job ADD COLUMN owner VARCHAR(64) NULL COMMENT '执行该任务的进程' AFTER attempts;
+ALTER TABLE ingestion_job ADD COLUMN heartbeat_at DATETIME NULL COMMENT '执行进程最近一次续约时间' AFTER owner;
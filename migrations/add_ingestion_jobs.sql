@@ -0,0 +1,51 @@
+-- 文档入库后台任务表及相关路由
+-- /vector/upload 改为提交后台任务，以下路由用于查询进度、取消和重试
+-- 如果使用 db.create_all()，表会自动创建，只需执行路由部分
+
+CREATE TABLE IF NOT EXISTS ingestion_job (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    vector_db_id INT NOT NULL,
+    document_id INT NULL,
+    file_name VARCHAR(255) NOT NULL COMMENT '原始文件名',
+    save_name VARCHAR(255) NOT NULL COMMENT '唯一文件名',
+    save_path TEXT NULL COMMENT '待处理文件路径，完成后清空',
+    `describe` VARCHAR(255) NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' COMMENT 'pending, running, completed, failed, cancelled',
+    progress FLOAT NOT NULL DEFAULT 0,
+    stage VARCHAR(32) NULL,
+    error TEXT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    create_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    update_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_ingestion_job_user_id (user_id),
+    INDEX idx_ingestion_job_vector_db_id (vector_db_id),
+    INDEX idx_ingestion_job_status (status),
+    FOREIGN KEY (user_id) REFERENCES user(id),
+    FOREIGN KEY (vector_db_id) REFERENCES vector_db(id),
+    FOREIGN KEY (document_id) REFERENCES document(id) ON DELETE SET NULL
+);
+
+-- 1. 插入路由（如果不存在）
+INSERT INTO routes (path, name, component, method, created_at, updated_at)
+SELECT t.path, t.name, 'VectorDbDetail', t.method, NOW(), NOW()
+FROM (
+    SELECT '/vector/jobs' AS path, '获取入库任务列表' AS name, 'GET' AS method
+    UNION ALL SELECT '/vector/jobs/<int:job_id>', '获取入库任务进度', 'GET'
+    UNION ALL SELECT '/vector/jobs/<int:job_id>/cancel', '取消入库任务', 'POST'
+    UNION ALL SELECT '/vector/jobs/<int:job_id>/retry', '重试入库任务', 'POST'
+) t
+WHERE NOT EXISTS (
+    SELECT 1 FROM routes r WHERE r.path = t.path AND r.method = t.method
+);
+
+-- 2. 为 admin 和 user 角色添加权限（已存在则忽略）
+INSERT INTO role_routes (role_id, route_id, created_at)
+SELECT ro.id, rt.id, NOW()
+FROM roles ro
+JOIN routes rt ON rt.path LIKE '/vector/jobs%'
+WHERE ro.name IN ('admin', 'user')
+AND NOT EXISTS (
+    SELECT 1 FROM role_routes rr
+    WHERE rr.role_id = ro.id AND rr.route_id = rt.id
+);
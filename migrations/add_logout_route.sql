@@ -0,0 +1,22 @@
+-- 退出登录：新增 /user/logout 路由（注销当前令牌）
+
+-- 1. 插入路由（如果不存在）
+INSERT INTO routes (path, name, component, method, created_at, updated_at)
+SELECT '/user/logout', '退出登录', 'User', 'POST', NOW(), NOW()
+WHERE NOT EXISTS (
+    SELECT 1 FROM routes WHERE path = '/user/logout' AND method = 'POST'
+);
+
+-- 2. 获取路由ID
+SET @route_id = (SELECT id FROM routes WHERE path = '/user/logout' AND method = 'POST' LIMIT 1);
+
+-- 3. 与 /user/info 拥有相同权限的角色同样获得该路由权限
+INSERT INTO role_routes (role_id, route_id, created_at)
+SELECT rr.role_id, @route_id, NOW()
+FROM role_routes rr
+JOIN routes r ON r.id = rr.route_id
+WHERE r.path = '/user/info' AND r.method = 'GET'
+AND NOT EXISTS (
+    SELECT 1 FROM role_routes x
+    WHERE x.role_id = rr.role_id AND x.route_id = @route_id
+);